@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Async Batch Tracker for BuryatMyasoprom
+Asyncio front-end for BatchTracker used by the gateway service
+"""
+
+import asyncio
+import json
+from concurrent.futures import Executor, ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+from typing import AsyncIterator, Dict, List, Optional, Sequence
+import logging
+
+from batch_tracker import (
+    EVENT_FIELDS,
+    EVENT_PAGE_SIZE,
+    SCAN_RECENT_EVENTS,
+    BatchTracker,
+    BufferedEventWriter,
+    generate_batch_qr_code,
+)
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+class AsyncBatchTracker:
+    """Coroutine API over BatchTracker
+
+    All writes run on one dedicated thread, so in-process writers never
+    contend for the SQLite write lock ("database is locked"); a
+    BufferedEventWriter passed as event_writer batches on its own thread but
+    commits on that writer thread too. Reads run on a
+    small thread pool and stay concurrent thanks to WAL mode. QR rendering
+    goes to its own executor, which may be a ProcessPoolExecutor since the
+    renderer is a module-level function. Cache hits are answered on the
+    event loop without a thread hop.
+    """
+
+    def __init__(self, tracker: BatchTracker, reader_threads: int = 4,
+                 qr_executor: Optional[Executor] = None,
+                 event_writer: Optional[BufferedEventWriter] = None):
+        self.tracker = tracker
+        self.event_writer = event_writer
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="batch-db-writer")
+        if event_writer is not None and event_writer.commit_executor is None:
+            event_writer.commit_executor = self._writer
+        self._readers = ThreadPoolExecutor(max_workers=reader_threads, thread_name_prefix="batch-db-reader")
+        self._owns_qr_executor = qr_executor is None
+        self._qr_executor = qr_executor or ThreadPoolExecutor(max_workers=2, thread_name_prefix="batch-qr")
+
+    async def _write(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._writer, partial(func, *args, **kwargs))
+
+    async def _read(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._readers, partial(func, *args, **kwargs))
+
+    # Writes
+
+    async def create_batch(self, batch_data: Dict) -> Dict:
+        """Create a batch on the writer thread, then render its QR code off-thread"""
+        result = await self._write(self.tracker.create_batch, batch_data, generate_qr=False)
+        if not result.get("success"):
+            return result
+
+        loop = asyncio.get_running_loop()
+        try:
+            result["qr_code_path"] = await loop.run_in_executor(
+                self._qr_executor, generate_batch_qr_code, result["batch_id"], batch_data
+            )
+        except Exception as e:
+            # The batch is committed; report the missing image rather than failing the create
+            logger.error(f"QR code generation failed for batch {result['batch_id']}: {str(e)}")
+            result["qr_code_path"] = None
+            result["qr_code_error"] = str(e)
+
+        return result
+
+    async def reserve_batch_ids(self, batch_data_list: List[Dict]) -> Dict:
+        return await self._write(self.tracker.reserve_batch_ids, batch_data_list)
+
+    async def record_batch_event(self, batch_id: str, event_data: Dict) -> Dict:
+        """Record an event; goes through the group-commit writer when one is configured"""
+        if self.event_writer is not None:
+            return await asyncio.wrap_future(self.event_writer.submit(batch_id, event_data))
+        return await self._write(self.tracker.record_batch_event, batch_id, event_data)
+
+    async def link_batches(self, parent_batch_ids: List[str], child_batch_id: str,
+                           relation_type: str, quantity_kg: Optional[float] = None) -> Dict:
+        return await self._write(
+            self.tracker.link_batches, parent_batch_ids, child_batch_id, relation_type, quantity_kg
+        )
+
+    async def archive_closed_batches(self, older_than_days: int = 90, vacuum: bool = False) -> Dict:
+        return await self._write(self.tracker.archive_closed_batches, older_than_days, vacuum)
+
+    # Reads
+
+    async def get_batch_info(self, batch_id: str, recent_events: Optional[int] = None) -> Dict:
+        cached = self.tracker._cached_batch_info(batch_id, recent_events)
+        if cached is not None:
+            return cached
+        return await self._read(self.tracker._load_batch_info, batch_id, recent_events)
+
+    async def scan_batch_qr(self, qr_data: str) -> Dict:
+        """Process QR code scan; repeat scans are served from the cache on the loop"""
+        try:
+            batch_id = json.loads(qr_data).get("batch_id")
+        except json.JSONDecodeError:
+            return {
+                "success": False,
+                "error": "Invalid QR code format"
+            }
+
+        if not batch_id:
+            return {
+                "success": False,
+                "error": "Invalid QR code data"
+            }
+
+        return await self.get_batch_info(batch_id, recent_events=SCAN_RECENT_EVENTS)
+
+    async def iter_batch_events(self, batch_id: str, after: Optional[int] = None,
+                                limit: Optional[int] = None,
+                                fields: Optional[Sequence[str]] = None,
+                                descending: bool = False) -> AsyncIterator[Dict]:
+        """Async keyset stream of batch events, one reader-pool round trip per page"""
+        requested = list(fields) if fields is not None else list(EVENT_FIELDS)
+        # event_id is the keyset cursor, so it is always fetched
+        page_fields = requested if "event_id" in requested else ["event_id", *requested]
+
+        remaining = limit
+        while remaining is None or remaining > 0:
+            page_size = EVENT_PAGE_SIZE if remaining is None else min(EVENT_PAGE_SIZE, remaining)
+            page = await self._read(
+                self._event_page, batch_id, after, page_size, page_fields, descending
+            )
+
+            for event in page:
+                after = event["event_id"]
+                if page_fields is not requested:
+                    del event["event_id"]
+                yield event
+
+            if len(page) < page_size:
+                break
+            if remaining is not None:
+                remaining -= len(page)
+
+    def _event_page(self, batch_id: str, after: Optional[int], limit: int,
+                    fields: Sequence[str], descending: bool) -> List[Dict]:
+        return list(self.tracker.iter_batch_events(
+            batch_id, after=after, limit=limit, fields=fields, descending=descending
+        ))
+
+    async def get_events_in_range(self, start: datetime, end: datetime,
+                                  location: Optional[str] = None,
+                                  include_archived: bool = False) -> Dict:
+        return await self._read(self.tracker.get_events_in_range, start, end, location, include_archived)
+
+    async def get_batch_timeline(self, batch_id: str) -> Dict:
+        return await self._read(self.tracker.get_batch_timeline, batch_id)
+
+    async def generate_batch_report(self, batch_id: str) -> Dict:
+        return await self._read(self.tracker.generate_batch_report, batch_id)
+
+    async def trace_batch_lineage(self, batch_id: str, direction: str = "downstream") -> Dict:
+        return await self._read(self.tracker.trace_batch_lineage, batch_id, direction)
+
+    async def trace_farm_lineage(self, origin_farm: str) -> Dict:
+        return await self._read(self.tracker.trace_farm_lineage, origin_farm)
+
+    async def get_fleet_quality_metrics(self) -> Dict:
+        return await self._read(self.tracker.get_fleet_quality_metrics)
+
+    async def get_fleet_status_counts(self) -> Dict:
+        return await self._read(self.tracker.get_fleet_status_counts)
+
+    async def get_fleet_inventory_by_location(self) -> Dict:
+        return await self._read(self.tracker.get_fleet_inventory_by_location)
+
+    async def get_fleet_stage_dwell(self, since_days: Optional[int] = None) -> Dict:
+        return await self._read(self.tracker.get_fleet_stage_dwell, since_days)
+
+    async def get_temperature_excursions(self, active_only: bool = True, limit: int = 100) -> Dict:
+        return await self._read(self.tracker.get_temperature_excursions, active_only, limit)
+
+    async def get_fleet_dashboard(self) -> Dict:
+        return await self._read(self.tracker.get_fleet_dashboard)
+
+    async def get_cache_stats(self) -> Dict:
+        return self.tracker.get_cache_stats()
+
+    async def get_fleet_cache_stats(self) -> Dict:
+        return self.tracker.get_fleet_cache_stats()
+
+    # Lifecycle
+
+    async def close(self):
+        """Drain pending writes, then stop the executors"""
+        loop = asyncio.get_running_loop()
+        if self.event_writer is not None:
+            await loop.run_in_executor(None, self.event_writer.close)
+        await loop.run_in_executor(None, self._writer.shutdown, True)
+        await loop.run_in_executor(None, self._readers.shutdown, True)
+        if self._owns_qr_executor:
+            await loop.run_in_executor(None, self._qr_executor.shutdown, True)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+# Example usage
+if __name__ == "__main__":
+    async def main():
+        async with AsyncBatchTracker(BatchTracker(cache_size=1024)) as tracker:
+            create_result = await tracker.create_batch({
+                "product_type": "BEEF",
+                "production_date": "2024-01-15",
+                "quantity_kg": 5000,
+                "origin_farm": "Buryat Farm 001",
+                "quality_grade": "A"
+            })
+            print(f"Create Result: {json.dumps(create_result, indent=2)}")
+
+            if create_result["success"]:
+                batch_id = create_result["batch_id"]
+                qr_data = json.dumps({"batch_id": batch_id})
+
+                # Many concurrent gate scans share the reader pool and the cache
+                scans = await asyncio.gather(*(tracker.scan_batch_qr(qr_data) for _ in range(100)))
+                print(f"Scans served: {sum(1 for s in scans if s['success'])}")
+                print(f"Cache Stats: {json.dumps(await tracker.get_cache_stats(), indent=2)}")
+
+    asyncio.run(main())
@@ -0,0 +1,442 @@
+#!/usr/bin/env python3
+"""
+Batch Exporter for BuryatMyasoprom
+Streams batch tracking data into partitioned CSV/Parquet files for analytics
+"""
+
+import csv
+import gzip
+import json
+import os
+import sqlite3
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import logging
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet output is optional; CSV needs only the stdlib
+    pa = None
+    pq = None
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = ("csv", "parquet")
+
+BATCH_COLUMNS = [
+    "batch_id", "product_type", "production_date", "initial_quantity_kg",
+    "current_quantity_kg", "origin_farm", "quality_grade", "status",
+    "created_at", "updated_at", "created_ts", "updated_ts", "current_location"
+]
+
+EVENT_COLUMNS = [
+    "event_id", "batch_id", "event_type", "location", "timestamp",
+    "temperature", "quality_metrics", "responsible_party", "ts"
+]
+
+# Column types for Parquet output; CSV carries them as text
+COLUMN_TYPES = {
+    "initial_quantity_kg": "float64",
+    "current_quantity_kg": "float64",
+    "created_ts": "int64",
+    "updated_ts": "int64",
+    "event_id": "int64",
+    "temperature": "float64",
+    "ts": "int64",
+}
+
+WATERMARK_FILE = "export_watermark.json"
+
+class _CsvPartWriter:
+    """One gzip-compressed CSV part file, written under a temporary name until published"""
+
+    def __init__(self, path: Path, columns: List[str], compresslevel: int):
+        self.path = path
+        self._tmp_path = path.with_name(path.name + ".inprogress")
+        self._file = gzip.open(self._tmp_path, "wt", newline="", encoding="utf-8",
+                               compresslevel=compresslevel)
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(columns)
+        self.rows = 0
+
+    def write_rows(self, rows: List[Tuple]):
+        self._writer.writerows(rows)
+        self.rows += len(rows)
+
+    def close(self):
+        self._file.close()
+
+    def publish(self):
+        os.replace(self._tmp_path, self.path)
+
+    def discard(self):
+        self._file.close()
+        self._tmp_path.unlink(missing_ok=True)
+
+class _ParquetPartWriter:
+    """One Parquet part file; rows are buffered up to a row group, then flushed"""
+
+    def __init__(self, path: Path, columns: List[str], row_group_size: int):
+        self.path = path
+        self._tmp_path = path.with_name(path.name + ".inprogress")
+        self._schema = pa.schema([
+            (column, getattr(pa, COLUMN_TYPES.get(column, "string"))())
+            for column in columns
+        ])
+        self._writer = pq.ParquetWriter(str(self._tmp_path), self._schema, compression="snappy")
+        self._row_group_size = row_group_size
+        self._buffer = []
+        self.rows = 0
+
+    def write_rows(self, rows: List[Tuple]):
+        self._buffer.extend(rows)
+        self.rows += len(rows)
+        if len(self._buffer) >= self._row_group_size:
+            self._flush()
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        columns = list(zip(*self._buffer))
+        table = pa.Table.from_arrays(
+            [pa.array(values, type=field.type) for values, field in zip(columns, self._schema)],
+            schema=self._schema
+        )
+        self._writer.write_table(table)
+        self._buffer = []
+
+    def close(self):
+        self._flush()
+        self._writer.close()
+        self._writer = None
+
+    def publish(self):
+        os.replace(self._tmp_path, self.path)
+
+    def discard(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        self._tmp_path.unlink(missing_ok=True)
+
+class _PartitionedOutput:
+    """Routes rows to per-partition part files, keeping a bounded number open
+
+    A partition whose writer was closed to stay under ``max_open_files`` gets
+    a new part file if more of its rows arrive later. Closed parts keep their
+    temporary names until publish(), so a failed run never leaves partial
+    output where readers look; abort() removes them instead.
+    """
+
+    def __init__(self, table_dir: Path, columns: List[str], export_format: str,
+                 run_id: str, rows_per_file: int, max_open_files: int,
+                 compresslevel: int, row_group_size: int):
+        self.table_dir = table_dir
+        self.columns = columns
+        self.export_format = export_format
+        self.run_id = run_id
+        self.rows_per_file = rows_per_file
+        self.max_open_files = max_open_files
+        self.compresslevel = compresslevel
+        self.row_group_size = row_group_size
+        self._open = OrderedDict()
+        self._part_numbers = {}
+        self._closed = []
+        self.files = []
+
+    def write(self, partition: Optional[str], rows: List[Tuple]):
+        while rows:
+            writer = self._writer_for(partition)
+            room = self.rows_per_file - writer.rows
+            writer.write_rows(rows[:room])
+            rows = rows[room:]
+            if writer.rows >= self.rows_per_file:
+                self._close(partition)
+
+    def _writer_for(self, partition: Optional[str]):
+        writer = self._open.get(partition)
+        if writer is not None:
+            self._open.move_to_end(partition)
+            return writer
+
+        while len(self._open) >= self.max_open_files:
+            self._close(next(iter(self._open)))
+
+        part_dir = self.table_dir / partition if partition else self.table_dir
+        part_dir.mkdir(parents=True, exist_ok=True)
+        part_number = self._part_numbers.get(partition, 0)
+        self._part_numbers[partition] = part_number + 1
+
+        if self.export_format == "parquet":
+            path = part_dir / f"part-{self.run_id}-{part_number:05d}.parquet"
+            writer = _ParquetPartWriter(path, self.columns, self.row_group_size)
+        else:
+            path = part_dir / f"part-{self.run_id}-{part_number:05d}.csv.gz"
+            writer = _CsvPartWriter(path, self.columns, self.compresslevel)
+
+        self._open[partition] = writer
+        return writer
+
+    def _close(self, partition: Optional[str]):
+        writer = self._open.pop(partition)
+        writer.close()
+        self._closed.append(writer)
+
+    def close(self):
+        for partition in list(self._open):
+            self._close(partition)
+
+    def publish(self):
+        """Rename every closed part into place"""
+        for writer in self._closed:
+            writer.publish()
+            self.files.append({"path": str(writer.path), "rows": writer.rows})
+        self._closed = []
+
+    def abort(self):
+        """Close and delete every part not yet published"""
+        for writer in list(self._open.values()) + self._closed:
+            try:
+                writer.discard()
+            except Exception as e:
+                logger.warning(f"Could not remove partial export {writer.path}: {str(e)}")
+        self._open.clear()
+        self._closed = []
+
+class BatchExporter:
+    def __init__(self, db_path: str = "data/batch_tracking.db", export_dir: str = "exports",
+                 archive_dir: Optional[str] = None, export_format: str = "csv",
+                 chunk_size: int = 50000, rows_per_file: int = 1000000,
+                 max_open_files: int = 16, compresslevel: int = 5):
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown export format {export_format}; expected one of {EXPORT_FORMATS}")
+        if export_format == "parquet" and pa is None:
+            raise ImportError("Parquet export requires pyarrow (pip install pyarrow)")
+
+        self.db_path = db_path
+        self.export_dir = Path(export_dir)
+        self.archive_dir = Path(archive_dir) if archive_dir else Path(db_path).parent / "archive"
+        self.export_format = export_format
+        self.chunk_size = chunk_size
+        self.rows_per_file = rows_per_file
+        self.max_open_files = max_open_files
+        self.compresslevel = compresslevel
+        self.watermark_path = self.export_dir / WATERMARK_FILE
+
+    def _connect(self) -> sqlite3.Connection:
+        """Read-only connection; a reader never blocks the tracker's writer in WAL mode"""
+        return sqlite3.connect(f"file:{Path(self.db_path).resolve()}?mode=ro", uri=True)
+
+    def load_watermark(self) -> Dict:
+        """Last exported position, or an empty watermark before the first export"""
+        if not self.watermark_path.exists():
+            return {"batch_events": {"event_id": 0}, "batches": {"updated_ts": 0}}
+
+        with open(self.watermark_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _save_watermark(self, watermark: Dict):
+        """Write the watermark atomically so a crash never leaves it half-written"""
+        self.export_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.watermark_path.with_name(f"{WATERMARK_FILE}.{uuid.uuid4().hex}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(watermark, f, indent=2)
+        os.replace(tmp_path, self.watermark_path)
+
+    def export(self, incremental: bool = True, include_archived: bool = False) -> Dict:
+        """Export batches and batch events, only rows newer than the watermark if incremental
+
+        The high-water marks (MAX(event_id), MAX(updated_ts)) and both table
+        scans run in one read transaction, so they see a single WAL snapshot.
+        Events are read in event_id keyset chunks and written to
+        ``batch_events/event_month=YYYY-MM/`` partitions. Batches changed
+        since the last run go to ``batches/``; BatchTracker stamps updated_ts
+        in commit order, so nothing committed after the snapshot falls below
+        the next watermark.
+        Memory is bounded by chunk_size and max_open_files regardless of
+        table size. Part files are renamed into place only once both tables
+        are fully written, and the watermark only advances after that; a
+        failed run removes its partial files. run_id carries a random suffix
+        so concurrent runs never write the same file names.
+        """
+        start_time = datetime.now()
+        run_id = f"{start_time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        watermark = self.load_watermark() if incremental else {
+            "batch_events": {"event_id": 0}, "batches": {"updated_ts": 0}
+        }
+
+        conn = self._connect()
+        outputs = []
+
+        try:
+            cursor = conn.cursor()
+            cursor.execute('BEGIN')
+            high_event_id = cursor.execute('SELECT COALESCE(MAX(event_id), 0) FROM batch_events').fetchone()[0]
+            high_updated_ts = max(
+                cursor.execute('SELECT COALESCE(MAX(updated_ts), 0) FROM batches').fetchone()[0],
+                watermark["batches"]["updated_ts"]
+            )
+
+            event_output = self._output("batch_events", EVENT_COLUMNS, run_id)
+            outputs.append(event_output)
+            event_rows = self._export_events(
+                conn, event_output, "main", watermark["batch_events"]["event_id"], high_event_id
+            )
+
+            batch_output = self._output("batches", BATCH_COLUMNS, run_id)
+            outputs.append(batch_output)
+            batch_rows = self._export_batches(
+                conn, batch_output, watermark["batches"]["updated_ts"], high_updated_ts
+            )
+            conn.commit()
+
+            if include_archived and not incremental:
+                # Archived events predate any hot-DB watermark, so only full exports read
+                # them; ATTACH cannot run inside the snapshot transaction
+                event_rows += self._export_archived_events(conn, event_output)
+
+            event_output.close()
+            batch_output.close()
+
+            for output in outputs:
+                output.publish()
+
+        except Exception as e:
+            logger.error(f"Batch export failed: {str(e)}")
+            for output in outputs:
+                output.abort()
+            return {
+                "success": False,
+                "error": f"Export failed: {str(e)}"
+            }
+        finally:
+            conn.close()
+
+        new_watermark = {
+            "batch_events": {"event_id": high_event_id},
+            "batches": {"updated_ts": high_updated_ts},
+            "exported_at": datetime.now().isoformat()
+        }
+        self._save_watermark(new_watermark)
+
+        duration = (datetime.now() - start_time).total_seconds()
+        logger.info(f"Exported {event_rows} events and {batch_rows} batches in {duration:.1f}s")
+
+        return {
+            "success": True,
+            "format": self.export_format,
+            "incremental": incremental,
+            "event_rows": event_rows,
+            "batch_rows": batch_rows,
+            "files": event_output.files + batch_output.files,
+            "watermark": new_watermark,
+            "duration_seconds": round(duration, 2)
+        }
+
+    def _output(self, table: str, columns: List[str], run_id: str) -> _PartitionedOutput:
+        return _PartitionedOutput(
+            self.export_dir / table, columns, self.export_format, run_id,
+            self.rows_per_file, self.max_open_files, self.compresslevel, self.chunk_size
+        )
+
+    def _export_events(self, conn: sqlite3.Connection, output: _PartitionedOutput,
+                       schema: str, after_event_id: int, high_event_id: int) -> int:
+        """Stream events with after_event_id < event_id <= high_event_id in keyset chunks"""
+        cursor = conn.cursor()
+        column_list = ", ".join(EVENT_COLUMNS)
+        exported = 0
+
+        while True:
+            cursor.execute(f'''
+                SELECT {column_list} FROM {schema}.batch_events
+                WHERE event_id > ? AND event_id <= ?
+                ORDER BY event_id
+                LIMIT ?
+            ''', (after_event_id, high_event_id, self.chunk_size))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+
+            # Partition by month of the ISO timestamp text; no per-row datetime parsing.
+            # Events arrive in roughly time order, so most chunks hold a single month
+            first_month, last_month = rows[0][4][:7], rows[-1][4][:7]
+            if first_month == last_month:
+                output.write(f"event_month={first_month}", rows)
+            else:
+                partitions = {}
+                for row in rows:
+                    partitions.setdefault(row[4][:7], []).append(row)
+                for month, month_rows in partitions.items():
+                    output.write(f"event_month={month}", month_rows)
+
+            exported += len(rows)
+            after_event_id = rows[-1][0]
+            logger.info(f"Exported {exported} events from {schema} (event_id {after_event_id})")
+
+        return exported
+
+    def _export_archived_events(self, conn: sqlite3.Connection, output: _PartitionedOutput) -> int:
+        """Export events held in monthly archive databases"""
+        cursor = conn.cursor()
+        archive_files = [row[0] for row in cursor.execute(
+            'SELECT DISTINCT archive_file FROM batch_archive ORDER BY archive_file'
+        )]
+
+        exported = 0
+        for archive_file in archive_files:
+            archive_path = self.archive_dir / archive_file
+            if not archive_path.exists():
+                raise FileNotFoundError(f"Batch event archive {archive_path} is missing")
+
+            alias = Path(archive_file).stem.replace("batch_events_", "archive_")
+            conn.execute(f'ATTACH DATABASE ? AS {alias}', (f"file:{archive_path.resolve()}?mode=ro",))
+            try:
+                high_event_id = cursor.execute(
+                    f'SELECT COALESCE(MAX(event_id), 0) FROM {alias}.batch_events'
+                ).fetchone()[0]
+                exported += self._export_events(conn, output, alias, 0, high_event_id)
+            finally:
+                conn.execute(f'DETACH DATABASE {alias}')
+
+        return exported
+
+    def _export_batches(self, conn: sqlite3.Connection, output: _PartitionedOutput,
+                        since_ts: int, until_ts: int) -> int:
+        """Stream batches with since_ts < updated_ts <= until_ts in keyset chunks
+
+        Served in order by idx_batches_updated_ts, so each chunk is a range scan.
+        """
+        cursor = conn.cursor()
+        column_list = ", ".join(BATCH_COLUMNS)
+        last_key = (since_ts, "")
+        exported = 0
+
+        while True:
+            cursor.execute(f'''
+                SELECT {column_list} FROM batches
+                WHERE (updated_ts, batch_id) > (?, ?) AND updated_ts > ? AND updated_ts <= ?
+                ORDER BY updated_ts, batch_id
+                LIMIT ?
+            ''', (*last_key, since_ts, until_ts, self.chunk_size))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+
+            output.write(None, rows)
+            exported += len(rows)
+            last_key = (rows[-1][11], rows[-1][0])
+
+        return exported
+
+# Example usage
+if __name__ == "__main__":
+    exporter = BatchExporter()
+
+    # First run exports everything; later runs pick up only new events and changed batches
+    export_result = exporter.export(incremental=True)
+    print(f"Export Result: {json.dumps({k: v for k, v in export_result.items() if k != 'files'}, indent=2)}")
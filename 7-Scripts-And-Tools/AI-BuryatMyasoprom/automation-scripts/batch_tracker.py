@@ -4,16 +4,22 @@ Batch Tracker for BuryatMyasoprom
 Tracks meat batches from farm to Chinese retail with QR code integration
 """
 
+import copy
 import json
 import pandas as pd
+import numpy as np
 import qrcode
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
 import logging
 from dataclasses import dataclass
-import hashlib
 import sqlite3
 from pathlib import Path
+import atexit
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import CancelledError, Executor, Future, InvalidStateError
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -28,9 +34,332 @@ class BatchEvent:
     quality_metrics: Optional[Dict] = None
     responsible_party: Optional[str] = None
 
+# Schema version stored in PRAGMA user_version; bump when adding a migration step
+SCHEMA_VERSION = 8
+
+# Rows rewritten per transaction when backfilling existing databases
+MIGRATION_BATCH_SIZE = 5000
+
+# Rows fetched per keyset page when streaming batch events
+EVENT_PAGE_SIZE = 500
+
+# Newest events returned by a QR scan; BatchCache keeps this many per entry,
+# so repeat scans of long histories never touch the database
+SCAN_RECENT_EVENTS = 200
+
+# Fields selectable through iter_batch_events, mapped to their batch_events columns
+EVENT_FIELDS = {
+    "event_id": "event_id",
+    "event_type": "event_type",
+    "location": "location",
+    "timestamp": "timestamp",
+    "temperature": "temperature",
+    "quality_metrics": "quality_metrics",
+    "responsible_party": "responsible_party"
+}
+
+# Ways a batch can be derived from other batches
+LINEAGE_RELATIONS = ("SPLIT", "MERGE", "REPACK")
+
+# Batches in these statuses no longer receive events and may be archived
+CLOSED_STATUSES = ("DELIVERED", "CONSUMED")
+
+# Batches moved per archive transaction
+ARCHIVE_CHUNK_SIZE = 500
+
+# Column list shared by the hot batch_events table and monthly archives
+ARCHIVE_EVENT_COLUMNS = (
+    "event_id, batch_id, event_type, location, timestamp, "
+    "temperature, quality_metrics, responsible_party, ts"
+)
+
+# Batch status set by each lifecycle event type
+STATUS_MAP = {
+    "PRODUCTION": "PRODUCTION",
+    "QUALITY_CHECK": "QUALITY_CONTROL",
+    "PROCESSING": "PROCESSING",
+    "PACKAGING": "PACKAGED",
+    "STORAGE": "IN_STORAGE",
+    "SHIPMENT": "IN_TRANSIT",
+    "CUSTOMS": "CUSTOMS_CLEARANCE",
+    "DELIVERY": "DELIVERED",
+    "CONSUMPTION": "CONSUMED"
+}
+
+# Event types that may carry a quantity_change_kg
+QUANTITY_EVENT_TYPES = ("TRANSFER", "PROCESSING", "SHIPMENT")
+
+# Safe frozen-storage range in °C; readings outside it are temperature excursions
+TEMPERATURE_RANGE_C = (-20, -15)
+
+# Fleet aggregate cache keys, invalidated individually by the write paths
+FLEET_STATUS_COUNTS = "status_counts"
+FLEET_LOCATION_INVENTORY = "location_inventory"
+FLEET_STAGE_DWELL = "stage_dwell"
+FLEET_TEMPERATURE_EXCURSIONS = "temperature_excursions"
+
+def _epoch_ms(dt: datetime) -> int:
+    """Convert datetime to integer epoch milliseconds"""
+    return int(dt.timestamp() * 1000)
+
+def _is_temperature_excursion(temperature: Optional[float]) -> bool:
+    """True if a reading falls outside TEMPERATURE_RANGE_C"""
+    low, high = TEMPERATURE_RANGE_C
+    return temperature is not None and not (low <= temperature <= high)
+
+def _copy_json(value):
+    """Copy decoded JSON-shaped data (dicts, lists, scalars) at every level
+    
+    Several times faster than copy.deepcopy, which matters on cache hits.
+    """
+    if isinstance(value, dict):
+        return {key: _copy_json(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_copy_json(item) for item in value]
+    return value
+
+def _copy_batch_info(batch_info: Dict) -> Dict:
+    """Copy a get_batch_info result so callers cannot mutate a cached entry
+    
+    Nested values such as an event's quality_metrics are copied too.
+    """
+    return {
+        **batch_info,
+        "batch": dict(batch_info["batch"]),
+        "events": _copy_json(batch_info["events"])
+    }
+
+def generate_batch_qr_code(batch_id: str, batch_data: Dict) -> str:
+    """Render a batch QR code image and return its path
+    
+    Module-level so it can be shipped to a process pool.
+    """
+    qr_data = {
+        "batch_id": batch_id,
+        "product_type": batch_data["product_type"],
+        "production_date": batch_data["production_date"],
+        "origin_farm": batch_data["origin_farm"],
+        "tracking_url": f"https://track.buryatmyasoprom.com/batches/{batch_id}"
+    }
+    
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        box_size=10,
+        border=4,
+    )
+    qr.add_data(json.dumps(qr_data))
+    qr.make(fit=True)
+    
+    # Save QR code image
+    qr_img = qr.make_image(fill_color="black", back_color="white")
+    qr_path = f"qrcodes/{batch_id}.png"
+    Path("qrcodes").mkdir(exist_ok=True)
+    qr_img.save(qr_path)
+    
+    return qr_path
+
+class BatchCache:
+    """Bounded in-process LRU cache of get_batch_info results
+    
+    Entries are keyed by (batch_id, recent_events) and dropped per batch by
+    the tracker's write paths. A token taken before the DB read keeps a read
+    that raced with a write from re-populating stale data; the record of
+    invalidations behind it is bounded like the entries.
+    Writes from other processes are not seen, so only enable the cache where
+    this tracker is the single writer.
+    
+    A result with more than max_events_per_entry events is kept as a head:
+    the batch row, its newest max_events_per_entry events and the total
+    count. The head answers recent_events requests that fit in it, and a
+    full read of a long history only fetches the events older than the head.
+    """
+    
+    HEAD = "head"
+    
+    def __init__(self, max_entries: int = 1024, max_events_per_entry: int = SCAN_RECENT_EVENTS):
+        self.max_entries = max_entries
+        self.max_events_per_entry = max_events_per_entry
+        self._entries = OrderedDict()
+        self._keys_by_batch = {}
+        # Generation of each batch's latest invalidation, oldest first. Tokens
+        # older than _floor (the newest generation pruned from here) are rejected
+        self._invalidated = OrderedDict()
+        self._generation = 0
+        self._floor = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "head_hits": 0, "misses": 0, "invalidations": 0, "evictions": 0}
+    
+    def get(self, batch_id: str, recent_events: Optional[int] = None) -> Optional[Dict]:
+        with self._lock:
+            key = (batch_id, recent_events)
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return entry
+            
+            head = self._entries.get((batch_id, self.HEAD))
+            if head is not None and recent_events is not None and recent_events <= len(head["events"]):
+                self._entries.move_to_end((batch_id, self.HEAD))
+                self._stats["hits"] += 1
+                events = head["events"][:recent_events]
+                return {
+                    "success": True,
+                    "batch": head["batch"],
+                    "events": events,
+                    "event_count": len(events),
+                    "total_event_count": head["total_event_count"],
+                    "events_truncated": head["total_event_count"] > len(events)
+                }
+            
+            self._stats["misses"] += 1
+            return None
+    
+    def head(self, batch_id: str) -> Optional[Dict]:
+        """Cached newest events of a history too long to cache whole"""
+        with self._lock:
+            head = self._entries.get((batch_id, self.HEAD))
+            if head is not None:
+                self._entries.move_to_end((batch_id, self.HEAD))
+                self._stats["head_hits"] += 1
+            return head
+    
+    def version(self, batch_id: str) -> int:
+        """Token to pass to put() for a read starting now"""
+        with self._lock:
+            return self._generation
+    
+    def put(self, key: Tuple, value: Dict, version: int):
+        """Store value unless the batch was written since ``version`` was taken"""
+        batch_id = key[0]
+        if len(value["events"]) > self.max_events_per_entry:
+            key = (batch_id, self.HEAD)
+            value = {
+                "batch": value["batch"],
+                "events": value["events"][:self.max_events_per_entry],
+                "total_event_count": value.get("total_event_count", value["event_count"])
+            }
+        
+        with self._lock:
+            if version < self._floor or version < self._invalidated.get(batch_id, 0):
+                return
+            self._entries[key] = _copy_batch_info(value)
+            self._entries.move_to_end(key)
+            self._keys_by_batch.setdefault(batch_id, set()).add(key)
+            
+            while len(self._entries) > self.max_entries:
+                evicted_key, _ = self._entries.popitem(last=False)
+                batch_keys = self._keys_by_batch.get(evicted_key[0])
+                if batch_keys is not None:
+                    batch_keys.discard(evicted_key)
+                    if not batch_keys:
+                        del self._keys_by_batch[evicted_key[0]]
+                self._stats["evictions"] += 1
+    
+    def invalidate(self, batch_id: str):
+        with self._lock:
+            self._generation += 1
+            self._invalidated[batch_id] = self._generation
+            self._invalidated.move_to_end(batch_id)
+            while len(self._invalidated) > self.max_entries:
+                _, generation = self._invalidated.popitem(last=False)
+                self._floor = max(self._floor, generation)
+            for key in self._keys_by_batch.pop(batch_id, ()):
+                self._entries.pop(key, None)
+            self._stats["invalidations"] += 1
+    
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._floor = self._generation
+            self._invalidated.clear()
+            self._entries.clear()
+            self._keys_by_batch.clear()
+    
+    def get_stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["tracked_invalidations"] = len(self._invalidated)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        return stats
+
+class FleetAggregateCache:
+    """Short-TTL cache of fleet-wide aggregate results
+    
+    Entries are keyed by (name, params) and expire after ``ttl_seconds``.
+    Write paths drop only the aggregate names they affect, and a per-name
+    generation taken before the query keeps a racing read from caching a
+    result that is already stale. Writes from other processes are bounded
+    by the TTL alone.
+    """
+    
+    def __init__(self, ttl_seconds: float = 5.0):
+        self.ttl_seconds = ttl_seconds
+        self._entries = {}
+        self._generations = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "expirations": 0, "invalidations": 0}
+    
+    def get(self, name: str, params: Tuple) -> Optional[Dict]:
+        with self._lock:
+            entry = self._entries.get((name, params))
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            expires_at, value = entry
+            if time.monotonic() >= expires_at:
+                del self._entries[(name, params)]
+                self._stats["expirations"] += 1
+                self._stats["misses"] += 1
+                return None
+            self._stats["hits"] += 1
+            return copy.deepcopy(value)
+    
+    def generation(self, name: str) -> int:
+        with self._lock:
+            return self._generations.get(name, 0)
+    
+    def put(self, name: str, params: Tuple, value: Dict, generation: int):
+        """Store value unless ``name`` was invalidated since ``generation`` was taken"""
+        with self._lock:
+            if self._generations.get(name, 0) != generation:
+                return
+            self._entries[(name, params)] = (time.monotonic() + self.ttl_seconds, copy.deepcopy(value))
+    
+    def invalidate(self, *names: str):
+        with self._lock:
+            for name in names:
+                self._generations[name] = self._generations.get(name, 0) + 1
+                for key in [key for key in self._entries if key[0] == name]:
+                    del self._entries[key]
+                self._stats["invalidations"] += 1
+    
+    def clear(self):
+        with self._lock:
+            for name, _ in self._entries:
+                self._generations[name] = self._generations.get(name, 0) + 1
+            self._entries.clear()
+    
+    def get_stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        return stats
+
 class BatchTracker:
-    def __init__(self, db_path: str = "data/batch_tracking.db"):
+    def __init__(self, db_path: str = "data/batch_tracking.db", archive_dir: Optional[str] = None,
+                 cache_size: int = 0, fleet_cache_ttl: float = 5.0):
         self.db_path = db_path
+        self.archive_dir = archive_dir or str(Path(db_path).parent / "archive")
+        # Read-through cache for repeat lookups and QR scans; 0 disables it
+        self.cache = BatchCache(cache_size) if cache_size > 0 else None
+        # Short-TTL cache for dashboard aggregates; 0 disables it
+        self.fleet_cache = FleetAggregateCache(fleet_cache_ttl) if fleet_cache_ttl > 0 else None
         self._init_database()
         
     def _init_database(self):
@@ -40,6 +369,11 @@ class BatchTracker:
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         
+        # WAL lets readers run while a write transaction is open; it is persistent per file.
+        # Under WAL a commit spanning ATTACHed databases is atomic per file only, so the
+        # archive move and restore commit each file on its own, in a crash-safe order
+        cursor.execute('PRAGMA journal_mode=WAL')
+        
         # Create batches table
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS batches (
@@ -52,7 +386,10 @@ class BatchTracker:
                 quality_grade TEXT,
                 status TEXT DEFAULT 'PRODUCTION',
                 created_at TEXT NOT NULL,
-                updated_at TEXT NOT NULL
+                updated_at TEXT NOT NULL,
+                created_ts INTEGER,
+                updated_ts INTEGER,
+                current_location TEXT
             )
         ''')
         
@@ -67,39 +404,257 @@ class BatchTracker:
                 temperature REAL,
                 quality_metrics TEXT,
                 responsible_party TEXT,
+                ts INTEGER,
                 FOREIGN KEY (batch_id) REFERENCES batches (batch_id)
             )
         ''')
         
-        # Create indexes
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_batch_events_batch_id ON batch_events(batch_id)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_batch_events_timestamp ON batch_events(timestamp)')
+        # Create batch_id_sequences table (last allocated batch number per creation day)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS batch_id_sequences (
+                day TEXT PRIMARY KEY,
+                last_value INTEGER NOT NULL
+            ) WITHOUT ROWID
+        ''')
+        
+        # Create batch_lineage table (parent -> child edges for splits, merges, repacks)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS batch_lineage (
+                parent_batch_id TEXT NOT NULL,
+                child_batch_id TEXT NOT NULL,
+                relation_type TEXT NOT NULL,
+                quantity_kg REAL,
+                created_at TEXT NOT NULL,
+                created_ts INTEGER NOT NULL,
+                PRIMARY KEY (parent_batch_id, child_batch_id),
+                FOREIGN KEY (parent_batch_id) REFERENCES batches (batch_id),
+                FOREIGN KEY (child_batch_id) REFERENCES batches (batch_id)
+            ) WITHOUT ROWID
+        ''')
+        
+        # Create event_metrics table (one row per quality_metrics key, filled at write time)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS event_metrics (
+                event_id INTEGER NOT NULL,
+                batch_id TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value,
+                PRIMARY KEY (event_id, key),
+                FOREIGN KEY (event_id) REFERENCES batch_events (event_id)
+            ) WITHOUT ROWID
+        ''')
+        
+        # Create batch_archive table (hot-DB summary of batches moved to monthly archives)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS batch_archive (
+                batch_id TEXT PRIMARY KEY,
+                archive_file TEXT NOT NULL,
+                event_count INTEGER NOT NULL,
+                first_ts INTEGER,
+                last_ts INTEGER,
+                min_temperature REAL,
+                max_temperature REAL,
+                avg_temperature REAL,
+                archived_at TEXT NOT NULL,
+                FOREIGN KEY (batch_id) REFERENCES batches (batch_id)
+            )
+        ''')
         
         conn.commit()
+        
+        self._migrate_schema(conn)
         conn.close()
         
         logger.info(f"Batch tracking database initialized: {self.db_path}")
 
-    def create_batch(self, batch_data: Dict) -> Dict:
-        """Create new batch with unique QR code"""
-        batch_id = self._generate_batch_id(batch_data)
+    def _migrate_schema(self, conn: sqlite3.Connection):
+        """Upgrade an existing database in place to SCHEMA_VERSION"""
+        cursor = conn.cursor()
+        version = cursor.execute('PRAGMA user_version').fetchone()[0]
+        if version >= SCHEMA_VERSION:
+            return
+        
+        if version < 2:
+            self._migrate_epoch_timestamps(conn)
+        if version < 3:
+            self._migrate_lineage_indexes(conn)
+        if version < 4:
+            self._migrate_archive_indexes(conn)
+        if version < 5:
+            self._migrate_event_metrics(conn)
+        if version < 6:
+            self._migrate_fleet_aggregates(conn)
+        if version < 7:
+            self._migrate_export_indexes(conn)
+        if version < 8:
+            self._migrate_timestamp_index(conn)
+        
+        cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        conn.commit()
+        logger.info(f"Batch tracking schema migrated from v{version} to v{SCHEMA_VERSION}")
+
+    def _migrate_epoch_timestamps(self, conn: sqlite3.Connection):
+        """v2: integer epoch-ms columns and composite (batch_id, ts) / (location, ts) indexes"""
+        cursor = conn.cursor()
+        
+        # Databases created before v2 lack the integer timestamp columns
+        for table, column in [("batches", "created_ts"), ("batches", "updated_ts"), ("batch_events", "ts")]:
+            columns = [row[1] for row in cursor.execute(f'PRAGMA table_info({table})')]
+            if column not in columns:
+                cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} INTEGER')
+        conn.commit()
+        
+        # Backfill in bounded transactions so large databases are not locked for long
+        while True:
+            rows = cursor.execute('''
+                SELECT event_id, timestamp FROM batch_events
+                WHERE ts IS NULL LIMIT ?
+            ''', (MIGRATION_BATCH_SIZE,)).fetchall()
+            if not rows:
+                break
+            cursor.executemany(
+                'UPDATE batch_events SET ts = ? WHERE event_id = ?',
+                [(_epoch_ms(datetime.fromisoformat(timestamp)), event_id) for event_id, timestamp in rows]
+            )
+            conn.commit()
+        
+        while True:
+            rows = cursor.execute('''
+                SELECT batch_id, created_at, updated_at FROM batches
+                WHERE created_ts IS NULL OR updated_ts IS NULL LIMIT ?
+            ''', (MIGRATION_BATCH_SIZE,)).fetchall()
+            if not rows:
+                break
+            cursor.executemany(
+                'UPDATE batches SET created_ts = ?, updated_ts = ? WHERE batch_id = ?',
+                [
+                    (_epoch_ms(datetime.fromisoformat(created_at)),
+                     _epoch_ms(datetime.fromisoformat(updated_at)),
+                     batch_id)
+                    for batch_id, created_at, updated_at in rows
+                ]
+            )
+            conn.commit()
+        
+        # Composite indexes serve per-batch ordered reads and time-range scans
+        # directly; the old single-column indexes are prefixes of these, and
+        # v8 adds (batch_id, timestamp) for queries that still sort by the ISO text
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_batch_events_batch_ts ON batch_events(batch_id, ts)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_batch_events_location_ts ON batch_events(location, ts)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_batch_events_ts ON batch_events(ts)')
+        cursor.execute('DROP INDEX IF EXISTS idx_batch_events_batch_id')
+        cursor.execute('DROP INDEX IF EXISTS idx_batch_events_timestamp')
+        conn.commit()
+
+    def _migrate_lineage_indexes(self, conn: sqlite3.Connection):
+        """v3: indexes for upstream lineage walks and farm-level recalls"""
+        cursor = conn.cursor()
+        # Downstream walks use the (parent_batch_id, child_batch_id) primary key
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_batch_lineage_child ON batch_lineage(child_batch_id, parent_batch_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_batches_origin_farm ON batches(origin_farm)')
+        conn.commit()
+
+    def _migrate_archive_indexes(self, conn: sqlite3.Connection):
+        """v4: index for finding archives that overlap a historical time range"""
+        cursor = conn.cursor()
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_batch_archive_last_ts ON batch_archive(last_ts, first_ts)')
+        conn.commit()
+
+    def _migrate_event_metrics(self, conn: sqlite3.Connection):
+        """v5: normalize existing quality_metrics JSON into event_metrics"""
+        cursor = conn.cursor()
+        max_event_id = cursor.execute('SELECT COALESCE(MAX(event_id), 0) FROM batch_events').fetchone()[0]
+        
+        for low in range(0, max_event_id, MIGRATION_BATCH_SIZE):
+            cursor.execute('''
+                INSERT OR IGNORE INTO event_metrics (event_id, batch_id, key, value)
+                SELECT e.event_id, e.batch_id, j.key, j.value
+                FROM batch_events e, json_each(e.quality_metrics) j
+                WHERE e.event_id > ? AND e.event_id <= ? AND e.quality_metrics IS NOT NULL
+            ''', (low, low + MIGRATION_BATCH_SIZE))
+            conn.commit()
+        
+        # (batch_id, key, value) covers per-batch aggregates, (key, value) fleet-wide ones
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_event_metrics_batch_key ON event_metrics(batch_id, key, value)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_event_metrics_key ON event_metrics(key, value)')
+        conn.commit()
+
+    def _migrate_fleet_aggregates(self, conn: sqlite3.Connection):
+        """v6: denormalized current_location and indexes for fleet GROUP BY queries"""
+        cursor = conn.cursor()
+        columns = [row[1] for row in cursor.execute('PRAGMA table_info(batches)')]
+        if "current_location" not in columns:
+            cursor.execute('ALTER TABLE batches ADD COLUMN current_location TEXT')
+            conn.commit()
+        
+        # Location of the latest event; archived batches fall back to their farm
+        max_rowid = cursor.execute('SELECT COALESCE(MAX(rowid), 0) FROM batches').fetchone()[0]
+        for low in range(0, max_rowid, MIGRATION_BATCH_SIZE):
+            cursor.execute('''
+                UPDATE batches
+                SET current_location = COALESCE(
+                    (SELECT e.location FROM batch_events e
+                     WHERE e.batch_id = batches.batch_id
+                     ORDER BY e.ts DESC, e.event_id DESC LIMIT 1),
+                    origin_farm
+                )
+                WHERE rowid > ? AND rowid <= ? AND current_location IS NULL
+            ''', (low, low + MIGRATION_BATCH_SIZE))
+            conn.commit()
+        
+        # Covering indexes: status counts and kg by location never touch the table
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_batches_status ON batches(status, current_quantity_kg)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_batches_location ON batches(current_location, status, current_quantity_kg)')
+        # Excursion queries become two range scans on temperature
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_batch_events_temperature ON batch_events(temperature, batch_id, ts)')
+        conn.commit()
+
+    def _migrate_export_indexes(self, conn: sqlite3.Connection):
+        """v7: keyset index for incremental exports of changed batches (see batch_exporter)"""
+        cursor = conn.cursor()
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_batches_updated_ts ON batches(updated_ts, batch_id)')
+        conn.commit()
+
+    def _migrate_timestamp_index(self, conn: sqlite3.Connection):
+        """v8: per-batch index on the ISO timestamp, replacing the one dropped in v2
         
-        # Validate batch data
+        Reports and ad-hoc SQL written against the original schema still use
+        ``WHERE batch_id = ? ORDER BY timestamp``; without this index SQLite
+        sorts those rows in a temporary B-tree.
+        """
+        cursor = conn.cursor()
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_batch_events_batch_timestamp ON batch_events(batch_id, timestamp)')
+        conn.commit()
+
+    def create_batch(self, batch_data: Dict, generate_qr: bool = True) -> Dict:
+        """Create new batch with unique QR code
+        
+        With generate_qr=False the QR image is left to the caller (see
+        AsyncBatchTracker, which renders it off the database thread). A
+        batch_id from reserve_batch_ids may be passed in batch_data; otherwise
+        one is allocated in the same transaction as the insert.
+        """
+        # Validate batch data before a sequence number is spent on it
         validation_result = self._validate_batch_data(batch_data)
         if not validation_result["valid"]:
             return validation_result
         
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
+        batch_id = batch_data.get("batch_id")
         
         try:
+            now, now_ts = self._begin_batch_write(conn)
+            if batch_id is None:
+                batch_id = self._generate_batch_id(conn, batch_data, now)
+            
             # Insert batch record
             cursor.execute('''
                 INSERT INTO batches (
                     batch_id, product_type, production_date, initial_quantity_kg,
                     current_quantity_kg, origin_farm, quality_grade, status,
-                    created_at, updated_at
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    created_at, updated_at, created_ts, updated_ts, current_location
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             ''', (
                 batch_id,
                 batch_data["product_type"],
@@ -109,17 +664,22 @@ class BatchTracker:
                 batch_data["origin_farm"],
                 batch_data.get("quality_grade", "STANDARD"),
                 "PRODUCTION",
-                datetime.now().isoformat(),
-                datetime.now().isoformat()
+                now.isoformat(),
+                now.isoformat(),
+                now_ts,
+                now_ts,
+                batch_data["origin_farm"]
             ))
             
-            # Create initial production event
-            self._record_event(batch_id, "PRODUCTION", batch_data["origin_farm"])
+            # Create initial production event in the same transaction; a second
+            # connection would block on the write lock held by this one
+            self._record_event(batch_id, "PRODUCTION", batch_data["origin_farm"], conn=conn)
             
             # Generate QR code
-            qr_code_path = self._generate_qr_code(batch_id, batch_data)
+            qr_code_path = self._generate_qr_code(batch_id, batch_data) if generate_qr else None
             
             conn.commit()
+            self._invalidate_fleet(FLEET_STATUS_COUNTS, FLEET_LOCATION_INVENTORY)
             
             return {
                 "success": True,
@@ -141,17 +701,68 @@ class BatchTracker:
         finally:
             conn.close()
 
-    def _generate_batch_id(self, batch_data: Dict) -> str:
-        """Generate unique batch ID"""
-        timestamp = datetime.now().strftime("%Y%m%d")
+    def _generate_batch_id(self, conn: sqlite3.Connection, batch_data: Dict, now: datetime) -> str:
+        """Allocate the next batch ID of the day within the caller's transaction"""
+        day = now.strftime("%Y%m%d")
+        sequence = self._allocate_batch_sequence(conn, day, 1)
+        return self._format_batch_id(day, sequence, batch_data)
+
+    def _allocate_batch_sequence(self, conn: sqlite3.Connection, day: str, count: int) -> int:
+        """Advance the day's sequence by count and return the first value allocated
+        
+        The upsert takes SQLite's write lock, so concurrent writers (threads or
+        processes) queue on the busy timeout and each gets a distinct range;
+        no caller ever sees a duplicate ID and has to retry.
+        """
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO batch_id_sequences (day, last_value) VALUES (?, ?)
+            ON CONFLICT (day) DO UPDATE SET last_value = last_value + excluded.last_value
+            RETURNING last_value
+        ''', (day, count))
+        last_value = cursor.fetchone()[0]
+        return last_value - count + 1
+
+    def _format_batch_id(self, day: str, sequence: int, batch_data: Dict) -> str:
+        """BATCH-YYYYMMDD-PRD-FRM-NNNNNN; the day and sequence make it unique"""
         product_code = batch_data["product_type"][:3].upper()
         farm_code = batch_data["origin_farm"][:3].upper()
+        return f"BATCH-{day}-{product_code}-{farm_code}-{sequence:06d}"
+
+    def reserve_batch_ids(self, batch_data_list: List[Dict]) -> Dict:
+        """Reserve one batch ID per entry in a single allocation, for bulk creation
+        
+        Each entry needs product_type and origin_farm. Pass the returned IDs
+        back as batch_data["batch_id"] to create_batch. Unused reservations
+        simply leave gaps in the day's sequence.
+        """
+        if not batch_data_list:
+            return {
+                "success": True,
+                "batch_ids": []
+            }
+        
+        conn = sqlite3.connect(self.db_path)
+        day = datetime.now().strftime("%Y%m%d")
         
-        # Create hash for uniqueness
-        hash_input = f"{timestamp}{product_code}{farm_code}{batch_data['production_date']}"
-        hash_suffix = hashlib.md5(hash_input.encode()).hexdigest()[:6].upper()
+        try:
+            first = self._allocate_batch_sequence(conn, day, len(batch_data_list))
+            conn.commit()
+        except Exception as e:
+            return {
+                "success": False,
+                "error": f"Failed to reserve batch IDs: {str(e)}"
+            }
+        finally:
+            conn.close()
         
-        return f"BATCH-{timestamp}-{product_code}-{farm_code}-{hash_suffix}"
+        return {
+            "success": True,
+            "batch_ids": [
+                self._format_batch_id(day, first + offset, batch_data)
+                for offset, batch_data in enumerate(batch_data_list)
+            ]
+        }
 
     def _validate_batch_data(self, batch_data: Dict) -> Dict:
         """Validate batch creation data"""
@@ -187,37 +798,42 @@ class BatchTracker:
         
         return {"valid": True}
 
-    def _generate_qr_code(self, batch_id: str, batch_data: Dict) -> str:
-        """Generate QR code for batch tracking"""
-        qr_data = {
-            "batch_id": batch_id,
-            "product_type": batch_data["product_type"],
-            "production_date": batch_data["production_date"],
-            "origin_farm": batch_data["origin_farm"],
-            "tracking_url": f"https://track.buryatmyasoprom.com/batches/{batch_id}"
-        }
+    def _validate_event_data(self, event_data: Dict) -> Dict:
+        """Validate an event payload before any of it is written"""
+        if not isinstance(event_data, dict):
+            return {"valid": False, "error": "Event data must be a dict"}
         
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(json.dumps(qr_data))
-        qr.make(fit=True)
+        missing_fields = [field for field in ("event_type", "location") if not event_data.get(field)]
+        if missing_fields:
+            return {
+                "valid": False,
+                "error": f"Missing required fields: {missing_fields}"
+            }
         
-        # Save QR code image
-        qr_img = qr.make_image(fill_color="black", back_color="white")
-        qr_path = f"qrcodes/{batch_id}.png"
-        Path("qrcodes").mkdir(exist_ok=True)
-        qr_img.save(qr_path)
+        for field in ("temperature", "quantity_change_kg"):
+            value = event_data.get(field)
+            if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))):
+                return {"valid": False, "error": f"{field} must be a number"}
         
-        return qr_path
+        quality_metrics = event_data.get("quality_metrics")
+        if quality_metrics is not None:
+            try:
+                if not isinstance(quality_metrics, dict):
+                    raise TypeError("not a dict")
+                json.dumps(quality_metrics)
+            except (TypeError, ValueError):
+                return {"valid": False, "error": "quality_metrics must be a JSON-serializable dict"}
+        
+        return {"valid": True}
+
+    def _generate_qr_code(self, batch_id: str, batch_data: Dict) -> str:
+        """Generate QR code for batch tracking"""
+        return generate_batch_qr_code(batch_id, batch_data)
 
     def record_batch_event(self, batch_id: str, event_data: Dict) -> Dict:
         """Record event in batch lifecycle"""
         # Verify batch exists
-        batch_info = self.get_batch_info(batch_id)
+        batch_info = self.get_batch_info(batch_id, recent_events=0)
         if not batch_info["success"]:
             return batch_info
         
@@ -238,7 +854,7 @@ class BatchTracker:
             self._update_batch_status(batch_id, event_type, event_data)
             
             # Update quantity if this is a transfer or consumption event
-            if event_type in ["TRANSFER", "PROCESSING", "SHIPMENT"]:
+            if event_type in QUANTITY_EVENT_TYPES:
                 quantity_change = event_data.get("quantity_change_kg", 0)
                 if quantity_change != 0:
                     self._update_batch_quantity(batch_id, quantity_change)
@@ -248,32 +864,57 @@ class BatchTracker:
     def _record_event(self, batch_id: str, event_type: str, location: str,
                      temperature: Optional[float] = None,
                      quality_metrics: Optional[Dict] = None,
-                     responsible_party: Optional[str] = None) -> Dict:
-        """Record event in database"""
-        conn = sqlite3.connect(self.db_path)
+                     responsible_party: Optional[str] = None,
+                     conn: Optional[sqlite3.Connection] = None) -> Dict:
+        """Record event in database, within the caller's transaction if conn is given"""
+        owns_connection = conn is None
+        if owns_connection:
+            conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         
         try:
+            if owns_connection:
+                # A late event on an archived batch brings its history back to the hot DB
+                self._restore_archived_batch(conn, batch_id)
+            now, now_ts = self._begin_batch_write(conn)
+            
             cursor.execute('''
                 INSERT INTO batch_events (
                     batch_id, event_type, location, timestamp,
-                    temperature, quality_metrics, responsible_party
-                ) VALUES (?, ?, ?, ?, ?, ?, ?)
+                    temperature, quality_metrics, responsible_party, ts
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
             ''', (
                 batch_id,
                 event_type,
                 location,
-                datetime.now().isoformat(),
+                now.isoformat(),
                 temperature,
                 json.dumps(quality_metrics) if quality_metrics else None,
-                responsible_party
+                responsible_party,
+                _epoch_ms(now)
             ))
+            event_id = cursor.lastrowid
             
-            conn.commit()
+            if quality_metrics:
+                self._insert_event_metrics(cursor, event_id, batch_id, quality_metrics)
+            
+            # Only a move to a new location touches the location inventory
+            cursor.execute('''
+                UPDATE batches SET current_location = ?, updated_at = ?, updated_ts = ?
+                WHERE batch_id = ? AND current_location IS NOT ?
+            ''', (location, now.isoformat(), now_ts, batch_id, location))
+            
+            if owns_connection:
+                conn.commit()
+                self._invalidate_batch(batch_id)
+                if cursor.rowcount:
+                    self._invalidate_fleet(FLEET_LOCATION_INVENTORY)
+                if _is_temperature_excursion(temperature):
+                    self._invalidate_fleet(FLEET_TEMPERATURE_EXCURSIONS)
             
             return {
                 "success": True,
-                "event_id": cursor.lastrowid,
+                "event_id": event_id,
                 "message": f"Event recorded for batch {batch_id}"
             }
             
@@ -283,52 +924,243 @@ class BatchTracker:
                 "error": f"Failed to record event: {str(e)}"
             }
         finally:
-            conn.close()
+            if owns_connection:
+                conn.close()
+
+    def _insert_event_metrics(self, cursor: sqlite3.Cursor, event_id: int,
+                              batch_id: str, quality_metrics: Dict):
+        """Normalize an event's quality_metrics into event_metrics rows"""
+        cursor.execute('''
+            INSERT INTO event_metrics (event_id, batch_id, key, value)
+            SELECT ?, ?, key, value FROM json_each(?)
+        ''', (event_id, batch_id, json.dumps(quality_metrics)))
 
     def _update_batch_status(self, batch_id: str, event_type: str, event_data: Dict):
         """Update batch status based on event type"""
-        status_map = {
-            "PRODUCTION": "PRODUCTION",
-            "QUALITY_CHECK": "QUALITY_CONTROL",
-            "PROCESSING": "PROCESSING",
-            "PACKAGING": "PACKAGED",
-            "STORAGE": "IN_STORAGE",
-            "SHIPMENT": "IN_TRANSIT",
-            "CUSTOMS": "CUSTOMS_CLEARANCE",
-            "DELIVERY": "DELIVERED",
-            "CONSUMPTION": "CONSUMED"
-        }
-        
-        new_status = status_map.get(event_type)
+        new_status = STATUS_MAP.get(event_type)
         if new_status:
             conn = sqlite3.connect(self.db_path)
             cursor = conn.cursor()
+            now, now_ts = self._begin_batch_write(conn)
             
             cursor.execute('''
                 UPDATE batches 
-                SET status = ?, updated_at = ?
+                SET status = ?, updated_at = ?, updated_ts = ?
                 WHERE batch_id = ?
-            ''', (new_status, datetime.now().isoformat(), batch_id))
+            ''', (new_status, now.isoformat(), now_ts, batch_id))
             
             conn.commit()
             conn.close()
+            self._invalidate_batch(batch_id)
+            self._invalidate_fleet(FLEET_STATUS_COUNTS, FLEET_LOCATION_INVENTORY)
+            if new_status in CLOSED_STATUSES:
+                # Closed batches drop out of the active excursion list
+                self._invalidate_fleet(FLEET_TEMPERATURE_EXCURSIONS)
 
     def _update_batch_quantity(self, batch_id: str, quantity_change: float):
         """Update batch quantity"""
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
+        now, now_ts = self._begin_batch_write(conn)
         
         cursor.execute('''
             UPDATE batches 
-            SET current_quantity_kg = current_quantity_kg + ?, updated_at = ?
+            SET current_quantity_kg = current_quantity_kg + ?, updated_at = ?, updated_ts = ?
             WHERE batch_id = ?
-        ''', (quantity_change, datetime.now().isoformat(), batch_id))
+        ''', (quantity_change, now.isoformat(), now_ts, batch_id))
         
         conn.commit()
         conn.close()
+        self._invalidate_batch(batch_id)
+        self._invalidate_fleet(FLEET_STATUS_COUNTS, FLEET_LOCATION_INVENTORY)
+
+    def _invalidate_batch(self, batch_id: str):
+        """Drop cached reads of a batch after one of the tracker's own writes"""
+        if self.cache is not None:
+            self.cache.invalidate(batch_id)
+
+    def _invalidate_fleet(self, *names: str):
+        """Drop the named fleet aggregates after one of the tracker's own writes"""
+        if self.fleet_cache is not None:
+            self.fleet_cache.invalidate(*names)
 
-    def get_batch_info(self, batch_id: str) -> Dict:
-        """Get complete batch information"""
+    def _begin_batch_write(self, conn: sqlite3.Connection) -> Tuple[datetime, int]:
+        """Take the write lock and return (updated_at, updated_ts) for batches changed in it
+        
+        Stamped under the lock and kept strictly increasing, updated_ts follows
+        commit order, so an exporter's MAX(updated_ts) watermark never passes a
+        batch committed after its snapshot.
+        """
+        if not conn.in_transaction:
+            conn.execute('BEGIN IMMEDIATE')
+        now = datetime.now()
+        now_ts = _epoch_ms(now)
+        last_ts = conn.execute('SELECT MAX(updated_ts) FROM batches').fetchone()[0]
+        if last_ts is not None and now_ts <= last_ts:
+            now_ts = last_ts + 1
+            now = datetime.fromtimestamp(now_ts / 1000)
+        return now, now_ts
+
+    def get_cache_stats(self) -> Dict:
+        """Hit-rate metrics for the batch read-through cache"""
+        if self.cache is None:
+            return {"enabled": False}
+        return {"enabled": True, **self.cache.get_stats()}
+
+    def _record_events_bulk(self, entries: List[Tuple[str, Dict, datetime]]) -> List[Dict]:
+        """Record many (batch_id, event_data, recorded_at) entries in one transaction
+        
+        Applies the same status and quantity updates as record_batch_event and
+        returns one result dict per entry, in order. Malformed entries are
+        rejected before anything is written, so they fail on their own
+        without rolling back the rest of the group.
+        """
+        conn = None
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            batch_ids = list(dict.fromkeys(batch_id for batch_id, _, _ in entries))
+            
+            # Late events on archived batches bring their history back first
+            for batch_id in batch_ids:
+                self._restore_archived_batch(conn, batch_id)
+            now, now_ts = self._begin_batch_write(conn)
+            
+            existing = set()
+            for i in range(0, len(batch_ids), ARCHIVE_CHUNK_SIZE):
+                chunk = batch_ids[i:i + ARCHIVE_CHUNK_SIZE]
+                placeholders = ", ".join("?" for _ in chunk)
+                cursor.execute(f'SELECT batch_id FROM batches WHERE batch_id IN ({placeholders})', chunk)
+                existing.update(row[0] for row in cursor.fetchall())
+            
+            results = []
+            status_updates = {}
+            quantity_updates = {}
+            location_updates = {}
+            fleet_keys = set()
+            
+            for batch_id, event_data, recorded_at in entries:
+                if batch_id not in existing:
+                    results.append({
+                        "success": False,
+                        "error": f"Batch {batch_id} not found"
+                    })
+                    continue
+                
+                validation = self._validate_event_data(event_data)
+                if not validation["valid"]:
+                    results.append({
+                        "success": False,
+                        "error": f"Invalid event: {validation['error']}"
+                    })
+                    continue
+                
+                event_type = event_data["event_type"]
+                quality_metrics = event_data.get("quality_metrics")
+                cursor.execute('''
+                    INSERT INTO batch_events (
+                        batch_id, event_type, location, timestamp,
+                        temperature, quality_metrics, responsible_party, ts
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (
+                    batch_id,
+                    event_type,
+                    event_data["location"],
+                    recorded_at.isoformat(),
+                    event_data.get("temperature"),
+                    json.dumps(quality_metrics) if quality_metrics else None,
+                    event_data.get("responsible_party"),
+                    _epoch_ms(recorded_at)
+                ))
+                event_id = cursor.lastrowid
+                if quality_metrics:
+                    self._insert_event_metrics(cursor, event_id, batch_id, quality_metrics)
+                location_updates[batch_id] = event_data["location"]
+                if _is_temperature_excursion(event_data.get("temperature")):
+                    fleet_keys.add(FLEET_TEMPERATURE_EXCURSIONS)
+                results.append({
+                    "success": True,
+                    "event_id": event_id,
+                    "message": f"Event recorded for batch {batch_id}"
+                })
+                
+                # Only the last status change per batch needs to be written
+                if event_type in STATUS_MAP:
+                    status_updates[batch_id] = STATUS_MAP[event_type]
+                if event_type in QUANTITY_EVENT_TYPES and event_data.get("quantity_change_kg", 0) != 0:
+                    quantity_updates[batch_id] = quantity_updates.get(batch_id, 0) + event_data["quantity_change_kg"]
+            
+            cursor.executemany('''
+                UPDATE batches 
+                SET status = ?, updated_at = ?, updated_ts = ?
+                WHERE batch_id = ?
+            ''', [
+                (status, now.isoformat(), now_ts, batch_id)
+                for batch_id, status in status_updates.items()
+            ])
+            cursor.executemany('''
+                UPDATE batches 
+                SET current_quantity_kg = current_quantity_kg + ?, updated_at = ?, updated_ts = ?
+                WHERE batch_id = ?
+            ''', [
+                (quantity_change, now.isoformat(), now_ts, batch_id)
+                for batch_id, quantity_change in quantity_updates.items()
+            ])
+            for batch_id, location in location_updates.items():
+                cursor.execute('''
+                    UPDATE batches SET current_location = ?, updated_at = ?, updated_ts = ?
+                    WHERE batch_id = ? AND current_location IS NOT ?
+                ''', (location, now.isoformat(), now_ts, batch_id, location))
+                if cursor.rowcount:
+                    fleet_keys.add(FLEET_LOCATION_INVENTORY)
+            
+            if status_updates or quantity_updates:
+                fleet_keys.update((FLEET_STATUS_COUNTS, FLEET_LOCATION_INVENTORY))
+            if any(status in CLOSED_STATUSES for status in status_updates.values()):
+                fleet_keys.add(FLEET_TEMPERATURE_EXCURSIONS)
+            
+            conn.commit()
+            for batch_id in existing:
+                self._invalidate_batch(batch_id)
+            self._invalidate_fleet(*fleet_keys)
+            return results
+            
+        except Exception as e:
+            if conn is not None:
+                conn.rollback()
+            return [
+                {
+                    "success": False,
+                    "error": f"Failed to record event: {str(e)}"
+                }
+                for _ in entries
+            ]
+        finally:
+            if conn is not None:
+                conn.close()
+
+    def get_batch_info(self, batch_id: str, recent_events: Optional[int] = None) -> Dict:
+        """Get complete batch information, or only the most recent N events"""
+        cached = self._cached_batch_info(batch_id, recent_events)
+        if cached is not None:
+            return cached
+        return self._load_batch_info(batch_id, recent_events)
+
+    def _cached_batch_info(self, batch_id: str, recent_events: Optional[int] = None) -> Optional[Dict]:
+        """Return a cached get_batch_info result without touching the database"""
+        if self.cache is None:
+            return None
+        cached = self.cache.get(batch_id, recent_events)
+        return _copy_batch_info(cached) if cached is not None else None
+
+    def _load_batch_info(self, batch_id: str, recent_events: Optional[int] = None) -> Dict:
+        """Read batch information from the database and populate the cache"""
+        head = None
+        if self.cache is not None:
+            cache_version = self.cache.version(batch_id)
+            if recent_events is None:
+                head = self.cache.head(batch_id)
+        
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         
@@ -343,15 +1175,31 @@ class BatchTracker:
                 "error": f"Batch {batch_id} not found"
             }
         
-        # Get batch events
-        cursor.execute('''
-            SELECT * FROM batch_events 
-            WHERE batch_id = ? 
-            ORDER BY timestamp DESC
-        ''', (batch_id,))
-        event_rows = cursor.fetchall()
-        
-        conn.close()
+        # Get batch events, newest first
+        try:
+            events = None
+            if head is not None:
+                # The newest events are cached; read only the older rest
+                events = _copy_json(head["events"])
+                try:
+                    events.extend(self._iter_events(
+                        conn, batch_id, after=events[-1]["event_id"], fields=EVENT_FIELDS, descending=True
+                    ))
+                except ValueError:
+                    # The head's last event moved (e.g. archived) since it was cached
+                    events = None
+            if events is None:
+                events = list(self._iter_events(
+                    conn, batch_id, limit=recent_events, fields=EVENT_FIELDS, descending=True
+                ))
+            
+            total_events = None
+            if recent_events is not None:
+                table = f"{self._events_schema(conn, batch_id)}.batch_events"
+                cursor.execute(f'SELECT COUNT(*) FROM {table} WHERE batch_id = ?', (batch_id,))
+                total_events = cursor.fetchone()[0]
+        finally:
+            conn.close()
         
         # Format batch data
         batch_info = {
@@ -367,26 +1215,374 @@ class BatchTracker:
             "updated_at": batch_row[9]
         }
         
-        # Format events
-        events = []
-        for event_row in event_rows:
-            events.append({
-                "event_id": event_row[0],
-                "event_type": event_row[2],
-                "location": event_row[3],
-                "timestamp": event_row[4],
-                "temperature": event_row[5],
-                "quality_metrics": json.loads(event_row[6]) if event_row[6] else None,
-                "responsible_party": event_row[7]
-            })
+        result = {
+            "success": True,
+            "batch": batch_info,
+            "events": events,
+            "event_count": len(events)
+        }
+        
+        if total_events is not None:
+            result["total_event_count"] = total_events
+            result["events_truncated"] = total_events > len(events)
+        
+        if self.cache is not None:
+            self.cache.put((batch_id, recent_events), result, cache_version)
+        
+        return result
+
+    def iter_batch_events(self, batch_id: str, after: Optional[int] = None,
+                          limit: Optional[int] = None,
+                          fields: Optional[Sequence[str]] = None,
+                          descending: bool = False) -> Iterator[Dict]:
+        """Stream batch events in timestamp order using keyset pagination
+        
+        ``after`` is the event_id of the last event already seen; the stream
+        resumes right after it. Only the requested ``fields`` are selected, and
+        quality_metrics JSON is decoded row by row only when it is requested.
+        """
+        if fields is None:
+            fields = EVENT_FIELDS
+        unknown_fields = [field for field in fields if field not in EVENT_FIELDS]
+        if unknown_fields:
+            raise ValueError(f"Unknown event fields: {unknown_fields}")
+        
+        conn = sqlite3.connect(self.db_path)
+        try:
+            yield from self._iter_events(conn, batch_id, after, limit, fields, descending)
+        finally:
+            conn.close()
+
+    def _iter_events(self, conn: sqlite3.Connection, batch_id: str,
+                     after: Optional[int] = None, limit: Optional[int] = None,
+                     fields: Sequence[str] = EVENT_FIELDS,
+                     descending: bool = False) -> Iterator[Dict]:
+        """Yield events page by page over (batch_id, ts) without loading them all"""
+        cursor = conn.cursor()
+        table = f"{self._events_schema(conn, batch_id)}.batch_events"
+        columns = ", ".join(EVENT_FIELDS[field] for field in fields)
+        decode_metrics = "quality_metrics" in fields
+        comparison, order = ("<", "DESC") if descending else (">", "ASC")
+        
+        # Keyset position: (ts, event_id) of the last row returned
+        position = None
+        if after is not None:
+            cursor.execute(
+                f'SELECT ts, event_id FROM {table} WHERE event_id = ? AND batch_id = ?',
+                (after, batch_id)
+            )
+            position = cursor.fetchone()
+            if position is None:
+                raise ValueError(f"Event {after} not found for batch {batch_id}")
+        
+        remaining = limit
+        while remaining is None or remaining > 0:
+            page_size = EVENT_PAGE_SIZE if remaining is None else min(EVENT_PAGE_SIZE, remaining)
+            
+            if position is None:
+                cursor.execute(f'''
+                    SELECT ts, event_id, {columns} FROM {table}
+                    WHERE batch_id = ?
+                    ORDER BY ts {order}, event_id {order}
+                    LIMIT ?
+                ''', (batch_id, page_size))
+            else:
+                cursor.execute(f'''
+                    SELECT ts, event_id, {columns} FROM {table}
+                    WHERE batch_id = ? AND (ts, event_id) {comparison} (?, ?)
+                    ORDER BY ts {order}, event_id {order}
+                    LIMIT ?
+                ''', (batch_id, position[0], position[1], page_size))
+            rows = cursor.fetchall()
+            
+            for row in rows:
+                event = dict(zip(fields, row[2:]))
+                if decode_metrics:
+                    raw_metrics = event["quality_metrics"]
+                    event["quality_metrics"] = json.loads(raw_metrics) if raw_metrics else None
+                yield event
+            
+            if len(rows) < page_size:
+                break
+            position = rows[-1][:2]
+            if remaining is not None:
+                remaining -= len(rows)
+
+    def get_events_in_range(self, start: datetime, end: datetime,
+                            location: Optional[str] = None,
+                            include_archived: bool = False) -> Dict:
+        """Get events recorded in [start, end), optionally at a single location"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        start_ts, end_ts = _epoch_ms(start), _epoch_ms(end)
+        
+        if include_archived:
+            # Only archives holding batches active during the range are attached
+            cursor.execute('''
+                SELECT DISTINCT archive_file FROM batch_archive
+                WHERE last_ts >= ? AND first_ts < ?
+            ''', (start_ts, end_ts))
+            archive_files = [row[0] for row in cursor.fetchall()]
+        else:
+            archive_files = []
+        
+        event_rows = []
+        try:
+            for archive_file in [None, *archive_files]:
+                # Archives are attached one at a time to stay under SQLite's ATTACH limit
+                alias = self._attach_archive(conn, archive_file) if archive_file else None
+                table = f"{alias}.batch_events" if alias else "batch_events"
+                # An interrupted archive move or restore can leave copies of a batch
+                # that batch_archive does not list; only listed batches count
+                archived_filter = ("AND batch_id IN (SELECT batch_id FROM main.batch_archive WHERE archive_file = ?)"
+                                   if alias else "")
+                archived_params = (archive_file,) if alias else ()
+                
+                # Served from idx_batch_events_location_ts / idx_batch_events_ts
+                if location is not None:
+                    cursor.execute(f'''
+                        SELECT event_id, batch_id, event_type, location, timestamp,
+                               temperature, quality_metrics, responsible_party, ts
+                        FROM {table}
+                        WHERE location = ? AND ts >= ? AND ts < ? {archived_filter}
+                        ORDER BY ts, event_id
+                    ''', (location, start_ts, end_ts, *archived_params))
+                else:
+                    cursor.execute(f'''
+                        SELECT event_id, batch_id, event_type, location, timestamp,
+                               temperature, quality_metrics, responsible_party, ts
+                        FROM {table}
+                        WHERE ts >= ? AND ts < ? {archived_filter}
+                        ORDER BY ts, event_id
+                    ''', (start_ts, end_ts, *archived_params))
+                event_rows.extend(cursor.fetchall())
+                
+                if alias:
+                    cursor.execute(f'DETACH DATABASE {alias}')
+        finally:
+            conn.close()
+        
+        if archive_files:
+            event_rows.sort(key=lambda row: (row[8], row[0]))
+        
+        events = [
+            {
+                "event_id": row[0],
+                "batch_id": row[1],
+                "event_type": row[2],
+                "location": row[3],
+                "timestamp": row[4],
+                "temperature": row[5],
+                "quality_metrics": json.loads(row[6]) if row[6] else None,
+                "responsible_party": row[7]
+            }
+            for row in event_rows
+        ]
         
         return {
             "success": True,
-            "batch": batch_info,
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "location": location,
             "events": events,
             "event_count": len(events)
         }
 
+    def _events_schema(self, conn: sqlite3.Connection, batch_id: str) -> str:
+        """Return the schema holding a batch's events, attaching its archive if needed"""
+        cursor = conn.cursor()
+        cursor.execute('SELECT archive_file FROM batch_archive WHERE batch_id = ?', (batch_id,))
+        row = cursor.fetchone()
+        if row is None:
+            return "main"
+        
+        return self._attach_archive(conn, row[0])
+
+    def _attach_archive(self, conn: sqlite3.Connection, archive_file: str,
+                        create: bool = False) -> str:
+        """ATTACH a monthly archive database to conn and return its schema alias"""
+        alias = Path(archive_file).stem.replace("batch_events_", "archive_")
+        attached = {row[1] for row in conn.execute('PRAGMA database_list')}
+        if alias in attached:
+            return alias
+        
+        archive_path = Path(self.archive_dir) / archive_file
+        if not create and not archive_path.exists():
+            # ATTACH would silently create an empty database and hide the loss
+            raise FileNotFoundError(f"Batch event archive {archive_path} is missing")
+        archive_path.parent.mkdir(parents=True, exist_ok=True)
+        
+        conn.execute(f'ATTACH DATABASE ? AS {alias}', (str(archive_path),))
+        return alias
+
+    def _restore_archived_batch(self, conn: sqlite3.Connection, batch_id: str):
+        """Move an archived batch's events back into the hot batch_events table
+        
+        The hot DB commits first: once batch_archive no longer lists the batch,
+        reads go to main. A crash before the archive copy is deleted leaves
+        rows that reads ignore and a later archive run overwrites.
+        """
+        cursor = conn.cursor()
+        cursor.execute('SELECT archive_file FROM batch_archive WHERE batch_id = ?', (batch_id,))
+        row = cursor.fetchone()
+        if row is None:
+            return
+        
+        alias = self._attach_archive(conn, row[0])
+        cursor.execute(f'''
+            INSERT OR IGNORE INTO main.batch_events ({ARCHIVE_EVENT_COLUMNS})
+            SELECT {ARCHIVE_EVENT_COLUMNS} FROM {alias}.batch_events WHERE batch_id = ?
+        ''', (batch_id,))
+        cursor.execute('''
+            INSERT OR IGNORE INTO event_metrics (event_id, batch_id, key, value)
+            SELECT e.event_id, e.batch_id, j.key, j.value
+            FROM main.batch_events e, json_each(e.quality_metrics) j
+            WHERE e.batch_id = ? AND e.quality_metrics IS NOT NULL
+        ''', (batch_id,))
+        cursor.execute('DELETE FROM main.batch_archive WHERE batch_id = ?', (batch_id,))
+        conn.commit()
+        cursor.execute(f'DELETE FROM {alias}.batch_events WHERE batch_id = ?', (batch_id,))
+        conn.commit()
+        cursor.execute(f'DETACH DATABASE {alias}')
+        self._invalidate_batch(batch_id)
+        self._invalidate_fleet(FLEET_STAGE_DWELL, FLEET_TEMPERATURE_EXCURSIONS)
+        
+        logger.info(f"Restored archived batch {batch_id} to the hot database")
+
+    def archive_closed_batches(self, older_than_days: int = 90, vacuum: bool = False) -> Dict:
+        """Move events of closed batches into monthly archive databases
+        
+        A batch is archived once its status is in CLOSED_STATUSES and its last
+        event is older than ``older_than_days``. Its events move to
+        ``batch_events_YYYY_MM.db`` (month of the last event) in archive_dir and a
+        summary row stays in batch_archive, so reads attach the archive on demand.
+        """
+        cutoff = datetime.now() - timedelta(days=older_than_days)
+        
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        status_placeholders = ", ".join("?" for _ in CLOSED_STATUSES)
+        cursor.execute(f'''
+            SELECT batch_id, last_ts FROM (
+                SELECT b.batch_id,
+                       (SELECT MAX(e.ts) FROM batch_events e WHERE e.batch_id = b.batch_id) AS last_ts
+                FROM batches b
+                WHERE b.status IN ({status_placeholders})
+                  AND b.batch_id NOT IN (SELECT batch_id FROM batch_archive)
+            )
+            WHERE last_ts < ?
+        ''', (*CLOSED_STATUSES, _epoch_ms(cutoff)))
+        candidates = cursor.fetchall()
+        
+        # Group batches by the month of their last event
+        batches_by_file = {}
+        for batch_id, last_ts in candidates:
+            month = datetime.fromtimestamp(last_ts / 1000).strftime("%Y_%m")
+            batches_by_file.setdefault(f"batch_events_{month}.db", []).append(batch_id)
+        
+        archived_batches = 0
+        archived_events = 0
+        
+        try:
+            for archive_file, batch_ids in sorted(batches_by_file.items()):
+                alias = self._attach_archive(conn, archive_file, create=True)
+                cursor.execute(f'''
+                    CREATE TABLE IF NOT EXISTS {alias}.batch_events (
+                        event_id INTEGER PRIMARY KEY,
+                        batch_id TEXT NOT NULL,
+                        event_type TEXT NOT NULL,
+                        location TEXT NOT NULL,
+                        timestamp TEXT NOT NULL,
+                        temperature REAL,
+                        quality_metrics TEXT,
+                        responsible_party TEXT,
+                        ts INTEGER
+                    )
+                ''')
+                cursor.execute(f'CREATE INDEX IF NOT EXISTS {alias}.idx_batch_events_batch_ts ON batch_events(batch_id, ts)')
+                cursor.execute(f'CREATE INDEX IF NOT EXISTS {alias}.idx_batch_events_location_ts ON batch_events(location, ts)')
+                cursor.execute(f'CREATE INDEX IF NOT EXISTS {alias}.idx_batch_events_ts ON batch_events(ts)')
+                cursor.execute(f'CREATE INDEX IF NOT EXISTS {alias}.idx_batch_events_batch_timestamp ON batch_events(batch_id, timestamp)')
+                conn.commit()
+                
+                for i in range(0, len(batch_ids), ARCHIVE_CHUNK_SIZE):
+                    chunk = batch_ids[i:i + ARCHIVE_CHUNK_SIZE]
+                    placeholders = ", ".join("?" for _ in chunk)
+                    
+                    # Commits are atomic per file only, so the copy commits in the
+                    # archive first. Until the hot DB commits below, the batch stays
+                    # hot and reads ignore the copy; after a crash the next run
+                    # copies it again over the leftover rows
+                    cursor.execute(f'''
+                        INSERT OR REPLACE INTO {alias}.batch_events ({ARCHIVE_EVENT_COLUMNS})
+                        SELECT {ARCHIVE_EVENT_COLUMNS} FROM main.batch_events
+                        WHERE batch_id IN ({placeholders})
+                    ''', chunk)
+                    conn.commit()
+                    
+                    # Summary and delete commit together in the hot DB
+                    cursor.execute('BEGIN IMMEDIATE')
+                    # A batch that got an event after the copy stays hot
+                    cursor.execute(f'''
+                        SELECT DISTINCT e.batch_id FROM main.batch_events e
+                        WHERE e.batch_id IN ({placeholders})
+                          AND NOT EXISTS (SELECT 1 FROM {alias}.batch_events a WHERE a.event_id = e.event_id)
+                    ''', chunk)
+                    late_batches = {row[0] for row in cursor.fetchall()}
+                    moved = [batch_id for batch_id in chunk if batch_id not in late_batches]
+                    if moved:
+                        placeholders = ", ".join("?" for _ in moved)
+                        cursor.execute(f'''
+                            INSERT INTO main.batch_archive (
+                                batch_id, archive_file, event_count, first_ts, last_ts,
+                                min_temperature, max_temperature, avg_temperature, archived_at
+                            )
+                            SELECT batch_id, ?, COUNT(*), MIN(ts), MAX(ts),
+                                   MIN(temperature), MAX(temperature), AVG(temperature), ?
+                            FROM main.batch_events
+                            WHERE batch_id IN ({placeholders})
+                            GROUP BY batch_id
+                        ''', (archive_file, datetime.now().isoformat(), *moved))
+                        cursor.execute(f'DELETE FROM main.batch_events WHERE batch_id IN ({placeholders})', moved)
+                        archived_events += cursor.rowcount
+                        # Archived batches aggregate straight from their archived JSON
+                        cursor.execute(f'DELETE FROM main.event_metrics WHERE batch_id IN ({placeholders})', moved)
+                    conn.commit()
+                    for batch_id in moved:
+                        self._invalidate_batch(batch_id)
+                    archived_batches += len(moved)
+                
+                cursor.execute(f'DETACH DATABASE {alias}')
+            
+            if vacuum and archived_events:
+                # Return freed pages to the OS so the hot file shrinks
+                conn.execute('VACUUM')
+                
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Batch archival failed: {str(e)}")
+            return {
+                "success": False,
+                "error": f"Archival failed: {str(e)}",
+                "archived_batches": archived_batches,
+                "archived_events": archived_events
+            }
+        finally:
+            conn.close()
+        
+        if archived_events:
+            self._invalidate_fleet(FLEET_STAGE_DWELL, FLEET_TEMPERATURE_EXCURSIONS)
+        logger.info(f"Archived {archived_events} events from {archived_batches} closed batches")
+        
+        return {
+            "success": True,
+            "cutoff": cutoff.isoformat(),
+            "archived_batches": archived_batches,
+            "archived_events": archived_events,
+            "archive_files": sorted(batches_by_file)
+        }
+
     def get_batch_timeline(self, batch_id: str) -> Dict:
         """Get batch timeline with key milestones"""
         batch_info = self.get_batch_info(batch_id)
@@ -482,7 +1678,7 @@ class BatchTracker:
             return 0.5  # Neutral score if no temperature data
         
         # Check if temperatures are within safe range (-20°C to -15°C)
-        compliant_readings = sum(1 for temp in temp_readings if -20 <= temp <= -15)
+        compliant_readings = sum(1 for temp in temp_readings if not _is_temperature_excursion(temp))
         compliance_rate = compliant_readings / len(temp_readings)
         
         return compliance_rate
@@ -517,8 +1713,136 @@ class BatchTracker:
         
         return round(duration / (24 * 3600), 1)
 
+    def link_batches(self, parent_batch_ids: List[str], child_batch_id: str,
+                     relation_type: str, quantity_kg: Optional[float] = None) -> Dict:
+        """Record that child batch was derived from parent batches (split, merge or repack)"""
+        if relation_type not in LINEAGE_RELATIONS:
+            return {
+                "success": False,
+                "error": f"Invalid relation type {relation_type}, expected one of {list(LINEAGE_RELATIONS)}"
+            }
+        
+        if not parent_batch_ids or child_batch_id in parent_batch_ids:
+            return {
+                "success": False,
+                "error": "A batch must be derived from at least one other batch"
+            }
+        
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        now = datetime.now()
+        
+        try:
+            batch_ids = list(dict.fromkeys([*parent_batch_ids, child_batch_id]))
+            placeholders = ", ".join("?" for _ in batch_ids)
+            cursor.execute(f'SELECT batch_id FROM batches WHERE batch_id IN ({placeholders})', batch_ids)
+            missing = set(batch_ids) - {row[0] for row in cursor.fetchall()}
+            if missing:
+                return {
+                    "success": False,
+                    "error": f"Batches not found: {sorted(missing)}"
+                }
+            
+            cursor.executemany('''
+                INSERT INTO batch_lineage (
+                    parent_batch_id, child_batch_id, relation_type,
+                    quantity_kg, created_at, created_ts
+                ) VALUES (?, ?, ?, ?, ?, ?)
+            ''', [
+                (parent_id, child_batch_id, relation_type, quantity_kg, now.isoformat(), _epoch_ms(now))
+                for parent_id in dict.fromkeys(parent_batch_ids)
+            ])
+            
+            conn.commit()
+            
+            return {
+                "success": True,
+                "child_batch_id": child_batch_id,
+                "parent_batch_ids": list(dict.fromkeys(parent_batch_ids)),
+                "relation_type": relation_type,
+                "message": f"Lineage recorded for batch {child_batch_id}"
+            }
+            
+        except sqlite3.IntegrityError:
+            return {
+                "success": False,
+                "error": f"Lineage for batch {child_batch_id} already recorded"
+            }
+        finally:
+            conn.close()
+
+    def trace_batch_lineage(self, batch_id: str, direction: str = "downstream") -> Dict:
+        """Find every batch derived from (downstream) or feeding into (upstream) a batch"""
+        return self._trace_lineage('SELECT ?', (batch_id,), direction, {"batch_id": batch_id})
+
+    def trace_farm_lineage(self, origin_farm: str) -> Dict:
+        """Find every batch produced at a farm or derived from one of its batches"""
+        return self._trace_lineage(
+            'SELECT batch_id FROM batches WHERE origin_farm = ?', (origin_farm,),
+            "downstream", {"origin_farm": origin_farm}
+        )
+
+    def _trace_lineage(self, seed_query: str, params: tuple, direction: str, source: Dict) -> Dict:
+        """Walk batch_lineage from the seed batches with a single recursive CTE"""
+        if direction == "downstream":
+            from_column, to_column = "parent_batch_id", "child_batch_id"
+        elif direction == "upstream":
+            from_column, to_column = "child_batch_id", "parent_batch_id"
+        else:
+            return {
+                "success": False,
+                "error": f"Invalid direction {direction}, expected 'upstream' or 'downstream'"
+            }
+        
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        # UNION (not UNION ALL) visits each batch once, so shared ancestors in
+        # merge-heavy graphs are not re-expanded
+        cursor.execute(f'''
+            WITH RECURSIVE lineage(batch_id) AS (
+                {seed_query}
+                UNION
+                SELECT l.{to_column}
+                FROM batch_lineage l
+                JOIN lineage ON l.{from_column} = lineage.batch_id
+            )
+            SELECT b.batch_id, b.product_type, b.origin_farm, b.status,
+                   b.current_quantity_kg, b.production_date
+            FROM lineage
+            JOIN batches b ON b.batch_id = lineage.batch_id
+        ''', params)
+        rows = cursor.fetchall()
+        
+        conn.close()
+        
+        affected_batches = [
+            {
+                "batch_id": row[0],
+                "product_type": row[1],
+                "origin_farm": row[2],
+                "status": row[3],
+                "current_quantity_kg": row[4],
+                "production_date": row[5]
+            }
+            for row in rows
+        ]
+        
+        return {
+            "success": True,
+            **source,
+            "direction": direction,
+            "affected_batches": affected_batches,
+            "affected_count": len(affected_batches),
+            "affected_quantity_kg": round(sum(b["current_quantity_kg"] for b in affected_batches), 2)
+        }
+
     def scan_batch_qr(self, qr_data: str) -> Dict:
-        """Process QR code scan and return batch information"""
+        """Process QR code scan and return batch information with its newest events
+        
+        At most SCAN_RECENT_EVENTS events are returned; total_event_count and
+        events_truncated tell a long history apart.
+        """
         try:
             data = json.loads(qr_data)
             batch_id = data.get("batch_id")
@@ -529,7 +1853,7 @@ class BatchTracker:
                     "error": "Invalid QR code data"
                 }
             
-            return self.get_batch_info(batch_id)
+            return self.get_batch_info(batch_id, recent_events=SCAN_RECENT_EVENTS)
             
         except json.JSONDecodeError:
             return {
@@ -549,7 +1873,7 @@ class BatchTracker:
             "report_id": f"BATCH_REPORT_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
             "batch_summary": batch_info["batch"],
             "timeline_analysis": timeline["timeline_analysis"],
-            "quality_metrics": self._aggregate_quality_metrics(batch_info["events"]),
+            "quality_metrics": self._aggregate_quality_metrics(batch_id),
             "temperature_analysis": self._analyze_temperature_data(batch_info["events"]),
             "compliance_status": self._assess_compliance_status(batch_info),
             "recommendations": self._generate_batch_recommendations(batch_info, timeline),
@@ -558,37 +1882,291 @@ class BatchTracker:
         
         return report
 
-    def _aggregate_quality_metrics(self, events: List[Dict]) -> Dict:
-        """Aggregate quality metrics from all events"""
-        quality_events = [e for e in events if e["quality_metrics"]]
+    def _aggregate_quality_metrics(self, batch_id: str) -> Dict:
+        """Aggregate quality metrics from all events of a batch in SQL"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
         
-        if not quality_events:
+        try:
+            schema = self._events_schema(conn, batch_id)
+            if schema == "main":
+                # Covered by idx_event_metrics_batch_key
+                cursor.execute('''
+                    SELECT COUNT(DISTINCT event_id) FROM event_metrics WHERE batch_id = ?
+                ''', (batch_id,))
+                total_quality_checks = cursor.fetchone()[0]
+                cursor.execute('''
+                    SELECT key, MIN(value), MAX(value), AVG(value), COUNT(*)
+                    FROM event_metrics
+                    WHERE batch_id = ?
+                    GROUP BY key
+                    HAVING SUM(typeof(value) NOT IN ('integer', 'real')) = 0
+                ''', (batch_id,))
+            else:
+                # Archived batches keep only the raw JSON, decoded by JSON1
+                cursor.execute(f'''
+                    SELECT COUNT(*) FROM {schema}.batch_events
+                    WHERE batch_id = ? AND quality_metrics IS NOT NULL
+                ''', (batch_id,))
+                total_quality_checks = cursor.fetchone()[0]
+                cursor.execute(f'''
+                    SELECT j.key, MIN(j.value), MAX(j.value), AVG(j.value), COUNT(*)
+                    FROM {schema}.batch_events e, json_each(e.quality_metrics) j
+                    WHERE e.batch_id = ? AND e.quality_metrics IS NOT NULL
+                    GROUP BY j.key
+                    HAVING SUM(typeof(j.value) NOT IN ('integer', 'real')) = 0
+                ''', (batch_id,))
+            metric_rows = cursor.fetchall()
+        finally:
+            conn.close()
+        
+        if not total_quality_checks:
             return {"data_available": False}
         
-        all_metrics = {}
-        for event in quality_events:
-            for key, value in event["quality_metrics"].items():
-                if key not in all_metrics:
-                    all_metrics[key] = []
-                all_metrics[key].append(value)
-        
-        # Calculate averages
-        aggregated = {}
-        for key, values in all_metrics.items():
-            if all(isinstance(v, (int, float)) for v in values):
-                aggregated[key] = {
-                    "average": round(sum(values) / len(values), 2),
-                    "min": min(values),
-                    "max": max(values),
-                    "count": len(values)
-                }
+        # Keys with any non-numeric value are excluded by the HAVING clause
+        aggregated = {
+            key: {
+                "average": round(average, 2),
+                "min": min_value,
+                "max": max_value,
+                "count": count
+            }
+            for key, min_value, max_value, average, count in metric_rows
+        }
         
         return {
             "data_available": True,
             "metrics": aggregated,
-            "total_quality_checks": len(quality_events)
+            "total_quality_checks": total_quality_checks
+        }
+
+    def get_fleet_quality_metrics(self) -> Dict:
+        """Min, max and average per quality key across all batches in the hot database"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        # Covered by idx_event_metrics_key; no rows are decoded in Python
+        cursor.execute('''
+            SELECT key, MIN(value), MAX(value), AVG(value), COUNT(*)
+            FROM event_metrics
+            GROUP BY key
+            HAVING SUM(typeof(value) NOT IN ('integer', 'real')) = 0
+        ''')
+        metric_rows = cursor.fetchall()
+        
+        conn.close()
+        
+        return {
+            "success": True,
+            "metrics": {
+                key: {
+                    "average": round(average, 2),
+                    "min": min_value,
+                    "max": max_value,
+                    "count": count
+                }
+                for key, min_value, max_value, average, count in metric_rows
+            },
+            "generated_at": datetime.now().isoformat()
+        }
+
+    def _fleet_aggregate(self, name: str, params: Tuple, compute) -> Dict:
+        """Serve a fleet aggregate from the TTL cache, computing it on a miss"""
+        if self.fleet_cache is None:
+            return compute(*params)
+        
+        cached = self.fleet_cache.get(name, params)
+        if cached is not None:
+            return cached
+        
+        generation = self.fleet_cache.generation(name)
+        result = compute(*params)
+        if result["success"]:
+            self.fleet_cache.put(name, params, result, generation)
+        return result
+
+    def get_fleet_status_counts(self) -> Dict:
+        """Number of batches and kg on hand per status"""
+        return self._fleet_aggregate(FLEET_STATUS_COUNTS, (), self._query_status_counts)
+
+    def _query_status_counts(self) -> Dict:
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        # Covered by idx_batches_status
+        cursor.execute('''
+            SELECT status, COUNT(*), SUM(current_quantity_kg)
+            FROM batches
+            GROUP BY status
+        ''')
+        rows = cursor.fetchall()
+        
+        conn.close()
+        
+        return {
+            "success": True,
+            "statuses": {
+                status: {
+                    "batches": batch_count,
+                    "quantity_kg": round(quantity_kg or 0, 2)
+                }
+                for status, batch_count, quantity_kg in rows
+            },
+            "total_batches": sum(row[1] for row in rows),
+            "generated_at": datetime.now().isoformat()
+        }
+
+    def get_fleet_inventory_by_location(self) -> Dict:
+        """Kg and batch count of open (not delivered/consumed) batches per current location"""
+        return self._fleet_aggregate(FLEET_LOCATION_INVENTORY, (), self._query_location_inventory)
+
+    def _query_location_inventory(self) -> Dict:
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        # Covered by idx_batches_location, already in GROUP BY order
+        status_placeholders = ", ".join("?" for _ in CLOSED_STATUSES)
+        cursor.execute(f'''
+            SELECT current_location, COUNT(*), SUM(current_quantity_kg)
+            FROM batches
+            WHERE status NOT IN ({status_placeholders})
+            GROUP BY current_location
+        ''', CLOSED_STATUSES)
+        rows = cursor.fetchall()
+        
+        conn.close()
+        
+        return {
+            "success": True,
+            "locations": {
+                location: {
+                    "batches": batch_count,
+                    "quantity_kg": round(quantity_kg or 0, 2)
+                }
+                for location, batch_count, quantity_kg in rows
+            },
+            "total_quantity_kg": round(sum(row[2] or 0 for row in rows), 2),
+            "generated_at": datetime.now().isoformat()
         }
 
+    def get_fleet_stage_dwell(self, since_days: Optional[int] = None) -> Dict:
+        """Average and maximum hours a batch stays in each stage before its next event
+        
+        A stage is the event type that opened it; the open stage of each batch
+        is not counted. These averages move slowly, so they are refreshed by
+        the cache TTL rather than invalidated on every event.
+        """
+        return self._fleet_aggregate(FLEET_STAGE_DWELL, (since_days,), self._query_stage_dwell)
+
+    def _query_stage_dwell(self, since_days: Optional[int]) -> Dict:
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        since_ts = _epoch_ms(datetime.now() - timedelta(days=since_days)) if since_days else 0
+        
+        # idx_batch_events_batch_ts delivers rows in window order, so no sort is needed
+        cursor.execute('''
+            SELECT event_type, COUNT(*), AVG(next_ts - ts), MAX(next_ts - ts)
+            FROM (
+                SELECT event_type, ts,
+                       LEAD(ts) OVER (PARTITION BY batch_id ORDER BY ts, event_id) AS next_ts
+                FROM batch_events
+                WHERE ts >= ?
+            )
+            WHERE next_ts IS NOT NULL
+            GROUP BY event_type
+        ''', (since_ts,))
+        rows = cursor.fetchall()
+        
+        conn.close()
+        
+        ms_per_hour = 3600 * 1000
+        return {
+            "success": True,
+            "stages": {
+                event_type: {
+                    "average_hours": round(average_ms / ms_per_hour, 2),
+                    "max_hours": round(max_ms / ms_per_hour, 2),
+                    "transitions": transitions
+                }
+                for event_type, transitions, average_ms, max_ms in rows
+            },
+            "since_days": since_days,
+            "generated_at": datetime.now().isoformat()
+        }
+
+    def get_temperature_excursions(self, active_only: bool = True, limit: int = 100) -> Dict:
+        """Batches with readings outside TEMPERATURE_RANGE_C, worst first"""
+        return self._fleet_aggregate(
+            FLEET_TEMPERATURE_EXCURSIONS, (active_only, limit), self._query_temperature_excursions
+        )
+
+    def _query_temperature_excursions(self, active_only: bool, limit: int) -> Dict:
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        low, high = TEMPERATURE_RANGE_C
+        status_filter = ""
+        params = [low, high]
+        if active_only:
+            status_filter = f"AND b.status NOT IN ({', '.join('?' for _ in CLOSED_STATUSES)})"
+            params.extend(CLOSED_STATUSES)
+        
+        # The OR is answered by two range scans on idx_batch_events_temperature;
+        # the unary + stops the planner from scanning every event in batch_id
+        # order just to avoid sorting the (few) excursion rows
+        cursor.execute(f'''
+            SELECT e.batch_id, b.status, b.current_location, COUNT(*),
+                   MIN(e.temperature), MAX(e.temperature), MAX(e.ts),
+                   COUNT(*) OVER ()
+            FROM batch_events e
+            JOIN batches b ON b.batch_id = e.batch_id
+            WHERE (e.temperature < ? OR e.temperature > ?) {status_filter}
+            GROUP BY +e.batch_id
+            ORDER BY COUNT(*) DESC, MAX(e.ts) DESC
+            LIMIT ?
+        ''', (*params, limit))
+        rows = cursor.fetchall()
+        
+        conn.close()
+        
+        return {
+            "success": True,
+            "temperature_range_c": list(TEMPERATURE_RANGE_C),
+            "batches_over_limit": rows[0][7] if rows else 0,
+            "batches": [
+                {
+                    "batch_id": batch_id,
+                    "status": status,
+                    "current_location": current_location,
+                    "excursion_count": excursion_count,
+                    "min_temperature": min_temperature,
+                    "max_temperature": max_temperature,
+                    "last_excursion": datetime.fromtimestamp(last_ts / 1000).isoformat()
+                }
+                for (batch_id, status, current_location, excursion_count,
+                     min_temperature, max_temperature, last_ts, _) in rows
+            ],
+            "generated_at": datetime.now().isoformat()
+        }
+
+    def get_fleet_dashboard(self) -> Dict:
+        """All fleet aggregates in one call, each served from its own cache entry"""
+        return {
+            "success": True,
+            "status_counts": self.get_fleet_status_counts(),
+            "inventory_by_location": self.get_fleet_inventory_by_location(),
+            "stage_dwell": self.get_fleet_stage_dwell(),
+            "temperature_excursions": self.get_temperature_excursions(),
+            "generated_at": datetime.now().isoformat()
+        }
+
+    def get_fleet_cache_stats(self) -> Dict:
+        """Hit-rate metrics for the fleet aggregate cache"""
+        if self.fleet_cache is None:
+            return {"enabled": False}
+        return {"enabled": True, **self.fleet_cache.get_stats()}
+
     def _analyze_temperature_data(self, events: List[Dict]) -> Dict:
         """Analyze temperature data from events"""
         temp_events = [e for e in events if e["temperature"] is not None]
@@ -671,6 +2249,212 @@ class BatchTracker:
         
         return recommendations
 
+class BufferedEventWriter:
+    """Group-commit writer for high-frequency batch events (e.g. reefer telemetry)
+    
+    Events are queued in memory and written by a background thread in one
+    transaction every ``flush_interval_ms`` or ``max_batch_events`` events,
+    whichever comes first. ``submit`` returns a Future that resolves to the
+    same result dict record_batch_event returns, once the event is committed.
+    Queued events are flushed on close() and at interpreter exit.
+    
+    When ``commit_executor`` is set, each transaction runs on that executor
+    instead of the writer's own thread, so an application with a single
+    writer thread (see AsyncBatchTracker) keeps one writer.
+    """
+    
+    def __init__(self, tracker: BatchTracker, flush_interval_ms: int = 100,
+                 max_batch_events: int = 1000, max_queue_size: int = 100000,
+                 commit_executor: Optional[Executor] = None):
+        self.tracker = tracker
+        self.commit_executor = commit_executor
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_batch_events = max_batch_events
+        self.max_queue_size = max_queue_size
+        
+        # Entries are (batch_id, event_data, recorded_at, future); flush markers
+        # carry no batch_id and resolve once everything before them is committed
+        self._queue: List[Tuple[Optional[str], Optional[Dict], Optional[datetime], Future]] = []
+        self._condition = threading.Condition()
+        self._pending_flushes = 0
+        self._oldest_enqueued = None
+        self._closed = False
+        
+        self._stats = {
+            "queue_depth": 0,
+            "events_written": 0,
+            "events_failed": 0,
+            "flush_count": 0,
+            "last_flush_size": 0,
+            "last_flush_ms": 0.0,
+            "max_flush_ms": 0.0,
+            "total_flush_ms": 0.0
+        }
+        
+        self._thread = threading.Thread(target=self._run, name="batch-event-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+    
+    def submit(self, batch_id: str, event_data: Dict) -> Future:
+        """Queue an event; the reading is timestamped now, not at flush time"""
+        future = Future()
+        recorded_at = datetime.now()
+        
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("BufferedEventWriter is closed")
+            
+            # Back-pressure: block the producer instead of growing without bound
+            while len(self._queue) >= self.max_queue_size and not self._closed:
+                self._condition.wait()
+            
+            if not self._queue:
+                self._oldest_enqueued = time.monotonic()
+            self._queue.append((batch_id, event_data, recorded_at, future))
+            self._stats["queue_depth"] += 1
+            
+            # Wake the writer to start the flush interval, or to flush a full batch
+            if len(self._queue) == 1 or len(self._queue) >= self.max_batch_events:
+                self._condition.notify_all()
+        
+        return future
+    
+    def flush(self) -> Future:
+        """Request an immediate flush; the Future resolves when all prior events are committed"""
+        future = Future()
+        with self._condition:
+            if self._closed and not self._thread.is_alive():
+                future.set_result(None)
+                return future
+            if not self._queue:
+                self._oldest_enqueued = time.monotonic()
+            self._queue.append((None, None, None, future))
+            self._pending_flushes += 1
+            self._condition.notify_all()
+        return future
+    
+    def close(self, timeout: Optional[float] = None):
+        """Stop accepting events and durably write everything still queued"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join(timeout)
+        atexit.unregister(self.close)
+    
+    def get_stats(self) -> Dict:
+        """Queue depth and flush latency counters"""
+        with self._condition:
+            stats = dict(self._stats)
+        stats["avg_flush_ms"] = round(stats["total_flush_ms"] / stats["flush_count"], 3) if stats["flush_count"] else 0.0
+        stats["total_flush_ms"] = round(stats["total_flush_ms"], 3)
+        return stats
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    def _run(self):
+        """Background loop: collect a batch, commit it, resolve its futures"""
+        while True:
+            with self._condition:
+                while not self._queue and not self._closed:
+                    self._condition.wait()
+                
+                if not self._queue and self._closed:
+                    return
+                
+                # Wait for the batch to fill, the interval to pass or a flush request
+                deadline = self._oldest_enqueued + self.flush_interval
+                while (len(self._queue) < self.max_batch_events
+                       and not self._pending_flushes and not self._closed):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                
+                batch = self._queue[:self.max_batch_events]
+                del self._queue[:self.max_batch_events]
+                self._pending_flushes -= sum(1 for entry in batch if entry[0] is None)
+                self._oldest_enqueued = time.monotonic() if self._queue else None
+                # Wake producers blocked on a full queue
+                self._condition.notify_all()
+            
+            self._commit(batch)
+    
+    def _commit(self, batch: List[Tuple]):
+        """Write a batch on commit_executor when one is set, otherwise on this thread
+        
+        Never raises: an unexpected error fails the batch's futures instead of
+        killing the writer thread and leaving callers waiting forever.
+        """
+        try:
+            executor = self.commit_executor
+            future = None
+            if executor is not None:
+                try:
+                    future = executor.submit(self._write_batch, batch)
+                except RuntimeError:
+                    # Executor already shut down (e.g. at interpreter exit): no other writer is left
+                    pass
+            if future is not None:
+                try:
+                    future.result()
+                    return
+                except CancelledError:
+                    # Cancelled by an executor shutdown before it ran; write it here
+                    pass
+            self._write_batch(batch)
+        except Exception as e:
+            logger.error(f"Buffered event commit failed: {str(e)}")
+            self._fail_batch(batch, e)
+    
+    @staticmethod
+    def _fail_batch(batch: List[Tuple], error: Exception):
+        """Fail every future in the batch that is not already resolved"""
+        for _, _, _, future in batch:
+            try:
+                future.set_exception(error)
+            except InvalidStateError:
+                pass
+    
+    def _write_batch(self, batch: List[Tuple]):
+        """Commit one batch of queued events and resolve their futures"""
+        entries = [(batch_id, event_data, recorded_at) for batch_id, event_data, recorded_at, _ in batch if batch_id is not None]
+        
+        started = time.perf_counter()
+        try:
+            results = self.tracker._record_events_bulk(entries) if entries else []
+        except Exception as e:
+            logger.error(f"Buffered write of {len(entries)} events failed: {str(e)}")
+            with self._condition:
+                self._stats["queue_depth"] -= len(entries)
+                self._stats["events_failed"] += len(entries)
+            self._fail_batch(batch, e)
+            return
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        
+        with self._condition:
+            self._stats["queue_depth"] -= len(entries)
+            self._stats["events_written"] += sum(1 for r in results if r["success"])
+            self._stats["events_failed"] += sum(1 for r in results if not r["success"])
+            if entries:
+                self._stats["flush_count"] += 1
+                self._stats["last_flush_size"] = len(entries)
+                self._stats["last_flush_ms"] = round(elapsed_ms, 3)
+                self._stats["max_flush_ms"] = round(max(self._stats["max_flush_ms"], elapsed_ms), 3)
+                self._stats["total_flush_ms"] += elapsed_ms
+        
+        result_iter = iter(results)
+        for batch_id, _, _, future in batch:
+            result = next(result_iter) if batch_id is not None else None
+            try:
+                future.set_result(result)
+            except InvalidStateError:
+                # Cancelled by the caller while queued; the event is still committed
+                pass
+
 # Example usage
 if __name__ == "__main__":
     # Initialize batch tracker
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+Batch Tracker Benchmark for BuryatMyasoprom
+Synthetic-load harness for batch_tracking.db latency and throughput
+"""
+
+import argparse
+import json
+import platform
+import random
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+import logging
+
+from batch_tracker import BatchTracker, SCHEMA_VERSION
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+PRODUCT_TYPES = [("BEEF", 0.55), ("LAMB", 0.25), ("HORSE", 0.15), ("POULTRY", 0.05)]
+
+FARMS = [f"Buryat Farm {number:03d}" for number in range(1, 41)]
+
+LOCATIONS = {
+    "QUALITY_CHECK": ["Processing Plant", "Veterinary Lab"],
+    "PROCESSING": ["Cutting Department", "Processing Plant"],
+    "PACKAGING": ["Packaging Line 1", "Packaging Line 2"],
+    "STORAGE": ["Ulan-Ude Cold Store", "Kyakhta Warehouse", "Zabaikalsk Warehouse"],
+    "SHIPMENT": ["Loading Dock", "Kyakhta Border Crossing", "Zabaikalsk Rail Terminal"],
+    "CUSTOMS": ["Erenhot Customs", "Manzhouli Customs"],
+    "DELIVERY": ["Beijing Distribution Center", "Harbin Distribution Center", "Shanghai Cold Chain Hub"],
+}
+
+# Lifecycle after PRODUCTION; STORAGE and QUALITY_CHECK repeat to fill M events
+LIFECYCLE = ["QUALITY_CHECK", "PROCESSING", "PACKAGING", "STORAGE", "SHIPMENT", "CUSTOMS", "DELIVERY"]
+REPEATED_EVENT_TYPES = [("STORAGE", 0.7), ("QUALITY_CHECK", 0.3)]
+
+# Share of cold-chain readings outside the -20..-15 °C range
+TEMPERATURE_EXCURSION_RATE = 0.02
+
+BULK_LOAD_CHUNK = 5000
+
+# Days from PRODUCTION to DELIVERY; loaded events are spread over this span
+BATCH_LIFETIME_DAYS = 30
+
+def _weighted_choice(rng: random.Random, choices: List) -> str:
+    values, weights = zip(*choices)
+    return rng.choices(values, weights=weights)[0]
+
+def _percentile(sorted_values: List[float], percent: float) -> float:
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(percent / 100 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+def summarize_latencies(latencies_ms: List[float], errors: int, wall_seconds: float) -> Dict:
+    """Percentiles (ms) and throughput (ops/s) for one measured operation"""
+    ordered = sorted(latencies_ms)
+    return {
+        "count": len(ordered),
+        "errors": errors,
+        "mean_ms": round(sum(ordered) / len(ordered), 3) if ordered else 0.0,
+        "p50_ms": round(_percentile(ordered, 50), 3),
+        "p90_ms": round(_percentile(ordered, 90), 3),
+        "p99_ms": round(_percentile(ordered, 99), 3),
+        "max_ms": round(ordered[-1], 3) if ordered else 0.0,
+        "wall_seconds": round(wall_seconds, 3),
+        "throughput_per_s": round(len(ordered) / wall_seconds, 1) if wall_seconds > 0 else 0.0
+    }
+
+class SyntheticWorkload:
+    """Deterministic generator of batch and event payloads"""
+
+    def __init__(self, seed: int = 42):
+        self.rng = random.Random(seed)
+
+    def batch_data(self) -> Dict:
+        production_date = datetime.now() - timedelta(days=self.rng.randint(1, 365))
+        return {
+            "product_type": _weighted_choice(self.rng, PRODUCT_TYPES),
+            "production_date": production_date.date().isoformat(),
+            "quantity_kg": round(self.rng.uniform(500, 20000), 1),
+            "origin_farm": self.rng.choice(FARMS),
+            "quality_grade": self.rng.choice(["A", "A", "B", "STANDARD"])
+        }
+
+    def temperature(self) -> float:
+        if self.rng.random() < TEMPERATURE_EXCURSION_RATE:
+            return round(self.rng.choice([self.rng.uniform(-25, -20.5), self.rng.uniform(-14.5, 4)]), 1)
+        return round(self.rng.gauss(-17.8, 0.9), 1)
+
+    def event_types(self, count: int) -> List[str]:
+        """A plausible lifecycle of ``count`` events after PRODUCTION"""
+        if count <= len(LIFECYCLE):
+            return LIFECYCLE[:count]
+        # Extra storage and inspection happen between packaging and shipment
+        middle = ["STORAGE"] + [
+            _weighted_choice(self.rng, REPEATED_EVENT_TYPES) for _ in range(count - len(LIFECYCLE))
+        ]
+        self.rng.shuffle(middle)
+        return LIFECYCLE[:3] + middle + LIFECYCLE[4:]
+
+    def event_data(self, event_type: str) -> Dict:
+        event = {
+            "event_type": event_type,
+            "location": self.rng.choice(LOCATIONS[event_type]),
+            "responsible_party": f"Operator {self.rng.randint(1, 200):03d}"
+        }
+        if event_type != "PROCESSING":
+            event["temperature"] = self.temperature()
+        if event_type == "QUALITY_CHECK":
+            event["quality_metrics"] = {
+                "bacterial_count": self.rng.randint(200, 5000),
+                "color_score": self.rng.randint(5, 10),
+                "ph": round(self.rng.gauss(5.7, 0.15), 2),
+                "fat_content_pct": round(self.rng.uniform(8, 25), 1)
+            }
+        if event_type in ("PROCESSING", "SHIPMENT"):
+            event["quantity_change_kg"] = -round(self.rng.uniform(10, 200), 1)
+        return event
+
+class BatchTrackerBenchmark:
+    def __init__(self, db_path: str, batches: int, events_per_batch: int,
+                 samples: int = 1000, writers: int = 4, seed: int = 42,
+                 with_qr: bool = False):
+        self.db_path = db_path
+        self.batches = batches
+        self.events_per_batch = events_per_batch
+        self.samples = samples
+        self.writers = writers
+        self.with_qr = with_qr
+        self.workload = SyntheticWorkload(seed)
+        self.tracker = BatchTracker(db_path)
+        self.batch_ids = []
+
+    def _measure(self, operation: Callable[[], Dict], count: int) -> Dict:
+        latencies = []
+        errors = 0
+        started = time.perf_counter()
+        for _ in range(count):
+            op_started = time.perf_counter()
+            result = operation()
+            latencies.append((time.perf_counter() - op_started) * 1000)
+            if not result.get("success"):
+                errors += 1
+        return summarize_latencies(latencies, errors, time.perf_counter() - started)
+
+    def populate(self) -> Dict:
+        """Create N batches through create_batch, then bulk-load their events"""
+        results = {}
+
+        def create():
+            result = self.tracker.create_batch(self.workload.batch_data(), generate_qr=self.with_qr)
+            if result.get("success"):
+                self.batch_ids.append(result["batch_id"])
+            return result
+
+        logger.info(f"Creating {self.batches} batches")
+        results["create_batch"] = self._measure(create, self.batches)
+
+        # The dataset is loaded through the group-commit path; per-event
+        # latency of record_batch_event is measured separately below
+        events_to_load = self.events_per_batch - 1  # PRODUCTION came from create_batch
+        # Every batch was created (and its PRODUCTION event stamped) before this
+        # point; the rest of its history follows over one lifetime, whatever M is
+        created_by = datetime.now()
+        mean_step = timedelta(days=BATCH_LIFETIME_DAYS) / max(events_to_load, 1)
+        entries = []
+        loaded = 0
+        started = time.perf_counter()
+        for batch_id in self.batch_ids:
+            recorded_at = created_by
+            for event_type in self.workload.event_types(events_to_load):
+                recorded_at += mean_step * self.workload.rng.uniform(0.5, 1.5)
+                entries.append((batch_id, self.workload.event_data(event_type), recorded_at))
+            if len(entries) >= BULK_LOAD_CHUNK:
+                loaded += self._bulk_load(entries)
+                entries = []
+        if entries:
+            loaded += self._bulk_load(entries)
+        elapsed = time.perf_counter() - started
+
+        results["bulk_load"] = {
+            "events": loaded,
+            "wall_seconds": round(elapsed, 3),
+            "throughput_per_s": round(loaded / elapsed, 1) if elapsed > 0 else 0.0
+        }
+        return results
+
+    def _bulk_load(self, entries: List) -> int:
+        results = self.tracker._record_events_bulk(entries)
+        loaded = sum(1 for result in results if result["success"])
+        logger.info(f"Loaded {loaded} events")
+        return loaded
+
+    def _random_event(self) -> Dict:
+        return self.workload.event_data(_weighted_choice(self.workload.rng, REPEATED_EVENT_TYPES))
+
+    def measure_writes(self) -> Dict:
+        """record_batch_event latency with one writer and with concurrent writers"""
+        results = {}
+        rng = self.workload.rng
+
+        results["record_batch_event"] = self._measure(
+            lambda: self.tracker.record_batch_event(rng.choice(self.batch_ids), self._random_event()),
+            self.samples
+        )
+
+        # Each writer thread gets its own tracker, as separate services would
+        per_writer = max(1, self.samples // self.writers)
+        payloads = [
+            [(rng.choice(self.batch_ids), self._random_event()) for _ in range(per_writer)]
+            for _ in range(self.writers)
+        ]
+        latencies = []
+        errors = [0]
+        lock = threading.Lock()
+
+        def writer(work: List):
+            tracker = BatchTracker(self.db_path)
+            local_latencies = []
+            local_errors = 0
+            for batch_id, event_data in work:
+                op_started = time.perf_counter()
+                result = tracker.record_batch_event(batch_id, event_data)
+                local_latencies.append((time.perf_counter() - op_started) * 1000)
+                if not result.get("success"):
+                    local_errors += 1
+            with lock:
+                latencies.extend(local_latencies)
+                errors[0] += local_errors
+
+        threads = [threading.Thread(target=writer, args=(work,)) for work in payloads]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        results[f"record_batch_event_concurrent_{self.writers}"] = summarize_latencies(
+            latencies, errors[0], time.perf_counter() - started
+        )
+        return results
+
+    def measure_reads(self) -> Dict:
+        """Read-path latencies over randomly sampled batches"""
+        rng = self.workload.rng
+        return {
+            "get_batch_info": self._measure(
+                lambda: self.tracker.get_batch_info(rng.choice(self.batch_ids)), self.samples
+            ),
+            "get_batch_timeline": self._measure(
+                lambda: self.tracker.get_batch_timeline(rng.choice(self.batch_ids)), self.samples
+            ),
+            "generate_batch_report": self._measure(
+                lambda: self.tracker.generate_batch_report(rng.choice(self.batch_ids)), self.samples
+            )
+        }
+
+    def run(self) -> Dict:
+        started_at = datetime.now()
+        results = self.populate()
+        if not self.batch_ids:
+            return {
+                "success": False,
+                "error": "No batches were created"
+            }
+        results.update(self.measure_writes())
+        results.update(self.measure_reads())
+
+        conn = sqlite3.connect(self.db_path)
+        total_events = conn.execute('SELECT COUNT(*) FROM batch_events').fetchone()[0]
+        conn.close()
+
+        return {
+            "success": True,
+            "config": {
+                "batches": self.batches,
+                "events_per_batch": self.events_per_batch,
+                "batch_lifetime_days": BATCH_LIFETIME_DAYS,
+                "samples": self.samples,
+                "writers": self.writers,
+                "with_qr": self.with_qr
+            },
+            "environment": {
+                "python": platform.python_version(),
+                "sqlite": sqlite3.sqlite_version,
+                "schema_version": SCHEMA_VERSION,
+                "platform": platform.platform()
+            },
+            "dataset": {
+                "batches": len(self.batch_ids),
+                "events": total_events,
+                "db_size_mb": round(Path(self.db_path).stat().st_size / 2**20, 1)
+            },
+            "results": results,
+            "started_at": started_at.isoformat(),
+            "duration_seconds": round((datetime.now() - started_at).total_seconds(), 1)
+        }
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Synthetic-load benchmark for BatchTracker")
+    parser.add_argument("--batches", type=int, default=1000, help="number of batches (N)")
+    parser.add_argument("--events-per-batch", type=int, default=10, help="events per batch (M)")
+    parser.add_argument("--samples", type=int, default=1000, help="measured operations per read/write benchmark")
+    parser.add_argument("--writers", type=int, default=4, help="threads in the concurrent writer benchmark")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--with-qr", action="store_true", help="render QR codes in create_batch")
+    parser.add_argument("--db-path", default=None, help="database file (default: fresh file under benchmarks/)")
+    parser.add_argument("--output", default=None, help="write JSON results to this file")
+    args = parser.parse_args(argv)
+
+    db_path = args.db_path or f"benchmarks/batch_tracking_{args.batches}x{args.events_per_batch}_{datetime.now():%Y%m%d_%H%M%S}.db"
+    benchmark = BatchTrackerBenchmark(
+        db_path, args.batches, args.events_per_batch,
+        samples=args.samples, writers=args.writers, seed=args.seed, with_qr=args.with_qr
+    )
+    results = benchmark.run()
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+        logger.info(f"Benchmark results written to {args.output}")
+    print(output)
+
+if __name__ == "__main__":
+    main()
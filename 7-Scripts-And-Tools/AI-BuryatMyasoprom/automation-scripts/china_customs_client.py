@@ -13,12 +13,25 @@ from typing import Dict, List, Optional
 import logging
 from dataclasses import dataclass
 import asyncio
+import time
 import aiohttp
 import xml.etree.ElementTree as ET
+import re
+import threading
+
+from customs_resilience import CircuitBreaker, RetryBudget, RetryPolicy, RETRY_STATUS_CODES
+from customs_rate_limiter import CustomsRateLimiter
+from customs_payload import CanonicalEncoder
+from regulation_cache import RegulationCache
+from customs_validation import DocumentValidationEngine, HS_CODE_PATTERN
+from customs_attachments import ATTACHMENT_CHUNK_SIZE, MultipartFileStream, attachment_metadata
+from customs_metrics import CustomsMetrics, DEFAULT_LATENCY_BUCKETS
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+_HS_CODE_RE = re.compile(HS_CODE_PATTERN)
+
 @dataclass
 class CustomsSubmission:
     submission_id: str
@@ -27,12 +40,35 @@ class CustomsSubmission:
     submitted_at: datetime
     customs_reference: Optional[str] = None
 
+class _AsyncResponse:
+    """Buffered aiohttp response with the requests.Response attributes the client reads"""
+    
+    def __init__(self, status_code: int, headers: Dict, content: bytes):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+    
+    @property
+    def text(self) -> str:
+        return self.content.decode('utf-8', errors='replace')
+    
+    def json(self):
+        return json.loads(self.content)
+
 class ChinaCustomsClient:
     def __init__(self, config_path: str = "config/customs_config.json"):
         self.config = self._load_config(config_path)
         self.session = requests.Session()
         self.base_url = self.config["api"]["base_url"]
         self._setup_authentication()
+        submission_config = self.config["submission"]
+        self.encoder = CanonicalEncoder(submission_config["json_backend"])
+        self.regulation_cache = self._setup_regulation_cache()
+        self.validation_engine = DocumentValidationEngine()
+        # Created on first async call, inside the running event loop
+        self._async_session = None
+        self._setup_resilience()
+        self._setup_metrics()
     
     def _load_config(self, config_path: str) -> Dict:
         """Load customs integration configuration"""
@@ -41,7 +77,10 @@ class ChinaCustomsClient:
                 "base_url": "https://customs.china.gov/api/v1",
                 "timeout": 30,
                 "retry_attempts": 3,
-                "retry_delay": 5
+                "retry_delay": 5,
+                "max_connections": 100,
+                "max_connections_per_host": 20,
+                "keepalive_timeout": 30
             },
             "authentication": {
                 "method": "api_key",
@@ -51,7 +90,46 @@ class ChinaCustomsClient:
             "submission": {
                 "max_documents_per_request": 10,
                 "supported_formats": ["JSON", "XML"],
-                "compression_enabled": True
+                "compression_enabled": True,
+                "json_backend": "json"  # or "orjson": faster, but every signer must use the same backend
+            },
+            "attachments": {
+                "chunk_size": ATTACHMENT_CHUNK_SIZE,  # bytes read from disk per chunk
+                "max_concurrent_uploads": 4  # async path; the sync path uploads one at a time
+            },
+            "resilience": {
+                "max_retry_delay": 60,
+                "retry_budget_ratio": 0.2,
+                "retry_budget_min_retries": 3,
+                "retry_budget_window": 10,
+                "circuit_failure_threshold": 5,
+                "circuit_reset_timeout": 30
+            },
+            "rate_limits": {
+                # Off until the gateway's published limits are configured
+                "enabled": False,
+                "backend": "memory",  # "sqlite" shares the buckets between processes
+                "db_path": "data/customs_rate_limits.db",
+                "min_rate_fraction": 0.05,
+                "decrease_factor": 0.5,
+                "increase_fraction": 0.005,
+                # Requests per second and burst size per endpoint, e.g.
+                # {"POST /submissions": {"rate": 2, "burst": 5}}; unlisted endpoints are not limited
+                "endpoints": {}
+            },
+            "regulation_cache": {
+                "enabled": True,
+                "cache_dir": "data/regulation_cache",
+                "default_max_age": 300,  # used when the gateway sends no Cache-Control max-age
+                "stale_while_revalidate": 0,  # seconds a stale copy may be served while refreshing
+                "max_stale_on_error": 86400,
+                "max_entries": 256,  # cache files kept; the oldest are deleted first
+                "max_entry_age": 604800,  # seconds before an unused file is deleted
+                "since_granularity": 3600  # last_check is rounded down to this many seconds
+            },
+            "metrics": {
+                "enabled": True,  # when False every recording call is a no-op
+                "latency_buckets": list(DEFAULT_LATENCY_BUCKETS)  # seconds
             },
             "monitoring": {
                 "status_check_interval": 300,  # 5 minutes
@@ -76,29 +154,186 @@ class ChinaCustomsClient:
     
     def _setup_authentication(self):
         """Setup authentication headers"""
+        self.session.headers.update(self._default_headers())
+    
+    def _setup_regulation_cache(self) -> Optional[RegulationCache]:
+        cache_config = self.config["regulation_cache"]
+        if not cache_config["enabled"]:
+            return None
+        return RegulationCache(
+            cache_config["cache_dir"],
+            default_max_age=cache_config["default_max_age"],
+            stale_while_revalidate=cache_config["stale_while_revalidate"],
+            max_stale_on_error=cache_config["max_stale_on_error"],
+            max_entries=cache_config["max_entries"],
+            max_entry_age=cache_config["max_entry_age"]
+        )
+    
+    def _setup_resilience(self):
+        """Retry policy, per-endpoint retry budgets and rate limits, and the gateway circuit breaker"""
+        api_config = self.config["api"]
+        resilience_config = self.config["resilience"]
+        
+        self.retry_policy = RetryPolicy(
+            max_retries=api_config["retry_attempts"],
+            base_delay=api_config["retry_delay"],
+            max_delay=resilience_config["max_retry_delay"]
+        )
+        # One breaker for the gateway: when it is down, every endpoint is
+        self.circuit_breaker = CircuitBreaker(
+            self.base_url,
+            failure_threshold=resilience_config["circuit_failure_threshold"],
+            reset_timeout=resilience_config["circuit_reset_timeout"]
+        )
+        self._retry_budgets = {}
+        self._retry_budgets_lock = threading.Lock()
+        self.rate_limiter = CustomsRateLimiter(self.config["rate_limits"])
+    
+    def _setup_metrics(self):
+        """Request metrics; resilience state is read when a snapshot is taken"""
+        metrics_config = self.config["metrics"]
+        self.metrics = CustomsMetrics(metrics_config["enabled"], metrics_config["latency_buckets"])
+        self.metrics.add_collector(self._resilience_metric_samples)
+    
+    def _resilience_metric_samples(self) -> List:
+        """Circuit breaker, retry budget and rate limit samples for CustomsMetrics"""
+        breaker = self.circuit_breaker.get_stats()
+        samples = [
+            ("customs_circuit_breaker_state", "gauge", "1 for the current circuit breaker state",
+             {"state": state}, 1 if breaker["state"] == state else 0)
+            for state in (CircuitBreaker.CLOSED, CircuitBreaker.OPEN, CircuitBreaker.HALF_OPEN)
+        ]
+        samples.append(("customs_circuit_breaker_opened_total", "counter",
+                        "Times the gateway circuit opened", {}, breaker["opened"]))
+        samples.append(("customs_circuit_breaker_rejected_total", "counter",
+                        "Calls rejected while the circuit was open", {}, breaker["rejected"]))
+        
+        with self._retry_budgets_lock:
+            budgets = dict(self._retry_budgets)
+        for endpoint, budget in sorted(budgets.items()):
+            samples.append(("customs_retry_budget_exhausted_total", "counter",
+                            "Retries refused because the endpoint's retry budget was spent",
+                            {"endpoint": endpoint}, budget.get_stats()["exhausted_count"]))
+        
+        for endpoint, bucket_stats in sorted(self.rate_limiter.get_stats().items()):
+            samples.append(("customs_rate_limit_requests_per_second", "gauge",
+                            "Current client-side rate limit per endpoint", {"endpoint": endpoint}, bucket_stats["rate"]))
+        return samples
+    
+    def get_metrics_text(self) -> str:
+        """Prometheus text-format snapshot of request latency, retries and resilience state"""
+        return self.metrics.render_prometheus()
+    
+    def _retry_budget(self, endpoint: str) -> RetryBudget:
+        with self._retry_budgets_lock:
+            budget = self._retry_budgets.get(endpoint)
+            if budget is None:
+                resilience_config = self.config["resilience"]
+                budget = RetryBudget(
+                    ratio=resilience_config["retry_budget_ratio"],
+                    min_retries=resilience_config["retry_budget_min_retries"],
+                    window_seconds=resilience_config["retry_budget_window"]
+                )
+                self._retry_budgets[endpoint] = budget
+            return budget
+    
+    def _record_gateway_outcome(self, status_code: int):
+        """Feed the breaker: 5xx counts as the gateway failing, anything else (even 429) as alive"""
+        if status_code >= 500:
+            self.circuit_breaker.record_failure()
+        else:
+            self.circuit_breaker.record_success()
+    
+    def _retry_delay(self, endpoint: str, attempt: int, status_code: Optional[int] = None,
+                     headers: Optional[Dict] = None) -> Optional[float]:
+        """Seconds to wait before retry number attempt + 1, or None to give up"""
+        if attempt >= self.retry_policy.max_retries:
+            return None
+        if not self._retry_budget(endpoint).try_acquire_retry():
+            logger.warning(f"Retry budget exhausted for {endpoint}, not retrying")
+            self.metrics.record_retry_denied(endpoint)
+            return None
+        return self.retry_policy.delay_for(attempt, status_code, headers)
+    
+    def get_resilience_stats(self) -> Dict:
+        """Circuit breaker state and per-endpoint retry budget and rate limit usage"""
+        with self._retry_budgets_lock:
+            budgets = dict(self._retry_budgets)
+        return {
+            "circuit_breaker": self.circuit_breaker.get_stats(),
+            "retry_budgets": {endpoint: budget.get_stats() for endpoint, budget in budgets.items()},
+            "rate_limits": self.rate_limiter.get_stats()
+        }
+    
+    def _default_headers(self) -> Dict:
+        """Authentication and common headers shared by the sync and async transports"""
         auth_config = self.config["authentication"]
+        headers = {}
         
         if auth_config["method"] == "api_key":
             api_key = self.config.get("credentials", {}).get("api_key")
             if api_key:
-                self.session.headers.update({
-                    auth_config["key_header"]: api_key
-                })
+                headers[auth_config["key_header"]] = api_key
         
         # Common headers for all requests
-        self.session.headers.update({
+        headers.update({
             "Content-Type": "application/json",
             "User-Agent": "BuryatMyasoprom-Export-System/1.0",
             "Accept": "application/json"
         })
+        return headers
+    
+    def _signature_headers(self, data_string) -> Dict:
+        """Per-request signature headers; never stored on the shared session
+
+        data_string is the exact request body, as str or bytes.
+        """
+        if not self.config["authentication"]["signature_required"]:
+            return {}
+        
+        timestamp = datetime.utcnow().isoformat()
+        return {
+            "X-Timestamp": timestamp,
+            "X-Signature": self._generate_signature(data_string, timestamp)
+        }
+    
+    async def _get_async_session(self) -> aiohttp.ClientSession:
+        """Shared aiohttp session with pooled keep-alive connections"""
+        if self._async_session is None or self._async_session.closed:
+            api_config = self.config["api"]
+            connector = aiohttp.TCPConnector(
+                limit=api_config["max_connections"],
+                limit_per_host=api_config["max_connections_per_host"],
+                keepalive_timeout=api_config["keepalive_timeout"],
+                ttl_dns_cache=300
+            )
+            self._async_session = aiohttp.ClientSession(
+                connector=connector,
+                headers=self._default_headers(),
+                timeout=aiohttp.ClientTimeout(total=api_config["timeout"])
+            )
+        return self._async_session
+    
+    async def close(self):
+        """Close the async session and its pooled connections"""
+        if self._async_session is not None and not self._async_session.closed:
+            await self._async_session.close()
+        self._async_session = None
+    
+    async def __aenter__(self):
+        return self
     
-    def _generate_signature(self, data: str, timestamp: str) -> str:
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+    
+    def _generate_signature(self, data, timestamp: str) -> str:
         """Generate HMAC signature for request authentication"""
         secret_key = self.config.get("credentials", {}).get("secret_key", "")
-        message = f"{timestamp}{data}"
+        if isinstance(data, str):
+            data = data.encode('utf-8')
         signature = hmac.new(
             secret_key.encode('utf-8'),
-            message.encode('utf-8'),
+            timestamp.encode('utf-8') + data,
             hashlib.sha256
         ).hexdigest()
         return signature
@@ -108,45 +343,29 @@ class ChinaCustomsClient:
         if not documents:
             return {"success": False, "error": "No documents provided"}
         
-        # Prepare submission data
-        submission_data = self._prepare_submission_data(documents, order_data)
-        
-        # Generate request signature if required
-        if self.config["authentication"]["signature_required"]:
-            timestamp = datetime.utcnow().isoformat()
-            data_string = json.dumps(submission_data, sort_keys=True)
-            signature = self._generate_signature(data_string, timestamp)
-            
-            self.session.headers.update({
-                "X-Timestamp": timestamp,
-                "X-Signature": signature
-            })
+        # File-backed documents are streamed first and referenced in the JSON
+        documents, upload_error = self._upload_attachments(documents)
+        if upload_error is not None:
+            return upload_error
         
         try:
+            # Prepare submission data and encode it once; these exact bytes are signed and sent
+            submission_data = self._prepare_submission_data(documents, order_data)
+            body = self.encoder.encode_submission(submission_data)
+            
+            # Signature headers go on this request only, so concurrent submissions
+            # cannot overwrite each other's signature on the shared session
+            headers = self._signature_headers(body)
+            
             # Submit to customs API
             response = self._make_retry_request(
                 "POST",
                 f"{self.base_url}/submissions",
-                json=submission_data
+                endpoint="POST /submissions",
+                data=body,
+                headers=headers
             )
-            
-            if response.status_code == 202:
-                submission_result = response.json()
-                return {
-                    "success": True,
-                    "submission_id": submission_result.get("submission_id"),
-                    "customs_reference": submission_result.get("customs_reference"),
-                    "status": submission_result.get("status", "SUBMITTED"),
-                    "estimated_processing_time": submission_result.get("estimated_processing_time"),
-                    "message": submission_result.get("message", "Documents submitted successfully")
-                }
-            else:
-                error_detail = self._parse_error_response(response)
-                return {
-                    "success": False,
-                    "error": f"Submission failed with status {response.status_code}",
-                    "error_detail": error_detail
-                }
+            return self._submission_result(response)
                 
         except Exception as e:
             logger.error(f"Document submission failed: {str(e)}")
@@ -155,6 +374,209 @@ class ChinaCustomsClient:
                 "error": f"Submission error: {str(e)}"
             }
     
+    async def submit_documents_async(self, documents: List[Dict], order_data: Dict) -> Dict:
+        """Submit documents to China Customs without blocking the event loop"""
+        if not documents:
+            return {"success": False, "error": "No documents provided"}
+        
+        documents, upload_error = await self._upload_attachments_async(documents)
+        if upload_error is not None:
+            return upload_error
+        
+        try:
+            body = self.encoder.encode_submission(self._prepare_submission_data(documents, order_data))
+        except (TypeError, ValueError) as e:
+            logger.error(f"Document submission failed: {str(e)}")
+            return {
+                "success": False,
+                "error": f"Submission error: {str(e)}"
+            }
+        
+        result = await self.submit_prepared_async(body)
+        result.pop("status_code", None)
+        return result
+
+    async def submit_prepared_async(self, body, idempotency_key: Optional[str] = None) -> Dict:
+        """POST an already encoded submission (str or bytes), signing exactly that body
+
+        Used by submit_documents_async and CustomsOutbox to deliver queued submissions. The
+        Idempotency-Key header lets the gateway discard repeats of a delivery
+        that succeeded but whose response was lost. The result carries
+        status_code (None on transport errors) so callers can decide whether
+        to retry.
+        """
+        headers = self._signature_headers(body)
+        if idempotency_key:
+            headers["Idempotency-Key"] = idempotency_key
+
+        try:
+            response = await self._make_async_retry_request(
+                "POST",
+                f"{self.base_url}/submissions",
+                endpoint="POST /submissions",
+                data=body.encode('utf-8') if isinstance(body, str) else body,
+                headers=headers
+            )
+        except Exception as e:
+            logger.error(f"Prepared submission failed: {str(e)}")
+            return {
+                "success": False,
+                "error": f"Submission error: {str(e)}",
+                "status_code": None
+            }
+
+        result = self._submission_result(response)
+        result["status_code"] = response.status_code
+        return result
+
+    def upload_attachment(self, document: Dict) -> Dict:
+        """Stream a file-backed document to the gateway as a chunked multipart upload
+        
+        document needs "file_path"; "type" and "description" travel in the
+        metadata part. The file is read from disk in fixed-size chunks and
+        hashed while it is sent, so memory use does not grow with the file.
+        The result carries the attachment reference for the submission JSON.
+        """
+        try:
+            stream, headers = self._attachment_stream(document)
+            response = self._make_retry_request(
+                "POST",
+                f"{self.base_url}/attachments",
+                endpoint="POST /attachments",
+                data=stream,
+                headers=headers
+            )
+            return self._attachment_result(response, stream)
+        
+        except Exception as e:
+            logger.error(f"Attachment upload failed: {str(e)}")
+            return {
+                "success": False,
+                "error": f"Attachment upload error: {str(e)}"
+            }
+    
+    async def upload_attachment_async(self, document: Dict) -> Dict:
+        """Async counterpart of upload_attachment; disk reads run off the event loop"""
+        api_timeout = self.config["api"]["timeout"]
+        try:
+            stream, headers = self._attachment_stream(document)
+            response = await self._make_async_retry_request(
+                "POST",
+                f"{self.base_url}/attachments",
+                endpoint="POST /attachments",
+                data=stream,
+                headers=headers,
+                # Large uploads outlast the session's total timeout; bound each socket operation instead
+                timeout=aiohttp.ClientTimeout(total=None, sock_connect=api_timeout, sock_read=api_timeout)
+            )
+            return self._attachment_result(response, stream)
+        
+        except Exception as e:
+            logger.error(f"Attachment upload failed: {str(e)}")
+            return {
+                "success": False,
+                "error": f"Attachment upload error: {str(e)}"
+            }
+    
+    def _attachment_stream(self, document: Dict):
+        """Multipart body and headers for one upload
+        
+        The body cannot be signed up front without reading the file twice,
+        so the signature is a trailing part over the metadata and the
+        SHA-256 computed while streaming, keyed by the X-Timestamp header.
+        """
+        headers = {}
+        sign = None
+        if self.config["authentication"]["signature_required"]:
+            timestamp = datetime.utcnow().isoformat()
+            headers["X-Timestamp"] = timestamp
+            sign = lambda data: self._generate_signature(data, timestamp)
+        
+        stream = MultipartFileStream(document["file_path"], attachment_metadata(document), sign,
+                                     self.config["attachments"]["chunk_size"])
+        headers["Content-Type"] = stream.content_type
+        return stream, headers
+    
+    def _attachment_result(self, response, stream: MultipartFileStream) -> Dict:
+        """Build the upload_attachment result from a sync or async response"""
+        if response.status_code == 201:
+            upload_result = response.json()
+            if upload_result.get("sha256") != stream.sha256:
+                return {
+                    "success": False,
+                    "error": "Attachment checksum mismatch",
+                    "error_detail": {"sent": stream.sha256, "received": upload_result.get("sha256")}
+                }
+            return {
+                "success": True,
+                "attachment_id": upload_result.get("attachment_id"),
+                "filename": stream.filename,
+                "size_bytes": stream.size_bytes,
+                "checksum": stream.sha256
+            }
+        else:
+            error_detail = self._parse_error_response(response)
+            return {
+                "success": False,
+                "error": f"Attachment upload failed with status {response.status_code}",
+                "error_detail": error_detail
+            }
+    
+    def _with_attachment(self, document: Dict, upload_result: Dict) -> Dict:
+        reference = {key: upload_result[key] for key in ("attachment_id", "filename", "size_bytes", "checksum")}
+        return {**document, "attachment": reference}
+    
+    def _upload_attachments(self, documents: List[Dict]):
+        """Upload file-backed documents not uploaded yet; returns (documents, error result)"""
+        prepared = []
+        for doc in documents:
+            if "file_path" in doc and "attachment" not in doc:
+                result = self.upload_attachment(doc)
+                if not result["success"]:
+                    return None, result
+                doc = self._with_attachment(doc, result)
+            prepared.append(doc)
+        return prepared, None
+    
+    async def _upload_attachments_async(self, documents: List[Dict]):
+        """Async _upload_attachments with at most max_concurrent_uploads streams at once"""
+        semaphore = asyncio.Semaphore(self.config["attachments"]["max_concurrent_uploads"])
+        
+        async def upload(doc: Dict):
+            if "file_path" not in doc or "attachment" in doc:
+                return doc, None
+            async with semaphore:
+                result = await self.upload_attachment_async(doc)
+            if not result["success"]:
+                return None, result
+            return self._with_attachment(doc, result), None
+        
+        outcomes = await asyncio.gather(*[upload(doc) for doc in documents])
+        for _, error in outcomes:
+            if error is not None:
+                return None, error
+        return [doc for doc, _ in outcomes], None
+    
+    def _submission_result(self, response) -> Dict:
+        """Build the submit_documents result from a sync or async response"""
+        if response.status_code == 202:
+            submission_result = response.json()
+            return {
+                "success": True,
+                "submission_id": submission_result.get("submission_id"),
+                "customs_reference": submission_result.get("customs_reference"),
+                "status": submission_result.get("status", "SUBMITTED"),
+                "estimated_processing_time": submission_result.get("estimated_processing_time"),
+                "message": submission_result.get("message", "Documents submitted successfully")
+            }
+        else:
+            error_detail = self._parse_error_response(response)
+            return {
+                "success": False,
+                "error": f"Submission failed with status {response.status_code}",
+                "error_detail": error_detail
+            }
+    
     def _prepare_submission_data(self, documents: List[Dict], order_data: Dict) -> Dict:
         """Prepare data for customs submission"""
         submission_data = {
@@ -196,13 +618,25 @@ class ChinaCustomsClient:
                 "origin": "RUSSIA"
             })
         
-        # Add documents
+        # Add documents; encode_submission fills in each checksum from the exact bytes it sends
         for doc in documents:
+            attachment = doc.get("attachment")
+            if attachment is not None:
+                # Uploaded separately by upload_attachment; only the reference goes in the JSON
+                submission_data["documents"].append({
+                    "type": doc.get("type"),
+                    "format": "ATTACHMENT",
+                    **attachment
+                })
+                continue
+            if "file_path" in doc:
+                raise ValueError(f"Document {doc['file_path']} must be uploaded with upload_attachment first")
+            
+            content = doc.get("content", {})
             submission_data["documents"].append({
                 "type": doc.get("type"),
-                "content": doc.get("content", {}),
-                "format": "JSON",
-                "checksum": self._calculate_checksum(json.dumps(doc.get("content", {})))
+                "content": content,
+                "format": "JSON"
             })
         
         return submission_data
@@ -217,39 +651,111 @@ class ChinaCustomsClient:
         }
         return hs_codes.get(meat_type.upper(), "0201.10")
     
-    def _calculate_checksum(self, data: str) -> str:
-        """Calculate SHA-256 checksum for data validation"""
-        return hashlib.sha256(data.encode('utf-8')).hexdigest()
-    
-    def _make_retry_request(self, method: str, url: str, **kwargs) -> requests.Response:
-        """Make request with retry logic"""
-        max_retries = self.config["api"]["retry_attempts"]
-        retry_delay = self.config["api"]["retry_delay"]
+    def _make_retry_request(self, method: str, url: str, endpoint: Optional[str] = None,
+                            **kwargs) -> requests.Response:
+        """Make request with rate limiting, backoff, retry budget and circuit breaker
+        
+        Raises CircuitOpenError without touching the network while the
+        gateway circuit is open. Every attempt, retries included, waits for
+        a token from the endpoint's rate limit bucket and is timed in
+        self.metrics.
+        """
+        endpoint = endpoint or f"{method} {url}"
+        kwargs.setdefault("timeout", self.config["api"]["timeout"])
+        self._retry_budget(endpoint).record_request()
+        attempt = 0
         
-        for attempt in range(max_retries + 1):
+        while True:
+            self.circuit_breaker.before_call()
+            outcome_recorded = False
             try:
-                response = self.session.request(method, url, **kwargs)
-                
-                # Retry on server errors (5xx) or rate limiting (429)
-                if response.status_code in [429, 500, 502, 503, 504]:
-                    if attempt < max_retries:
-                        logger.warning(f"Request failed with status {response.status_code}, retrying in {retry_delay}s...")
-                        asyncio.sleep(retry_delay)
-                        continue
-                
-                return response
-                
+                self.rate_limiter.acquire(endpoint)
+                with self.metrics.track(endpoint, attempt) as timer:
+                    response = self.session.request(method, url, **kwargs)
+                    timer.status(response.status_code)
+                self._record_gateway_outcome(response.status_code)
+                outcome_recorded = True
             except requests.exceptions.RequestException as e:
-                if attempt < max_retries:
-                    logger.warning(f"Request exception: {str(e)}, retrying in {retry_delay}s...")
-                    asyncio.sleep(retry_delay)
-                else:
+                self.circuit_breaker.record_failure()
+                outcome_recorded = True
+                delay = self._retry_delay(endpoint, attempt)
+                if delay is None:
                     raise e
+                logger.warning(f"Request exception: {str(e)}, retrying in {delay:.1f}s...")
+                self.metrics.record_retry(endpoint, "error")
+                time.sleep(delay)
+                attempt += 1
+                continue
+            finally:
+                if not outcome_recorded:
+                    # Interrupted before the gateway answered: free a half-open probe slot
+                    self.circuit_breaker.release()
+            
+            self.rate_limiter.observe(endpoint, response.status_code, response.headers)
+            
+            # Retry on server errors (5xx) or rate limiting (429)
+            if response.status_code in RETRY_STATUS_CODES:
+                delay = self._retry_delay(endpoint, attempt, response.status_code, response.headers)
+                if delay is not None:
+                    logger.warning(f"Request failed with status {response.status_code}, retrying in {delay:.1f}s...")
+                    self.metrics.record_retry(endpoint, response.status_code)
+                    time.sleep(delay)
+                    attempt += 1
+                    continue
+            
+            return response
+    
+    async def _make_async_retry_request(self, method: str, url: str, endpoint: Optional[str] = None,
+                                        **kwargs) -> _AsyncResponse:
+        """Async counterpart of _make_retry_request over the shared aiohttp session"""
+        endpoint = endpoint or f"{method} {url}"
+        session = await self._get_async_session()
+        self._retry_budget(endpoint).record_request()
+        attempt = 0
         
-        # This should never be reached due to the exception handling above
-        raise Exception("Max retries exceeded")
+        while True:
+            self.circuit_breaker.before_call()
+            outcome_recorded = False
+            try:
+                await self.rate_limiter.acquire_async(endpoint)
+                with self.metrics.track(endpoint, attempt) as timer:
+                    async with session.request(method, url, **kwargs) as response:
+                        # Read the body before the connection goes back to the pool
+                        content = await response.read()
+                        buffered = _AsyncResponse(response.status, dict(response.headers), content)
+                    timer.status(buffered.status_code)
+                self._record_gateway_outcome(buffered.status_code)
+                outcome_recorded = True
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self.circuit_breaker.record_failure()
+                outcome_recorded = True
+                delay = self._retry_delay(endpoint, attempt)
+                if delay is None:
+                    raise e
+                logger.warning(f"Request exception: {str(e)}, retrying in {delay:.1f}s...")
+                self.metrics.record_retry(endpoint, "error")
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            finally:
+                if not outcome_recorded:
+                    # Cancelled (e.g. by wait_for) before the gateway answered: free a half-open probe slot
+                    self.circuit_breaker.release()
+            
+            self.rate_limiter.observe(endpoint, buffered.status_code, buffered.headers)
+            
+            if buffered.status_code in RETRY_STATUS_CODES:
+                delay = self._retry_delay(endpoint, attempt, buffered.status_code, buffered.headers)
+                if delay is not None:
+                    logger.warning(f"Request failed with status {buffered.status_code}, retrying in {delay:.1f}s...")
+                    self.metrics.record_retry(endpoint, buffered.status_code)
+                    await asyncio.sleep(delay)
+                    attempt += 1
+                    continue
+            
+            return buffered
     
-    def _parse_error_response(self, response: requests.Response) -> Dict:
+    def _parse_error_response(self, response) -> Dict:
         """Parse error response from customs API"""
         try:
             error_data = response.json()
@@ -271,27 +777,10 @@ class ChinaCustomsClient:
         try:
             response = self._make_retry_request(
                 "GET",
-                f"{self.base_url}/submissions/{submission_id}"
+                f"{self.base_url}/submissions/{submission_id}",
+                endpoint="GET /submissions/{id}"
             )
-            
-            if response.status_code == 200:
-                status_data = response.json()
-                return {
-                    "success": True,
-                    "submission_id": submission_id,
-                    "status": status_data.get("status"),
-                    "customs_reference": status_data.get("customs_reference"),
-                    "last_updated": status_data.get("last_updated"),
-                    "estimated_completion": status_data.get("estimated_completion"),
-                    "issues": status_data.get("issues", []),
-                    "actions_required": status_data.get("actions_required", [])
-                }
-            else:
-                return {
-                    "success": False,
-                    "error": f"Status check failed with status {response.status_code}",
-                    "error_detail": self._parse_error_response(response)
-                }
+            return self._status_result(submission_id, response)
                 
         except Exception as e:
             return {
@@ -299,13 +788,50 @@ class ChinaCustomsClient:
                 "error": f"Status check error: {str(e)}"
             }
     
+    async def check_submission_status_async(self, submission_id: str) -> Dict:
+        """Check status of a customs submission without blocking the event loop"""
+        try:
+            response = await self._make_async_retry_request(
+                "GET",
+                f"{self.base_url}/submissions/{submission_id}",
+                endpoint="GET /submissions/{id}"
+            )
+            return self._status_result(submission_id, response)
+                
+        except Exception as e:
+            return {
+                "success": False,
+                "error": f"Status check error: {str(e)}"
+            }
+    
+    def _status_result(self, submission_id: str, response) -> Dict:
+        """Build the check_submission_status result from a sync or async response"""
+        if response.status_code == 200:
+            status_data = response.json()
+            return {
+                "success": True,
+                "submission_id": submission_id,
+                "status": status_data.get("status"),
+                "customs_reference": status_data.get("customs_reference"),
+                "last_updated": status_data.get("last_updated"),
+                "estimated_completion": status_data.get("estimated_completion"),
+                "issues": status_data.get("issues", []),
+                "actions_required": status_data.get("actions_required", [])
+            }
+        else:
+            return {
+                "success": False,
+                "error": f"Status check failed with status {response.status_code}",
+                "error_detail": self._parse_error_response(response)
+            }
+    
     async def monitor_submission(self, submission_id: str) -> Dict:
         """Monitor submission status until completion"""
         max_checks = self.config["monitoring"]["max_status_checks"]
         check_interval = self.config["monitoring"]["status_check_interval"]
         
         for check_count in range(max_checks):
-            status_result = self.check_submission_status(submission_id)
+            status_result = await self.check_submission_status_async(submission_id)
             
             if not status_result["success"]:
                 return status_result
@@ -337,32 +863,55 @@ class ChinaCustomsClient:
         }
     
     def get_regulation_updates(self, last_check: Optional[datetime] = None) -> List[Dict]:
-        """Get latest regulation updates from China Customs"""
-        params = {}
-        if last_check:
-            params["since"] = last_check.isoformat()
+        """Get latest regulation updates from China Customs
+        
+        Served from the regulation cache when enabled: a fresh copy costs no
+        request and a stale one is revalidated with If-None-Match.
+        """
+        params = self._regulation_params(last_check)
+        url = f"{self.base_url}/regulations"
+        
+        def send(conditional_headers: Dict):
+            return self._make_retry_request(
+                "GET",
+                url,
+                endpoint="GET /regulations",
+                params=params,
+                headers=conditional_headers
+            )
         
         try:
-            response = self._make_retry_request(
+            if self.regulation_cache is None:
+                return self._regulation_result(send({}))
+            response, cache_status = self.regulation_cache.fetch(url, params, send)
+            return {**self._regulation_result(response), "cache_status": cache_status}
+                
+        except Exception as e:
+            return {
+                "success": False,
+                "error": f"Regulation fetch error: {str(e)}",
+                "updates": []
+            }
+    
+    async def get_regulation_updates_async(self, last_check: Optional[datetime] = None) -> Dict:
+        """Get latest regulation updates without blocking the event loop"""
+        params = self._regulation_params(last_check)
+        url = f"{self.base_url}/regulations"
+        
+        async def send(conditional_headers: Dict):
+            return await self._make_async_retry_request(
                 "GET",
-                f"{self.base_url}/regulations",
-                params=params
+                url,
+                endpoint="GET /regulations",
+                params=params,
+                headers=conditional_headers
             )
-            
-            if response.status_code == 200:
-                updates = response.json().get("updates", [])
-                return {
-                    "success": True,
-                    "updates": updates,
-                    "total_updates": len(updates),
-                    "last_updated": datetime.now().isoformat()
-                }
-            else:
-                return {
-                    "success": False,
-                    "error": f"Failed to fetch regulations: {response.status_code}",
-                    "updates": []
-                }
+        
+        try:
+            if self.regulation_cache is None:
+                return self._regulation_result(await send({}))
+            response, cache_status = await self.regulation_cache.fetch_async(url, params, send)
+            return {**self._regulation_result(response), "cache_status": cache_status}
                 
         except Exception as e:
             return {
@@ -371,105 +920,60 @@ class ChinaCustomsClient:
                 "updates": []
             }
     
-    def validate_documents(self, documents: List[Dict]) -> Dict:
-        """Pre-validate documents before submission"""
-        validation_results = []
+    def _regulation_params(self, last_check: Optional[datetime]) -> Dict:
+        """Query for GET /regulations; with the cache on, since is rounded down so calls share an entry
         
-        for doc in documents:
-            doc_type = doc.get("type")
-            content = doc.get("content", {})
-            
-            # Basic validation
-            validation_result = {
-                "document_type": doc_type,
-                "valid": True,
-                "errors": [],
-                "warnings": []
+        Rounding down only widens the window, so no update after last_check
+        is missed; a few already-seen updates may come back again.
+        """
+        if not last_check:
+            return {}
+        granularity = self.config["regulation_cache"]["since_granularity"]
+        if self.regulation_cache is not None and granularity:
+            epoch = last_check.timestamp()
+            last_check = datetime.fromtimestamp(epoch - epoch % granularity, last_check.tzinfo)
+        return {"since": last_check.isoformat()}
+    
+    def _regulation_result(self, response) -> Dict:
+        """Build the get_regulation_updates result from a sync or async response"""
+        if response.status_code == 200:
+            updates = response.json().get("updates", [])
+            return {
+                "success": True,
+                "updates": updates,
+                "total_updates": len(updates),
+                "last_updated": datetime.now().isoformat()
             }
-            
-            # Check required fields based on document type
-            required_fields = self._get_required_fields(doc_type)
-            for field in required_fields:
-                if field not in content or not content[field]:
-                    validation_result["valid"] = False
-                    validation_result["errors"].append(f"Missing required field: {field}")
-            
-            # Document-specific validation
-            if doc_type == "health_certificate":
-                self._validate_health_certificate(content, validation_result)
-            elif doc_type == "customs_declaration":
-                self._validate_customs_declaration(content, validation_result)
-            
-            validation_results.append(validation_result)
+        else:
+            return {
+                "success": False,
+                "error": f"Failed to fetch regulations: {response.status_code}",
+                "updates": []
+            }
+    
+    def validate_documents(self, documents: List[Dict]) -> Dict:
+        """Pre-validate documents before submission
         
-        overall_valid = all(result["valid"] for result in validation_results)
+        Uses the validators compiled from DOCUMENT_RULES when the client was
+        created; see customs_validation for the rules themselves.
+        """
+        return self.validation_engine.validate(documents)
+    
+    async def validate_documents_async(self, documents: List[Dict]) -> Dict:
+        """Coroutine form of validate_documents for async pipelines
         
-        return {
-            "valid": overall_valid,
-            "documents": validation_results,
-            "summary": {
-                "total_documents": len(documents),
-                "valid_documents": sum(1 for r in validation_results if r["valid"]),
-                "total_errors": sum(len(r["errors"]) for r in validation_results),
-                "total_warnings": sum(len(r["warnings"]) for r in validation_results)
-            }
-        }
+        Validation is local and fast, so it runs inline instead of paying for
+        an executor hop.
+        """
+        return self.validate_documents(documents)
     
     def _get_required_fields(self, doc_type: str) -> List[str]:
         """Get required fields for document type"""
-        required_fields = {
-            "health_certificate": [
-                "exporter_name", "product_description", "production_date",
-                "veterinary_inspection", "china_importer"
-            ],
-            "customs_declaration": [
-                "hs_code", "product_value", "weight_kg", "country_of_origin"
-            ],
-            "certificate_of_origin": [
-                "manufacturer", "origin_criteria", "export_license"
-            ],
-            "veterinary_certificate": [
-                "veterinary_authority", "inspection_date", "animal_health"
-            ]
-        }
-        return required_fields.get(doc_type, [])
-    
-    def _validate_health_certificate(self, content: Dict, result: Dict):
-        """Validate health certificate specific rules"""
-        production_date = content.get("production_date")
-        if production_date:
-            try:
-                prod_date = datetime.fromisoformat(production_date)
-                if prod_date > datetime.now():
-                    result["errors"].append("Production date cannot be in the future")
-                
-                # Check if certificate is too old
-                if (datetime.now() - prod_date).days > 30:
-                    result["warnings"].append("Health certificate may be expiring soon")
-            except ValueError:
-                result["errors"].append("Invalid production date format")
-    
-    def _validate_customs_declaration(self, content: Dict, result: Dict):
-        """Validate customs declaration specific rules"""
-        product_value = content.get("product_value", 0)
-        if product_value <= 0:
-            result["errors"].append("Product value must be greater than 0")
-        
-        weight_kg = content.get("weight_kg", 0)
-        if weight_kg <= 0:
-            result["errors"].append("Product weight must be greater than 0")
-        
-        # Check HS code format
-        hs_code = content.get("hs_code", "")
-        if not self._is_valid_hs_code(hs_code):
-            result["errors"].append("Invalid HS code format")
+        return self.validation_engine.required_fields(doc_type)
     
     def _is_valid_hs_code(self, hs_code: str) -> bool:
         """Validate HS code format"""
-        # Basic HS code validation (6-10 digits with optional periods)
-        import re
-        pattern = r'^\d{4}\.?\d{0,2}$'
-        return bool(re.match(pattern, hs_code))
+        return isinstance(hs_code, str) and _HS_CODE_RE.match(hs_code) is not None
     
     def generate_submission_report(self, submission_id: str) -> Dict:
         """Generate comprehensive submission report"""
@@ -620,3 +1124,15 @@ if __name__ == "__main__":
     print("\nChecking regulation updates...")
     updates_result = client.get_regulation_updates()
     print(f"Regulation Updates: {json.dumps(updates_result, indent=2)}")
+    
+    # Async transport: concurrent calls share one pooled keep-alive session
+    async def check_regulations_async():
+        async with client:
+            return await client.get_regulation_updates_async()
+    
+    print("\nChecking regulation updates (async)...")
+    async_updates_result = asyncio.run(check_regulations_async())
+    print(f"Regulation Updates: {json.dumps(async_updates_result, indent=2)}")
+    
+    # Per-endpoint latency, retries and circuit state in Prometheus text format
+    print(f"\nMetrics:\n{client.get_metrics_text()}")
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Customs Attachments for BuryatMyasoprom
+Streams file-backed customs documents as chunked multipart uploads
+"""
+
+import asyncio
+import hashlib
+import json
+import mimetypes
+import os
+import uuid
+from pathlib import Path
+from typing import AsyncIterator, Callable, Dict, Iterator, Optional
+import logging
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Bytes read from disk per chunk; memory use per upload stays around this size
+ATTACHMENT_CHUNK_SIZE = 1024 * 1024
+
+class MultipartFileStream:
+    """multipart/form-data body for one file, produced chunk by chunk
+
+    Parts, in order: "metadata" (JSON), "file" (the file contents),
+    "sha256" (hex digest of the file) and, when sign is given, "signature"
+    (sign(metadata JSON bytes + sha256 hex)). The digest is computed while the file streams, so the
+    checksum and signature parts trail the file and the file is read
+    exactly once. After the body has been fully produced, sha256 and
+    size_bytes describe what was sent.
+
+    Iterate with for (sync transports) or async for (aiohttp). Each
+    iteration starts a fresh pass over the file, so retries can reuse the
+    same object.
+    """
+
+    def __init__(self, path: str, metadata: Dict, sign: Optional[Callable[[str], str]] = None,
+                 chunk_size: int = ATTACHMENT_CHUNK_SIZE):
+        self.path = Path(path)
+        self.metadata = metadata
+        self.metadata_bytes = json.dumps(metadata, sort_keys=True).encode('utf-8')
+        self.sign = sign
+        self.chunk_size = chunk_size
+        self.boundary = f"customs-{uuid.uuid4().hex}"
+        self.filename = self.path.name
+        self.file_content_type = mimetypes.guess_type(self.filename)[0] or "application/octet-stream"
+        self.sha256 = None
+        self.size_bytes = None
+
+    @property
+    def content_type(self) -> str:
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def _part_header(self, name: str, filename: Optional[str] = None,
+                     content_type: Optional[str] = None) -> bytes:
+        disposition = f'form-data; name="{name}"'
+        if filename is not None:
+            disposition += f'; filename="{filename}"'
+        header = f"--{self.boundary}\r\nContent-Disposition: {disposition}\r\n"
+        if content_type:
+            header += f"Content-Type: {content_type}\r\n"
+        return (header + "\r\n").encode('utf-8')
+
+    def _preamble(self) -> bytes:
+        return (self._part_header("metadata", content_type="application/json")
+                + self.metadata_bytes + b"\r\n"
+                + self._part_header("file", filename=self.filename, content_type=self.file_content_type))
+
+    def _trailer(self, hasher, size: int) -> bytes:
+        self.sha256 = hasher.hexdigest()
+        self.size_bytes = size
+        trailer = b"\r\n" + self._part_header("sha256") + self.sha256.encode('ascii') + b"\r\n"
+        if self.sign is not None:
+            signature = self.sign(self.metadata_bytes + self.sha256.encode('ascii'))
+            trailer += self._part_header("signature") + signature.encode('ascii') + b"\r\n"
+        return trailer + f"--{self.boundary}--\r\n".encode('utf-8')
+
+    def __iter__(self) -> Iterator[bytes]:
+        hasher = hashlib.sha256()
+        size = 0
+        yield self._preamble()
+        with open(self.path, 'rb') as f:
+            while True:
+                chunk = f.read(self.chunk_size)
+                if not chunk:
+                    break
+                hasher.update(chunk)
+                size += len(chunk)
+                yield chunk
+        yield self._trailer(hasher, size)
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        hasher = hashlib.sha256()
+        size = 0
+        yield self._preamble()
+        f = await asyncio.to_thread(open, self.path, 'rb')
+        try:
+            while True:
+                # Disk reads and hashing release the GIL; keep both off the event loop
+                chunk = await asyncio.to_thread(_read_and_hash, f, self.chunk_size, hasher)
+                if not chunk:
+                    break
+                size += len(chunk)
+                yield chunk
+        finally:
+            await asyncio.to_thread(f.close)
+        yield self._trailer(hasher, size)
+
+def _read_and_hash(f, chunk_size: int, hasher) -> bytes:
+    chunk = f.read(chunk_size)
+    if chunk:
+        hasher.update(chunk)
+    return chunk
+
+def file_sha256(path: str, chunk_size: int = ATTACHMENT_CHUNK_SIZE) -> str:
+    """SHA-256 of a file computed in fixed-size chunks"""
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+def attachment_metadata(document: Dict) -> Dict:
+    """Metadata part sent ahead of a file-backed document"""
+    path = document["file_path"]
+    return {
+        "document_type": document.get("type"),
+        "filename": os.path.basename(path),
+        "size_bytes": os.path.getsize(path),
+        "description": document.get("description")
+    }
+
+# Example usage
+if __name__ == "__main__":
+    import tempfile
+
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as f:
+        f.write(os.urandom(3 * ATTACHMENT_CHUNK_SIZE + 123))
+        scan_path = f.name
+
+    stream = MultipartFileStream(scan_path, attachment_metadata({"type": "health_certificate", "file_path": scan_path}))
+    body_size = sum(len(chunk) for chunk in stream)
+    print(f"Streamed {stream.size_bytes} file bytes in a {body_size}-byte multipart body")
+    print(f"SHA-256 while streaming: {stream.sha256}")
+    print(f"SHA-256 from disk:       {file_sha256(scan_path)}")
+    os.unlink(scan_path)
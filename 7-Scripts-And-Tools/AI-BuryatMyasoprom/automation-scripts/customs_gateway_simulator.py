@@ -0,0 +1,450 @@
+#!/usr/bin/env python3
+"""
+Customs Gateway Simulator for BuryatMyasoprom
+Local stand-in for the China Customs API for load and retry testing
+"""
+
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+import logging
+
+from aiohttp import web
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+API_PREFIX = "/api/v1"
+
+ENDPOINTS = ("POST /submissions", "POST /attachments", "GET /submissions/{id}", "GET /regulations")
+
+FINAL_STATUSES = ("APPROVED", "REJECTED")
+
+DEFAULT_SIMULATION = {
+    # distribution: fixed (ms), uniform (min_ms, max_ms), exponential (mean_ms)
+    # or lognormal (median_ms, sigma)
+    "latency": {"distribution": "lognormal", "median_ms": 60, "sigma": 0.5},
+    # Share of requests answered with each injected status code
+    "error_rates": {"429": 0.0, "500": 0.0, "502": 0.0, "503": 0.0},
+    "retry_after_seconds": 1,
+    # Per-endpoint overrides of latency and error_rates
+    "endpoints": {
+        "GET /submissions/{id}": {"latency": {"distribution": "lognormal", "median_ms": 25, "sigma": 0.4}}
+    },
+    # Requests per second allowed per endpoint (fixed one-second windows); None disables
+    "rate_limits": {},
+    # Status state machine: weighted next statuses and seconds spent in each status
+    "status_flow": {
+        "SUBMITTED": [["UNDER_REVIEW", 1.0]],
+        "UNDER_REVIEW": [["APPROVED", 0.8], ["ADDITIONAL_INFO_REQUIRED", 0.15], ["REJECTED", 0.05]],
+        "ADDITIONAL_INFO_REQUIRED": [["UNDER_REVIEW", 1.0]]
+    },
+    "status_dwell_seconds": {"SUBMITTED": 2, "UNDER_REVIEW": 5, "ADDITIONAL_INFO_REQUIRED": 3},
+    # Cache-Control sent with regulation updates; ETag revalidation answers 304
+    "regulations_cache_control": "max-age=60",
+    # When set, X-Signature must be the HMAC of X-Timestamp + body; for attachments
+    # the trailing "signature" part must be the HMAC of X-Timestamp + metadata + sha256
+    "secret_key": None,
+    "seed": None
+}
+
+REGULATION_UPDATES = [
+    {"regulation_id": "GACC-2024-015", "title": "Updated residue limits for frozen beef",
+     "effective_date": "2024-03-01", "category": "FOOD_SAFETY"},
+    {"regulation_id": "GACC-2024-022", "title": "Cold-chain temperature logging requirements",
+     "effective_date": "2024-04-15", "category": "COLD_CHAIN"},
+    {"regulation_id": "GACC-2024-031", "title": "Registration renewal for overseas meat plants",
+     "effective_date": "2024-06-01", "category": "REGISTRATION"},
+]
+
+REGULATIONS_LAST_MODIFIED = "Mon, 03 Jun 2024 00:00:00 GMT"
+
+def sample_latency(spec: Dict, rng: random.Random) -> float:
+    """Seconds of simulated processing time drawn from a latency spec"""
+    distribution = spec.get("distribution", "fixed")
+    if distribution == "fixed":
+        milliseconds = spec.get("ms", 0)
+    elif distribution == "uniform":
+        milliseconds = rng.uniform(spec.get("min_ms", 0), spec.get("max_ms", 100))
+    elif distribution == "exponential":
+        milliseconds = rng.expovariate(1 / spec.get("mean_ms", 50))
+    elif distribution == "lognormal":
+        milliseconds = rng.lognormvariate(math.log(spec.get("median_ms", 50)), spec.get("sigma", 0.5))
+    else:
+        raise ValueError(f"Unknown latency distribution {distribution}")
+    return max(milliseconds, 0) / 1000
+
+class _SimulatedSubmission:
+    def __init__(self, submission_id: str, order_id: Optional[str], rng: random.Random):
+        self.submission_id = submission_id
+        self.customs_reference = f"CN-{submission_id[-8:].upper()}"
+        self.order_id = order_id
+        self.status = "SUBMITTED"
+        self.entered_at = time.time()
+        self.history = [("SUBMITTED", self.entered_at)]
+        self.rng = rng
+
+class CustomsGatewaySimulator:
+    """aiohttp server implementing the submission, status and regulation endpoints
+
+    Submissions move through status_flow as wall-clock time passes, so a
+    client polling the status endpoint sees SUBMITTED -> UNDER_REVIEW ->
+    a final status. Latency, error injection and per-endpoint rate limits
+    come from the simulation settings; /_simulator/stats reports what the
+    server saw, including requests per endpoint, so a load test can compute
+    retry amplification from the server side.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8089, simulation: Optional[Dict] = None):
+        self.host = host
+        self.port = port
+        self.simulation = {**DEFAULT_SIMULATION, **(simulation or {})}
+        self._rng = random.Random(self.simulation["seed"])
+        self._submissions = {}
+        self._idempotency_keys = {}
+        self._attachments = {}
+        self._windows = {}
+        self._runner = None
+        self._thread = None
+        self._loop = None
+        self._stats = {}
+        self.reset_stats()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}{API_PREFIX}"
+
+    def _setting(self, endpoint: str, name: str):
+        return self.simulation["endpoints"].get(endpoint, {}).get(name, self.simulation[name])
+
+    def reset_stats(self):
+        self._stats = {
+            "requests": {endpoint: 0 for endpoint in ENDPOINTS},
+            "injected_errors": {},
+            "rate_limited": 0,
+            "signature_failures": 0,
+            "idempotent_replays": 0,
+            "not_modified": 0,
+            "attachment_bytes": 0,
+            "checksum_failures": 0,
+            "started_at": datetime.now().isoformat()
+        }
+
+    # Request handling
+
+    def _application(self) -> web.Application:
+        app = web.Application(middlewares=[self._simulate])
+        app.router.add_post(f"{API_PREFIX}/submissions", self._create_submission)
+        app.router.add_post(f"{API_PREFIX}/attachments", self._create_attachment)
+        app.router.add_get(f"{API_PREFIX}/submissions/{{submission_id}}", self._get_submission)
+        app.router.add_get(f"{API_PREFIX}/regulations", self._get_regulations)
+        app.router.add_get("/_simulator/stats", self._get_stats)
+        app.router.add_post("/_simulator/reset", self._reset)
+        return app
+
+    def _endpoint(self, request: web.Request) -> Optional[str]:
+        resource = request.match_info.route.resource
+        path = resource.canonical if resource is not None else ""
+        if not path.startswith(API_PREFIX):
+            return None
+        return f"{request.method} {path[len(API_PREFIX):].replace('{submission_id}', '{id}')}"
+
+    @web.middleware
+    async def _simulate(self, request: web.Request, handler):
+        endpoint = self._endpoint(request)
+        if endpoint is None:
+            return await handler(request)
+        self._stats["requests"][endpoint] += 1
+
+        await asyncio.sleep(sample_latency(self._setting(endpoint, "latency"), self._rng))
+
+        rate_limit_headers = {}
+        limit = self.simulation["rate_limits"].get(endpoint)
+        if limit:
+            now = time.time()
+            window_start, used = self._windows.get(endpoint, (math.floor(now), 0))
+            if now >= window_start + 1:
+                window_start, used = math.floor(now), 0
+            reset = max(window_start + 1 - now, 0)
+            if used >= limit:
+                self._stats["rate_limited"] += 1
+                return self._error(429, "RATE_LIMITED", "Too many requests", {
+                    "Retry-After": str(math.ceil(reset)),
+                    "X-RateLimit-Remaining": "0",
+                    "X-RateLimit-Reset": f"{reset:.3f}"
+                })
+            self._windows[endpoint] = (window_start, used + 1)
+            rate_limit_headers = {"X-RateLimit-Remaining": str(limit - used - 1), "X-RateLimit-Reset": f"{reset:.3f}"}
+
+        roll = self._rng.random()
+        for status_code, rate in self._setting(endpoint, "error_rates").items():
+            if roll < rate:
+                injected = self._stats["injected_errors"]
+                injected[status_code] = injected.get(status_code, 0) + 1
+                headers = {}
+                if int(status_code) in (429, 503):
+                    headers["Retry-After"] = str(self.simulation["retry_after_seconds"])
+                return self._error(int(status_code), "INJECTED_FAULT", f"Simulated {status_code}", headers)
+            roll -= rate
+
+        response = await handler(request)
+        response.headers.update(rate_limit_headers)
+        return response
+
+    def _error(self, status: int, code: str, message: str, headers: Optional[Dict] = None,
+               field_errors: Optional[List] = None) -> web.Response:
+        return web.json_response({
+            "error_code": code,
+            "error_message": message,
+            "error_details": None,
+            "field_errors": field_errors or []
+        }, status=status, headers=headers)
+
+    async def _create_submission(self, request: web.Request) -> web.Response:
+        body = await request.read()
+
+        secret_key = self.simulation["secret_key"]
+        if secret_key:
+            expected = hmac.new(secret_key.encode('utf-8'),
+                                request.headers.get("X-Timestamp", "").encode('utf-8') + body,
+                                hashlib.sha256).hexdigest()
+            if not hmac.compare_digest(expected, request.headers.get("X-Signature", "")):
+                self._stats["signature_failures"] += 1
+                return self._error(401, "INVALID_SIGNATURE", "Request signature does not match body")
+
+        idempotency_key = request.headers.get("Idempotency-Key")
+        if idempotency_key and idempotency_key in self._idempotency_keys:
+            self._stats["idempotent_replays"] += 1
+            return self._submission_response(self._submissions[self._idempotency_keys[idempotency_key]])
+
+        try:
+            submission_data = json.loads(body)
+        except ValueError:
+            return self._error(400, "INVALID_JSON", "Request body is not valid JSON")
+        if not submission_data.get("documents"):
+            return self._error(400, "VALIDATION_FAILED", "No documents submitted",
+                               field_errors=[{"field": "documents", "error": "required"}])
+        unknown = [document.get("attachment_id") for document in submission_data["documents"]
+                   if document.get("format") == "ATTACHMENT" and document.get("attachment_id") not in self._attachments]
+        if unknown:
+            return self._error(400, "VALIDATION_FAILED", "Unknown attachment referenced",
+                               field_errors=[{"field": "attachment_id", "error": f"unknown: {attachment_id}"}
+                                             for attachment_id in unknown])
+
+        submission_id = f"SUB-{uuid.uuid4().hex[:12].upper()}"
+        submission = _SimulatedSubmission(
+            submission_id,
+            submission_data.get("metadata", {}).get("order_id"),
+            random.Random(f"{self.simulation['seed']}-{submission_id}")
+        )
+        self._submissions[submission_id] = submission
+        if idempotency_key:
+            self._idempotency_keys[idempotency_key] = submission_id
+        return self._submission_response(submission)
+
+    async def _create_attachment(self, request: web.Request) -> web.Response:
+        """Multipart upload read part by part; the file is hashed, never held in memory"""
+        metadata_bytes = b""
+        hasher = hashlib.sha256()
+        size = 0
+        fields = {}
+
+        try:
+            reader = await request.multipart()
+            async for part in reader:
+                if part.name == "file":
+                    while True:
+                        chunk = await part.read_chunk(256 * 1024)
+                        if not chunk:
+                            break
+                        hasher.update(chunk)
+                        size += len(chunk)
+                elif part.name == "metadata":
+                    metadata_bytes = bytes(await part.read())
+                else:
+                    fields[part.name] = (await part.read()).decode('utf-8')
+            metadata = json.loads(metadata_bytes)
+        except (ValueError, AssertionError):
+            return self._error(400, "INVALID_MULTIPART", "Request body is not a valid attachment upload")
+        self._stats["attachment_bytes"] += size
+
+        sha256 = hasher.hexdigest()
+        if fields.get("sha256") != sha256 or metadata.get("size_bytes") != size:
+            self._stats["checksum_failures"] += 1
+            return self._error(400, "CHECKSUM_MISMATCH", "Attachment does not match its declared checksum or size")
+
+        secret_key = self.simulation["secret_key"]
+        if secret_key:
+            expected = hmac.new(secret_key.encode('utf-8'),
+                                request.headers.get("X-Timestamp", "").encode('utf-8') + metadata_bytes
+                                + sha256.encode('ascii'),
+                                hashlib.sha256).hexdigest()
+            if not hmac.compare_digest(expected, fields.get("signature", "")):
+                self._stats["signature_failures"] += 1
+                return self._error(401, "INVALID_SIGNATURE", "Attachment signature does not match")
+
+        # Content-addressed, so a retried upload of the same file gets the same id
+        attachment_id = f"ATT-{sha256[:16].upper()}"
+        self._attachments[attachment_id] = {"sha256": sha256, "size_bytes": size,
+                                            "filename": metadata.get("filename"),
+                                            "document_type": metadata.get("document_type")}
+        return web.json_response({"attachment_id": attachment_id, "sha256": sha256, "size_bytes": size}, status=201)
+
+    def _submission_response(self, submission: _SimulatedSubmission) -> web.Response:
+        return web.json_response({
+            "submission_id": submission.submission_id,
+            "customs_reference": submission.customs_reference,
+            "status": "SUBMITTED",
+            "estimated_processing_time": sum(self.simulation["status_dwell_seconds"].values()),
+            "message": "Documents submitted successfully"
+        }, status=202)
+
+    def _advance(self, submission: _SimulatedSubmission):
+        """Apply every status transition that is due by now"""
+        flow = self.simulation["status_flow"]
+        dwell = self.simulation["status_dwell_seconds"]
+        now = time.time()
+        while submission.status in flow and now >= submission.entered_at + dwell.get(submission.status, 0):
+            submission.entered_at += dwell.get(submission.status, 0)
+            statuses, weights = zip(*flow[submission.status])
+            submission.status = submission.rng.choices(statuses, weights=weights)[0]
+            submission.history.append((submission.status, submission.entered_at))
+
+    async def _get_submission(self, request: web.Request) -> web.Response:
+        submission = self._submissions.get(request.match_info["submission_id"])
+        if submission is None:
+            return self._error(404, "NOT_FOUND", "Unknown submission")
+
+        self._advance(submission)
+        dwell = self.simulation["status_dwell_seconds"].get(submission.status)
+        final = submission.status not in self.simulation["status_flow"]
+        return web.json_response({
+            "status": submission.status,
+            "customs_reference": submission.customs_reference,
+            "last_updated": datetime.fromtimestamp(submission.entered_at).isoformat(),
+            "estimated_completion": None if final or dwell is None
+                else (datetime.fromtimestamp(submission.entered_at) + timedelta(seconds=dwell)).isoformat(),
+            "issues": ["Missing cold-chain log for lot 3"] if submission.status == "ADDITIONAL_INFO_REQUIRED" else [],
+            "actions_required": ["Upload temperature log"] if submission.status == "ADDITIONAL_INFO_REQUIRED" else []
+        })
+
+    async def _get_regulations(self, request: web.Request) -> web.Response:
+        since = request.query.get("since")
+        updates = [update for update in REGULATION_UPDATES if not since or update["effective_date"] >= since[:10]]
+        body = json.dumps({"updates": updates}).encode('utf-8')
+        etag = f'"{hashlib.sha256(body).hexdigest()[:16]}"'
+        headers = {"ETag": etag, "Last-Modified": REGULATIONS_LAST_MODIFIED,
+                   "Cache-Control": self.simulation["regulations_cache_control"]}
+
+        if request.headers.get("If-None-Match") == etag:
+            self._stats["not_modified"] += 1
+            return web.Response(status=304, headers=headers)
+        return web.Response(body=body, content_type="application/json", headers=headers)
+
+    async def _get_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.get_stats())
+
+    async def _reset(self, request: web.Request) -> web.Response:
+        self.reset_stats()
+        return web.json_response({"success": True})
+
+    def get_stats(self) -> Dict:
+        by_status = {}
+        for submission in self._submissions.values():
+            self._advance(submission)
+            by_status[submission.status] = by_status.get(submission.status, 0) + 1
+        return {**self._stats, "submissions": len(self._submissions), "submissions_by_status": by_status,
+                "attachments": len(self._attachments)}
+
+    # Lifecycle
+
+    async def start(self):
+        self._runner = web.AppRunner(self._application(), access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info(f"Customs gateway simulator listening on {self.base_url}")
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.stop()
+
+    def start_in_thread(self) -> str:
+        """Serve from a background thread with its own event loop (for sync clients); returns base_url"""
+        started = threading.Event()
+
+        def serve():
+            self._loop = asyncio.new_event_loop()
+            self._loop.run_until_complete(self.start())
+            started.set()
+            self._loop.run_forever()
+            self._loop.run_until_complete(self.stop())
+            self._loop.close()
+
+        self._thread = threading.Thread(target=serve, name="customs-gateway-simulator", daemon=True)
+        self._thread.start()
+        started.wait()
+        return self.base_url
+
+    def stop_thread(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop = None
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Local China Customs gateway simulator")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--simulation", default=None, help="JSON file overriding DEFAULT_SIMULATION")
+    parser.add_argument("--latency-ms", type=float, default=None, help="median latency for every endpoint")
+    parser.add_argument("--rate-429", type=float, default=None, help="share of requests answered 429")
+    parser.add_argument("--rate-503", type=float, default=None, help="share of requests answered 503")
+    parser.add_argument("--rate-500", type=float, default=None, help="share of requests answered 500")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    simulation = {}
+    if args.simulation:
+        with open(args.simulation, 'r') as f:
+            simulation = json.load(f)
+    if args.latency_ms is not None:
+        simulation["latency"] = {"distribution": "lognormal", "median_ms": args.latency_ms, "sigma": 0.5}
+        simulation["endpoints"] = {}
+    error_rates = dict(simulation.get("error_rates", DEFAULT_SIMULATION["error_rates"]))
+    for status_code, rate in (("429", args.rate_429), ("503", args.rate_503), ("500", args.rate_500)):
+        if rate is not None:
+            error_rates[status_code] = rate
+    simulation["error_rates"] = error_rates
+    if args.seed is not None:
+        simulation["seed"] = args.seed
+
+    simulator = CustomsGatewaySimulator(args.host, args.port, simulation)
+
+    async def serve():
+        async with simulator:
+            await asyncio.Event().wait()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        logger.info(f"Simulator stopped: {json.dumps(simulator.get_stats())}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Customs Load Test for BuryatMyasoprom
+Throughput, latency and retry amplification of ChinaCustomsClient against the gateway simulator
+"""
+
+import argparse
+import asyncio
+import json
+import platform
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+import logging
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from china_customs_client import ChinaCustomsClient
+from customs_gateway_simulator import CustomsGatewaySimulator
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+SCENARIOS = ("submit", "status", "regulations")
+
+# Simulator endpoint each scenario exercises, for retry amplification
+SCENARIO_ENDPOINTS = {
+    "submit": "POST /submissions",
+    "status": "GET /submissions/{id}",
+    "regulations": "GET /regulations",
+}
+
+SAMPLE_DOCUMENTS = [
+    {"type": "health_certificate", "content": {"certificate_number": "VET-2024-001", "issuing_authority": "Buryat Veterinary Service",
+                                               "product_description": "Frozen beef", "slaughter_date": "2024-01-10"}},
+    {"type": "customs_declaration", "content": {"hs_code": "0201.10", "product_value": 27500,
+                                                "weight_kg": 5000, "country_of_origin": "RUSSIA"}},
+]
+
+SAMPLE_ORDER = {
+    "order_id": "BO-LOAD-001",
+    "customer": {"name": "China Meat Import Co.", "import_license": "CN-IMP-2024-001"},
+    "products": [{"meat_type": "BEEF", "description": "Frozen beef", "quantity_kg": 5000, "unit_price": 5.5}]
+}
+
+def _percentile(sorted_values: List[float], percent: float) -> float:
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(percent / 100 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+class CustomsLoadTest:
+    """Runs one scenario through the sync and/or async client paths"""
+
+    def __init__(self, base_url: str, scenario: str = "submit", requests_count: int = 500,
+                 concurrency: int = 20, config_path: str = "config/customs_config.json",
+                 rate_limits: bool = False, retry_delay: Optional[float] = 0.1,
+                 regulation_cache: bool = False):
+        if scenario not in SCENARIOS:
+            raise ValueError(f"Unknown scenario {scenario}; expected one of {SCENARIOS}")
+        self.base_url = base_url
+        self.scenario = scenario
+        self.requests_count = requests_count
+        self.concurrency = concurrency
+        self.config_path = config_path
+        self.rate_limits = rate_limits
+        self.retry_delay = retry_delay
+        self.regulation_cache = regulation_cache
+
+    def _client(self) -> ChinaCustomsClient:
+        client = ChinaCustomsClient(self.config_path)
+        client.base_url = self.base_url
+        client.rate_limiter.enabled = self.rate_limits
+        if not self.regulation_cache:
+            # Otherwise the regulations scenario measures cache hits, not the gateway
+            client.regulation_cache = None
+        if self.retry_delay is not None:
+            client.retry_policy.base_delay = self.retry_delay
+        # One pooled connection per worker thread on the sync path
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrency)
+        client.session.mount("http://", adapter)
+        client.session.mount("https://", adapter)
+        return client
+
+    def _server_requests(self) -> int:
+        stats_url = self.base_url.split("/api/")[0] + "/_simulator/stats"
+        stats = requests.get(stats_url, timeout=10).json()
+        return stats["requests"][SCENARIO_ENDPOINTS[self.scenario]]
+
+    def _submission_ids(self, client: ChinaCustomsClient, count: int) -> List[str]:
+        """Submissions for the status scenario to poll"""
+        ids = []
+        for _ in range(count):
+            result = client.submit_documents(SAMPLE_DOCUMENTS, SAMPLE_ORDER)
+            if result["success"]:
+                ids.append(result["submission_id"])
+        if not ids:
+            raise RuntimeError("Could not create submissions for the status scenario")
+        return ids
+
+    def _sync_call(self, client: ChinaCustomsClient, submission_ids: List[str]) -> Callable[[int], Dict]:
+        if self.scenario == "submit":
+            return lambda index: client.submit_documents(SAMPLE_DOCUMENTS, SAMPLE_ORDER)
+        if self.scenario == "status":
+            return lambda index: client.check_submission_status(submission_ids[index % len(submission_ids)])
+        return lambda index: client.get_regulation_updates()
+
+    def _async_call(self, client: ChinaCustomsClient, submission_ids: List[str]):
+        if self.scenario == "submit":
+            return lambda index: client.submit_documents_async(SAMPLE_DOCUMENTS, SAMPLE_ORDER)
+        if self.scenario == "status":
+            return lambda index: client.check_submission_status_async(submission_ids[index % len(submission_ids)])
+        return lambda index: client.get_regulation_updates_async()
+
+    def _summarize(self, mode: str, latencies_ms: List[float], failures: int,
+                   wall_seconds: float, server_requests: int, client: ChinaCustomsClient) -> Dict:
+        ordered = sorted(latencies_ms)
+        completed = len(ordered) - failures
+        return {
+            "mode": mode,
+            "requests": len(ordered),
+            "succeeded": completed,
+            "failed": failures,
+            "requests_per_second": round(len(ordered) / wall_seconds, 1) if wall_seconds else 0.0,
+            "p50_ms": round(_percentile(ordered, 50), 2),
+            "p90_ms": round(_percentile(ordered, 90), 2),
+            "p99_ms": round(_percentile(ordered, 99), 2),
+            "max_ms": round(ordered[-1], 2) if ordered else 0.0,
+            # Gateway requests per logical call: 1.0 means no retries
+            "retry_amplification": round(server_requests / len(ordered), 3) if ordered else 0.0,
+            "circuit_breaker": client.circuit_breaker.get_stats(),
+            "wall_seconds": round(wall_seconds, 2)
+        }
+
+    def run_sync(self) -> Dict:
+        client = self._client()
+        submission_ids = self._submission_ids(client, min(50, self.requests_count)) if self.scenario == "status" else []
+        call = self._sync_call(client, submission_ids)
+
+        def timed(index: int):
+            start = time.perf_counter()
+            try:
+                success = call(index).get("success", False)
+            except Exception:
+                success = False
+            return (time.perf_counter() - start) * 1000, success
+
+        server_before = self._server_requests()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            outcomes = list(executor.map(timed, range(self.requests_count)))
+        wall_seconds = time.perf_counter() - start
+        server_requests = self._server_requests() - server_before
+
+        client.session.close()
+        return self._summarize("sync", [latency for latency, _ in outcomes],
+                               sum(1 for _, success in outcomes if not success),
+                               wall_seconds, server_requests, client)
+
+    async def run_async(self) -> Dict:
+        client = self._client()
+        submission_ids = await asyncio.to_thread(self._submission_ids, client, min(50, self.requests_count)) \
+            if self.scenario == "status" else []
+        call = self._async_call(client, submission_ids)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def timed(index: int):
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    success = (await call(index)).get("success", False)
+                except Exception:
+                    success = False
+                return (time.perf_counter() - start) * 1000, success
+
+        async with client:
+            server_before = await asyncio.to_thread(self._server_requests)
+            start = time.perf_counter()
+            outcomes = await asyncio.gather(*[timed(index) for index in range(self.requests_count)])
+            wall_seconds = time.perf_counter() - start
+            server_requests = await asyncio.to_thread(self._server_requests) - server_before
+
+        return self._summarize("async", [latency for latency, _ in outcomes],
+                               sum(1 for _, success in outcomes if not success),
+                               wall_seconds, server_requests, client)
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Load test ChinaCustomsClient against the gateway simulator")
+    parser.add_argument("--base-url", default=None, help="running simulator or gateway (default: start an embedded simulator)")
+    parser.add_argument("--scenario", choices=SCENARIOS, default="submit")
+    parser.add_argument("--mode", choices=("sync", "async", "both"), default="both")
+    parser.add_argument("--requests", type=int, default=500, help="logical client calls per mode")
+    parser.add_argument("--concurrency", type=int, default=20, help="worker threads (sync) or in-flight coroutines (async)")
+    parser.add_argument("--config", default="config/customs_config.json", help="client configuration file")
+    parser.add_argument("--rate-limits", action="store_true", help="enable the client's rate limiter with the endpoint limits from --config")
+    parser.add_argument("--regulation-cache", action="store_true",
+                        help="keep the client's regulation cache (regulations scenario measures cache hits)")
+    parser.add_argument("--retry-delay", type=float, default=0.1, help="client base retry delay in seconds")
+    parser.add_argument("--latency-ms", type=float, default=None, help="embedded simulator: median latency")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="embedded simulator: share of 429 responses")
+    parser.add_argument("--rate-503", type=float, default=0.0, help="embedded simulator: share of 503 responses")
+    parser.add_argument("--retry-after", type=float, default=1, help="embedded simulator: Retry-After seconds on 429/503")
+    parser.add_argument("--port", type=int, default=8089, help="embedded simulator port")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=None, help="write JSON results to this file")
+    args = parser.parse_args(argv)
+
+    simulator = None
+    base_url = args.base_url
+    if base_url is None:
+        simulation = {"error_rates": {"429": args.rate_429, "503": args.rate_503},
+                      "retry_after_seconds": args.retry_after, "seed": args.seed}
+        if args.latency_ms is not None:
+            simulation["latency"] = {"distribution": "lognormal", "median_ms": args.latency_ms, "sigma": 0.5}
+            simulation["endpoints"] = {}
+        simulator = CustomsGatewaySimulator(port=args.port, simulation=simulation)
+        base_url = simulator.start_in_thread()
+
+    load_test = CustomsLoadTest(base_url, args.scenario, args.requests, args.concurrency,
+                                args.config, args.rate_limits, args.retry_delay, args.regulation_cache)
+    started_at = datetime.now()
+    results = []
+    try:
+        if args.mode in ("sync", "both"):
+            logger.info(f"Running sync {args.scenario} load: {args.requests} calls, {args.concurrency} threads")
+            results.append(load_test.run_sync())
+        if args.mode in ("async", "both"):
+            logger.info(f"Running async {args.scenario} load: {args.requests} calls, {args.concurrency} in flight")
+            results.append(asyncio.run(load_test.run_async()))
+    finally:
+        if simulator is not None:
+            simulator.stop_thread()
+
+    output = json.dumps({
+        "environment": {
+            "python": platform.python_version(),
+            "base_url": base_url,
+            "scenario": args.scenario,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "rate_limits": args.rate_limits,
+            "regulation_cache": args.regulation_cache,
+            "injected_error_rates": {"429": args.rate_429, "503": args.rate_503} if simulator else None
+        },
+        "results": results,
+        "started_at": started_at.isoformat(),
+        "duration_seconds": round((datetime.now() - started_at).total_seconds(), 1)
+    }, indent=2)
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+        logger.info(f"Load test results written to {args.output}")
+    print(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+Customs Metrics for BuryatMyasoprom
+Per-endpoint latency, retry and in-flight instrumentation with Prometheus text output and tracing hooks
+"""
+
+import os
+import threading
+import time
+from bisect import bisect_left
+from pathlib import Path
+from typing import Callable, ContextManager, Dict, Iterable, List, Optional, Tuple
+import logging
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds; gateway calls range from tens of milliseconds to the 30 s timeout
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# (name, type, help, labels, value) produced by collectors at snapshot time
+Sample = Tuple[str, str, str, Dict[str, str], float]
+
+# span_factory(name, attributes) returns a context manager whose value has
+# set_attribute(key, value); OpenTelemetry's tracer.start_as_current_span fits
+SpanFactory = Callable[[str, Dict], ContextManager]
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(labels: Dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, bucket_count: int):
+        # Per-bucket counts; the last slot is +Inf. Cumulated when rendered
+        self.counts = [0] * (bucket_count + 1)
+        self.sum = 0.0
+        self.count = 0
+
+class _NoopTimer:
+    """Returned by track() when metrics are disabled: nothing is timed or recorded"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def status(self, status_code: int):
+        pass
+
+_NOOP_TIMER = _NoopTimer()
+
+class RequestTimer:
+    """One gateway attempt: in-flight gauge, latency histogram and optional span"""
+
+    __slots__ = ("_metrics", "endpoint", "attempt", "status_code", "_start", "_span_context", "_span")
+
+    def __init__(self, metrics: "CustomsMetrics", endpoint: str, attempt: int):
+        self._metrics = metrics
+        self.endpoint = endpoint
+        self.attempt = attempt
+        self.status_code = None
+        self._span_context = None
+        self._span = None
+
+    def __enter__(self):
+        span_factory = self._metrics.span_factory
+        if span_factory is not None:
+            try:
+                self._span_context = span_factory("customs.request", {
+                    "customs.endpoint": self.endpoint,
+                    "customs.attempt": self.attempt
+                })
+                self._span = self._span_context.__enter__()
+            except Exception as e:
+                # A broken tracer must never fail a customs call
+                logger.warning(f"Tracing span could not be started: {str(e)}")
+                self._span_context = None
+        self._metrics._in_flight_add(self.endpoint, 1)
+        self._start = time.perf_counter()
+        return self
+
+    def status(self, status_code: int):
+        """Record the HTTP status of the response"""
+        self.status_code = status_code
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        elapsed = time.perf_counter() - self._start
+        metrics = self._metrics
+        metrics._in_flight_add(self.endpoint, -1)
+        status = str(self.status_code) if self.status_code is not None else \
+            ("error" if exc_type is not None else "unknown")
+        metrics.observe(self.endpoint, status, elapsed)
+
+        if self._span_context is not None:
+            try:
+                if self._span is not None and hasattr(self._span, "set_attribute"):
+                    self._span.set_attribute("http.status_code", self.status_code or 0)
+                    self._span.set_attribute("customs.status", status)
+                self._span_context.__exit__(exc_type, exc_value, traceback)
+            except Exception as e:
+                logger.warning(f"Tracing span could not be finished: {str(e)}")
+        return False
+
+class CustomsMetrics:
+    """Thread-safe request metrics for ChinaCustomsClient
+
+    Latency histograms are keyed by endpoint and status ("200", "503", or
+    "error" for transport failures); retries are counted by endpoint and
+    reason, and in-flight requests are a gauge per endpoint. Collectors
+    added with add_collector() contribute values read at snapshot time,
+    such as circuit breaker state. render_prometheus() returns the
+    Prometheus text exposition format; set span_factory to wrap every
+    gateway attempt in a tracing span.
+
+    When disabled, track() returns a shared no-op timer and the other
+    recording methods return immediately, so the request path pays one
+    attribute check.
+    """
+
+    def __init__(self, enabled: bool = True, buckets: Iterable[float] = DEFAULT_LATENCY_BUCKETS,
+                 span_factory: Optional[SpanFactory] = None, namespace: str = "customs"):
+        self.enabled = enabled
+        self.buckets = tuple(sorted(buckets))
+        self.span_factory = span_factory
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._retries = {}
+        self._retries_denied = {}
+        self._in_flight = {}
+        self._collectors = []
+
+    # Recording
+
+    def track(self, endpoint: str, attempt: int = 0):
+        """Context manager timing one gateway attempt; call .status(code) on a response"""
+        if not self.enabled:
+            return _NOOP_TIMER
+        return RequestTimer(self, endpoint, attempt)
+
+    def observe(self, endpoint: str, status: str, seconds: float):
+        if not self.enabled:
+            return
+        index = bisect_left(self.buckets, seconds)
+        with self._lock:
+            histogram = self._histograms.get((endpoint, status))
+            if histogram is None:
+                histogram = self._histograms[(endpoint, status)] = _Histogram(len(self.buckets))
+            histogram.counts[index] += 1
+            histogram.sum += seconds
+            histogram.count += 1
+
+    def record_retry(self, endpoint: str, reason):
+        """A retry was scheduled; reason is the status code or "error" """
+        if not self.enabled:
+            return
+        key = (endpoint, str(reason))
+        with self._lock:
+            self._retries[key] = self._retries.get(key, 0) + 1
+
+    def record_retry_denied(self, endpoint: str):
+        """A retry was refused by the endpoint's retry budget"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._retries_denied[endpoint] = self._retries_denied.get(endpoint, 0) + 1
+
+    def _in_flight_add(self, endpoint: str, delta: int):
+        with self._lock:
+            self._in_flight[endpoint] = self._in_flight.get(endpoint, 0) + delta
+
+    def add_collector(self, collector: Callable[[], Iterable[Sample]]):
+        """Register a callback returning (name, type, help, labels, value) samples for each snapshot"""
+        self._collectors.append(collector)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._retries.clear()
+            self._retries_denied.clear()
+
+    # Snapshots
+
+    def get_stats(self) -> Dict:
+        """Request counts, mean latency and retries per endpoint"""
+        endpoints = {}
+
+        def entry(endpoint: str) -> Dict:
+            return endpoints.setdefault(endpoint, {"requests": 0, "by_status": {}, "retries": 0,
+                                                   "retries_denied": 0, "in_flight": 0})
+
+        with self._lock:
+            for (endpoint, status), histogram in self._histograms.items():
+                stats = entry(endpoint)
+                stats["requests"] += histogram.count
+                stats["by_status"][status] = {
+                    "count": histogram.count,
+                    "mean_ms": round(histogram.sum / histogram.count * 1000, 2) if histogram.count else 0.0
+                }
+            for (endpoint, _), count in self._retries.items():
+                entry(endpoint)["retries"] += count
+            for endpoint, count in self._retries_denied.items():
+                entry(endpoint)["retries_denied"] = count
+            for endpoint, count in self._in_flight.items():
+                entry(endpoint)["in_flight"] = count
+            return {"enabled": self.enabled, "endpoints": endpoints}
+
+    def _families(self) -> List[Tuple[str, str, str, List[Tuple[str, Dict, float]]]]:
+        """(name, type, help, [(sample name, labels, value)]) for every metric family"""
+        prefix = self.namespace
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            histogram_counts = [(key, list(histogram.counts), histogram.sum, histogram.count)
+                                for key, histogram in histograms]
+            retries = sorted(self._retries.items())
+            retries_denied = sorted(self._retries_denied.items())
+            in_flight = sorted(self._in_flight.items())
+
+        latency_samples = []
+        for (endpoint, status), counts, total, count in histogram_counts:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                latency_samples.append((f"{prefix}_request_duration_seconds_bucket",
+                                        {"endpoint": endpoint, "status": status, "le": _number(bound)}, cumulative))
+            latency_samples.append((f"{prefix}_request_duration_seconds_sum",
+                                    {"endpoint": endpoint, "status": status}, total))
+            latency_samples.append((f"{prefix}_request_duration_seconds_count",
+                                    {"endpoint": endpoint, "status": status}, count))
+
+        families = [
+            (f"{prefix}_request_duration_seconds", "histogram",
+             "Customs gateway request latency by endpoint and status", latency_samples),
+            (f"{prefix}_retries_total", "counter", "Retries scheduled by endpoint and reason",
+             [(f"{prefix}_retries_total", {"endpoint": endpoint, "reason": reason}, count)
+              for (endpoint, reason), count in retries]),
+            (f"{prefix}_retries_denied_total", "counter", "Retries refused by the retry budget",
+             [(f"{prefix}_retries_denied_total", {"endpoint": endpoint}, count) for endpoint, count in retries_denied]),
+            (f"{prefix}_requests_in_flight", "gauge", "Gateway requests currently in flight",
+             [(f"{prefix}_requests_in_flight", {"endpoint": endpoint}, count) for endpoint, count in in_flight]),
+        ]
+
+        collected = {}
+        for collector in self._collectors:
+            try:
+                samples = list(collector())
+            except Exception as e:
+                logger.warning(f"Metrics collector failed: {str(e)}")
+                continue
+            for name, metric_type, help_text, labels, value in samples:
+                family = collected.get(name)
+                if family is None:
+                    family = collected[name] = (name, metric_type, help_text, [])
+                family[3].append((name, labels, value))
+        return families + list(collected.values())
+
+    def render_prometheus(self) -> str:
+        """Snapshot in the Prometheus text exposition format (version 0.0.4)"""
+        lines = []
+        for name, metric_type, help_text, samples in self._families():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for sample_name, labels, value in samples:
+                lines.append(f"{sample_name}{_labels(labels)} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path: str) -> Dict:
+        """Write the snapshot atomically, e.g. for the node_exporter textfile collector"""
+        try:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            temp_path = f"{path}.{os.getpid()}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                f.write(self.render_prometheus())
+            os.replace(temp_path, path)
+            return {"success": True, "path": path}
+        except OSError as e:
+            logger.error(f"Failed to write metrics to {path}: {str(e)}")
+            return {"success": False, "error": f"Metrics write error: {str(e)}"}
+
+# Example usage
+if __name__ == "__main__":
+    from contextlib import contextmanager
+
+    @contextmanager
+    def print_span(name: str, attributes: Dict):
+        class Span:
+            def set_attribute(self, key, value):
+                attributes[key] = value
+        start = time.perf_counter()
+        yield Span()
+        print(f"span {name} {attributes} {(time.perf_counter() - start) * 1000:.1f}ms")
+
+    metrics = CustomsMetrics(span_factory=print_span)
+    for attempt, status_code in enumerate((503, 202)):
+        with metrics.track("POST /submissions", attempt) as timer:
+            time.sleep(0.02)
+            timer.status(status_code)
+        if status_code == 503:
+            metrics.record_retry("POST /submissions", status_code)
+
+    metrics.add_collector(lambda: [("customs_circuit_breaker_open", "gauge", "1 while the circuit is open", {}, 0)])
+    print(metrics.render_prometheus())
@@ -0,0 +1,449 @@
+#!/usr/bin/env python3
+"""
+Customs Outbox for BuryatMyasoprom
+Durable SQLite queue that decouples order processing from customs API latency
+"""
+
+import asyncio
+import json
+import sqlite3
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+import logging
+
+from china_customs_client import ChinaCustomsClient
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Outbox entry lifecycle
+PENDING = "PENDING"
+IN_FLIGHT = "IN_FLIGHT"
+DELIVERED = "DELIVERED"
+FAILED = "FAILED"
+
+# 4xx answers that may succeed later; any other 4xx is a permanent rejection
+RETRYABLE_CLIENT_ERRORS = (408, 425, 429)
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+class CustomsOutbox:
+    """At-least-once delivery of customs submissions through a SQLite outbox
+
+    enqueue() stores the prepared submission body (the exact bytes that get
+    signed and sent) under an idempotency key and returns at once. Async
+    workers claim due entries with a lease, POST them with the key in an
+    Idempotency-Key header and record the outcome. While a delivery runs
+    (retries, backoff and rate limit waits included) its worker renews the
+    lease every lease_seconds / 3; an entry whose worker died is claimed
+    again once its lease expires, so delivery is at least once and the
+    gateway deduplicates by key. Outcomes are only written under the lease
+    they were claimed with, so a worker that lost its lease cannot
+    overwrite the result of the worker that took the entry over.
+    """
+
+    def __init__(self, client: ChinaCustomsClient, db_path: str = "data/customs_outbox.db",
+                 workers: int = 4, lease_seconds: float = 120, max_attempts: int = 10,
+                 poll_interval: float = 1.0):
+        self.client = client
+        self.db_path = db_path
+        self.workers = workers
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self._worker_tasks = []
+        self._wakeup = None
+        self._stopping = False
+        self._stats = {"delivered": 0, "retried": 0, "failed": 0}
+        self._init_database()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _init_database(self):
+        """Initialize SQLite outbox table"""
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+
+        conn = self._connect()
+        cursor = conn.cursor()
+        # Workers read and write concurrently with enqueueing order processes
+        cursor.execute('PRAGMA journal_mode=WAL')
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS customs_outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                idempotency_key TEXT NOT NULL UNIQUE,
+                order_id TEXT,
+                body TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'PENDING',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_ts INTEGER NOT NULL,
+                lease_until_ts INTEGER,
+                created_ts INTEGER NOT NULL,
+                updated_ts INTEGER NOT NULL,
+                submission_id TEXT,
+                customs_reference TEXT,
+                last_status_code INTEGER,
+                last_error TEXT
+            )
+        ''')
+        # Claims scan due PENDING entries and expired IN_FLIGHT leases
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_customs_outbox_due ON customs_outbox(status, next_attempt_ts)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_customs_outbox_lease ON customs_outbox(status, lease_until_ts)')
+
+        conn.commit()
+        conn.close()
+
+        logger.info(f"Customs outbox initialized: {self.db_path}")
+
+    # Producer side
+
+    def enqueue(self, documents: List[Dict], order_data: Dict,
+                idempotency_key: Optional[str] = None) -> Dict:
+        """Queue a submission for delivery; returns without calling the gateway
+
+        Enqueueing the same idempotency_key twice returns the existing entry,
+        so an order pipeline that retries after a crash does not double-submit.
+        """
+        if not documents:
+            return {"success": False, "error": "No documents provided"}
+        if any("file_path" in doc and "attachment" not in doc for doc in documents):
+            # Workers only replay the stored JSON body; upload attachments before queueing
+            return {"success": False, "error": "Upload file-backed documents with upload_attachment before enqueueing"}
+
+        try:
+            submission_data = self.client._prepare_submission_data(documents, order_data)
+            # The stored body is the HMAC input: workers sign and send exactly these bytes
+            body = self.client.encoder.encode_submission(submission_data).decode('utf-8')
+        except (TypeError, ValueError) as e:
+            return {
+                "success": False,
+                "error": f"Failed to encode submission: {str(e)}"
+            }
+        idempotency_key = idempotency_key or uuid.uuid4().hex
+        now = _now_ms()
+
+        conn = self._connect()
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute('''
+                INSERT INTO customs_outbox (
+                    idempotency_key, order_id, body, status, next_attempt_ts, created_ts, updated_ts
+                ) VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (idempotency_key) DO NOTHING
+            ''', (idempotency_key, order_data.get("order_id"), body, PENDING, now, now, now))
+            created = cursor.rowcount == 1
+            conn.commit()
+
+            cursor.execute('SELECT id, status FROM customs_outbox WHERE idempotency_key = ?', (idempotency_key,))
+            row = cursor.fetchone()
+        except Exception as e:
+            return {
+                "success": False,
+                "error": f"Failed to enqueue submission: {str(e)}"
+            }
+        finally:
+            conn.close()
+
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+        return {
+            "success": True,
+            "outbox_id": row["id"],
+            "idempotency_key": idempotency_key,
+            "status": row["status"],
+            "duplicate": not created
+        }
+
+    def get_entry(self, idempotency_key: str) -> Dict:
+        """Delivery state of one queued submission"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT id, idempotency_key, order_id, status, attempts, created_ts, updated_ts,
+                   submission_id, customs_reference, last_status_code, last_error
+            FROM customs_outbox WHERE idempotency_key = ?
+        ''', (idempotency_key,))
+        row = cursor.fetchone()
+        conn.close()
+
+        if row is None:
+            return {
+                "success": False,
+                "error": f"Outbox entry {idempotency_key} not found"
+            }
+
+        entry = dict(row)
+        entry["created_at"] = datetime.fromtimestamp(entry.pop("created_ts") / 1000).isoformat()
+        entry["updated_at"] = datetime.fromtimestamp(entry.pop("updated_ts") / 1000).isoformat()
+        return {"success": True, "entry": entry}
+
+    def retry_failed(self, idempotency_key: Optional[str] = None) -> Dict:
+        """Put FAILED entries (or one of them) back in the queue with a fresh attempt count"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        now = _now_ms()
+        key_filter = "AND idempotency_key = ?" if idempotency_key else ""
+        params = [PENDING, now, now, FAILED] + ([idempotency_key] if idempotency_key else [])
+        cursor.execute(f'''
+            UPDATE customs_outbox
+            SET status = ?, attempts = 0, next_attempt_ts = ?, updated_ts = ?, lease_until_ts = NULL
+            WHERE status = ? {key_filter}
+        ''', params)
+        requeued = cursor.rowcount
+        conn.commit()
+        conn.close()
+
+        if requeued and self._wakeup is not None:
+            self._wakeup.set()
+        return {"success": True, "requeued": requeued}
+
+    # Consumer side
+
+    def _claim(self, limit: int = 1) -> List[Dict]:
+        """Lease up to limit due entries in one atomic statement"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        now = _now_ms()
+
+        try:
+            cursor.execute('''
+                UPDATE customs_outbox
+                SET status = ?, attempts = attempts + 1, lease_until_ts = ?, updated_ts = ?
+                WHERE id IN (
+                    SELECT id FROM customs_outbox
+                    WHERE status = ? AND next_attempt_ts <= ?
+                    UNION ALL
+                    SELECT id FROM customs_outbox
+                    WHERE status = ? AND lease_until_ts <= ?
+                    LIMIT ?
+                )
+                RETURNING id, idempotency_key, body, attempts, lease_until_ts
+            ''', (IN_FLIGHT, now + int(self.lease_seconds * 1000), now,
+                  PENDING, now, IN_FLIGHT, now, limit))
+            claimed = [dict(row) for row in cursor.fetchall()]
+            conn.commit()
+        finally:
+            conn.close()
+
+        return claimed
+
+    def _renew_lease(self, entry: Dict) -> bool:
+        """Extend the lease on an in-flight entry; False if another worker has taken it over"""
+        now = _now_ms()
+        lease_until_ts = now + int(self.lease_seconds * 1000)
+
+        conn = self._connect()
+        try:
+            cursor = conn.execute('''
+                UPDATE customs_outbox SET lease_until_ts = ?, updated_ts = ?
+                WHERE id = ? AND status = ? AND lease_until_ts = ?
+            ''', (lease_until_ts, now, entry["id"], IN_FLIGHT, entry["lease_until_ts"]))
+            renewed = cursor.rowcount == 1
+            conn.commit()
+        finally:
+            conn.close()
+
+        if renewed:
+            entry["lease_until_ts"] = lease_until_ts
+        return renewed
+
+    async def _keep_lease(self, entry: Dict, delivered: asyncio.Event):
+        """Renew the entry's lease until delivered is set or the lease is lost"""
+        while True:
+            try:
+                await asyncio.wait_for(delivered.wait(), timeout=self.lease_seconds / 3)
+                return
+            except asyncio.TimeoutError:
+                pass
+            try:
+                if not await asyncio.to_thread(self._renew_lease, entry):
+                    logger.warning(f"Outbox entry {entry['idempotency_key']} lease lost to another worker")
+                    return
+            except sqlite3.Error as e:
+                logger.warning(f"Outbox entry {entry['idempotency_key']} lease renewal failed: {str(e)}")
+
+    def _complete(self, entry: Dict, result: Dict):
+        """Record a delivery outcome and schedule a retry if one is warranted"""
+        status_code = result.get("status_code")
+        now = _now_ms()
+
+        if result["success"]:
+            new_status = DELIVERED
+            next_attempt_ts = now
+        elif self._is_retryable(status_code) and entry["attempts"] < self.max_attempts:
+            new_status = PENDING
+            delay = self.client.retry_policy.backoff_delay(entry["attempts"])
+            next_attempt_ts = now + int(delay * 1000)
+        else:
+            new_status = FAILED
+            next_attempt_ts = now
+
+        conn = self._connect()
+        try:
+            cursor = conn.execute('''
+                UPDATE customs_outbox
+                SET status = ?, next_attempt_ts = ?, lease_until_ts = NULL, updated_ts = ?,
+                    submission_id = COALESCE(?, submission_id),
+                    customs_reference = COALESCE(?, customs_reference),
+                    last_status_code = ?, last_error = ?
+                WHERE id = ? AND status = ? AND lease_until_ts = ?
+            ''', (new_status, next_attempt_ts, now,
+                  result.get("submission_id"), result.get("customs_reference"),
+                  status_code, None if result["success"] else result.get("error"),
+                  entry["id"], IN_FLIGHT, entry["lease_until_ts"]))
+            recorded = cursor.rowcount == 1
+            conn.commit()
+        finally:
+            conn.close()
+
+        if not recorded:
+            logger.warning(f"Outbox entry {entry['idempotency_key']} outcome discarded: lease was taken over")
+            return
+
+        if new_status == DELIVERED:
+            self._stats["delivered"] += 1
+        elif new_status == PENDING:
+            self._stats["retried"] += 1
+        else:
+            self._stats["failed"] += 1
+            logger.error(f"Outbox entry {entry['idempotency_key']} failed after {entry['attempts']} attempts: {result.get('error')}")
+
+    def _is_retryable(self, status_code: Optional[int]) -> bool:
+        """Transport errors, open circuit, 5xx and throttling are retried; other 4xx are not"""
+        if status_code is None or status_code >= 500:
+            return True
+        return status_code in RETRYABLE_CLIENT_ERRORS
+
+    async def _worker(self, worker_number: int):
+        while not self._stopping:
+            try:
+                entries = await asyncio.to_thread(self._claim, 1)
+            except sqlite3.Error as e:
+                logger.error(f"Outbox worker {worker_number} could not claim entries: {str(e)}")
+                entries = []
+            if not entries:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self._deliver(worker_number, entries[0])
+
+    async def _deliver(self, worker_number: int, entry: Dict):
+        """Send one claimed entry and record the outcome; never raises, so the worker keeps running"""
+        delivered = asyncio.Event()
+        lease_keeper = asyncio.create_task(self._keep_lease(entry, delivered))
+        try:
+            result = await self.client.submit_prepared_async(entry["body"], entry["idempotency_key"])
+        except Exception as e:
+            # e.g. a 202 whose body is not JSON; the idempotency key makes a resend safe
+            logger.error(f"Outbox worker {worker_number} failed delivering {entry['idempotency_key']}: {str(e)}")
+            result = {
+                "success": False,
+                "error": f"Delivery error: {str(e)}",
+                "status_code": None
+            }
+        finally:
+            # Wait for any renewal in progress so _complete sees the current lease
+            delivered.set()
+            await lease_keeper
+
+        try:
+            await asyncio.to_thread(self._complete, entry, result)
+        except sqlite3.Error as e:
+            # The entry stays IN_FLIGHT and is claimed again when its lease expires
+            logger.error(f"Outbox worker {worker_number} could not record outcome of "
+                         f"{entry['idempotency_key']}: {str(e)}")
+
+    # Lifecycle
+
+    def start(self):
+        """Start the worker pool on the running event loop"""
+        if self._worker_tasks:
+            return
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._worker_tasks = [
+            asyncio.create_task(self._worker(worker_number)) for worker_number in range(self.workers)
+        ]
+        logger.info(f"Customs outbox started with {self.workers} workers")
+
+    async def stop(self):
+        """Let workers finish their current delivery, then stop"""
+        self._stopping = True
+        if self._wakeup is not None:
+            self._wakeup.set()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+
+    async def drain(self, timeout: Optional[float] = None) -> bool:
+        """Wait until nothing is pending or in flight; False on timeout"""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            depth = (await asyncio.to_thread(self.get_stats))["depth"]
+            if depth[PENDING] + depth[IN_FLIGHT] == 0:
+                return True
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(self.poll_interval / 4)
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.stop()
+
+    def get_stats(self) -> Dict:
+        """Queue depth per status and age of the oldest undelivered entry"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute('SELECT status, COUNT(*) FROM customs_outbox GROUP BY status')
+        depth = {PENDING: 0, IN_FLIGHT: 0, DELIVERED: 0, FAILED: 0}
+        depth.update({status: count for status, count in cursor.fetchall()})
+
+        cursor.execute('''
+            SELECT MIN(created_ts) FROM customs_outbox WHERE status IN (?, ?)
+        ''', (PENDING, IN_FLIGHT))
+        oldest_ts = cursor.fetchone()[0]
+        conn.close()
+
+        return {
+            "depth": depth,
+            "oldest_undelivered_age_seconds": round((_now_ms() - oldest_ts) / 1000, 1) if oldest_ts else 0.0,
+            "workers": sum(1 for task in self._worker_tasks if not task.done()),
+            **self._stats
+        }
+
+# Example usage
+if __name__ == "__main__":
+    async def main():
+        async with ChinaCustomsClient() as client:
+            outbox = CustomsOutbox(client)
+
+            # Order processing only waits for a local SQLite insert
+            enqueue_result = outbox.enqueue(
+                [{"type": "customs_declaration", "content": {"hs_code": "0201.10", "product_value": 27500,
+                                                             "weight_kg": 5000, "country_of_origin": "RUSSIA"}}],
+                {"order_id": "BO-2024-001", "customer": {"name": "China Meat Import Co."}},
+                idempotency_key="BO-2024-001"
+            )
+            print(f"Enqueue Result: {json.dumps(enqueue_result, indent=2)}")
+
+            async with outbox:
+                await outbox.drain(timeout=30)
+                print(f"Outbox Stats: {json.dumps(outbox.get_stats(), indent=2)}")
+                print(f"Entry: {json.dumps(outbox.get_entry('BO-2024-001'), indent=2)}")
+
+    asyncio.run(main())
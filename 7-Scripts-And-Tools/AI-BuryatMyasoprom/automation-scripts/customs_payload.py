@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Customs Payload Encoder for BuryatMyasoprom
+Canonical single-pass JSON encoding of customs submissions for signing and sending
+"""
+
+import hashlib
+import json
+import threading
+import uuid
+from typing import Dict, Tuple
+import logging
+
+try:
+    import orjson
+except ImportError:  # orjson is optional and only used when configured explicitly
+    orjson = None
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+JSON_BACKENDS = ("json", "orjson")
+
+class CanonicalEncoder:
+    """Encodes submissions once into the bytes that are signed and sent
+
+    Canonical form is UTF-8 JSON with sorted keys and no insignificant
+    whitespace, as written by the stdlib encoder. The backend is pinned by
+    configuration, never picked by what happens to be installed: orjson is
+    faster but not byte-identical (it writes 1e16 where json writes 1e+16,
+    and rejects integers over 64 bits), so every process that signs or
+    checksums submissions for the gateway must use the same backend.
+
+    Document contents dominate package size, so encode_submission() encodes
+    each content exactly once: the bytes are hashed for the document's
+    checksum and spliced into the envelope instead of being encoded again.
+    Nothing is cached between calls, so a content dict edited in place and
+    submitted again is always encoded and checksummed afresh.
+    """
+
+    def __init__(self, backend: str = "json"):
+        if backend not in JSON_BACKENDS:
+            raise ValueError(f"Unknown JSON backend {backend}; expected one of {JSON_BACKENDS}")
+        if backend == "orjson" and orjson is None:
+            raise ImportError("The orjson JSON backend requires orjson (pip install orjson)")
+        self.backend = backend
+        self._lock = threading.Lock()
+        self._stats = {"submissions": 0, "documents": 0}
+
+    def dumps(self, data) -> bytes:
+        """Canonical JSON bytes of data; raises TypeError/ValueError for unencodable data"""
+        if self.backend == "orjson":
+            # Non-str keys are written as strings, as the stdlib encoder does
+            return orjson.dumps(data, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)
+        return json.dumps(data, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode('utf-8')
+
+    def encode_document(self, content: Dict) -> Tuple[bytes, str]:
+        """Canonical bytes and SHA-256 checksum of one document's content"""
+        encoded = self.dumps(content)
+        return encoded, hashlib.sha256(encoded).hexdigest()
+
+    def encode_submission(self, submission_data: Dict) -> bytes:
+        """Canonical bytes of a prepared submission, encoding each document content once
+
+        Every document with a "content" key gets "checksum" set to the
+        SHA-256 of its content bytes (the caller's dicts are not modified).
+        The envelope is encoded with a placeholder string in place of every
+        content, then the placeholders are replaced by the content bytes in a
+        single join. Documents without a "content" key (attachment
+        references) are encoded as they are.
+        """
+        documents = submission_data.get("documents", [])
+        marker = f"customs-document-{uuid.uuid4().hex}"
+        encoded_contents = {}
+        envelope_documents = []
+        for index, document in enumerate(documents):
+            if "content" not in document:
+                envelope_documents.append(document)
+                continue
+            encoded, checksum = self.encode_document(document["content"])
+            encoded_contents[index] = encoded
+            envelope_documents.append({**document, "content": f"{marker}-{index}", "checksum": checksum})
+        envelope = dict(submission_data)
+        envelope["documents"] = envelope_documents
+        encoded_envelope = self.dumps(envelope)
+
+        parts = []
+        position = 0
+        for index, encoded in encoded_contents.items():
+            placeholder = f'"{marker}-{index}"'.encode('utf-8')
+            found = encoded_envelope.index(placeholder, position)
+            parts.append(encoded_envelope[position:found])
+            parts.append(encoded)
+            position = found + len(placeholder)
+        parts.append(encoded_envelope[position:])
+
+        with self._lock:
+            self._stats["submissions"] += 1
+            self._stats["documents"] += len(encoded_contents)
+        return b"".join(parts)
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {"backend": self.backend, **self._stats}
+
+# Example usage
+if __name__ == "__main__":
+    encoder = CanonicalEncoder()
+
+    content = {"hs_code": "0201.10", "product_value": 27500, "weight_kg": 5000, "country_of_origin": "RUSSIA"}
+    submission = {
+        "submission_type": "MEAT_EXPORT",
+        "documents": [{"type": "customs_declaration", "content": content, "format": "JSON"}]
+    }
+
+    body = encoder.encode_submission(submission)
+    print(f"Canonical body ({len(body)} bytes): {body.decode('utf-8')}")
+    print(f"Encoder Stats: {json.dumps(encoder.get_stats(), indent=2)}")
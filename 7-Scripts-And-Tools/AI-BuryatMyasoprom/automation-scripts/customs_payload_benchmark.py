@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Customs Payload Benchmark for BuryatMyasoprom
+Compares the legacy multi-serialization submit path with CanonicalEncoder on large packages
+"""
+
+import argparse
+import hashlib
+import hmac
+import json
+import platform
+import random
+import statistics
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+import logging
+
+from customs_payload import CanonicalEncoder, orjson
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+SECRET_KEY = b"benchmark-secret"
+
+DOCUMENT_TYPES = ["health_certificate", "customs_declaration", "commercial_invoice",
+                  "packing_list", "certificate_of_origin", "veterinary_certificate"]
+
+def build_package(target_mb: float, documents: int, seed: int = 42) -> Dict:
+    """Submission whose documents carry about target_mb of cold-chain and lot records"""
+    rng = random.Random(seed)
+    started = datetime(2024, 1, 1)
+    package_documents = []
+    per_document = target_mb * 2**20 / documents
+
+    for index in range(documents):
+        content = {
+            "document_number": f"DOC-{index:04d}",
+            "issued_by": "Buryat Veterinary Service",
+            "product": rng.choice(["BEEF", "LAMB", "HORSE"]),
+            "temperature_log": [],
+            "lots": []
+        }
+        size = 0
+        while size < per_document:
+            reading = {
+                "timestamp": (started + timedelta(minutes=5 * len(content["temperature_log"]))).isoformat(),
+                "temperature_c": round(rng.uniform(-20, -15), 2),
+                "sensor_id": f"SENSOR-{rng.randint(1, 40):03d}",
+                "location": rng.choice(["Ulan-Ude Cold Store", "Kyakhta Border Crossing", "Zabaikalsk Rail Terminal"])
+            }
+            content["temperature_log"].append(reading)
+            if len(content["temperature_log"]) % 20 == 0:
+                content["lots"].append({"lot": f"LOT-{len(content['lots']):05d}", "weight_kg": rng.randint(200, 900),
+                                        "note": "Замороженная говядина, без костей"})
+            size += 150
+        package_documents.append({"type": DOCUMENT_TYPES[index % len(DOCUMENT_TYPES)], "content": content})
+
+    return {
+        "submission_type": "MEAT_EXPORT",
+        "exporter_info": {"name": "BuryatMyasoprom", "address": "Ulan-Ude, Republic of Buryatia, Russia"},
+        "metadata": {"submission_date": started.isoformat(), "system_version": "1.0", "order_id": "BO-BENCH-001"},
+        "documents": package_documents
+    }
+
+def _sign(body: bytes, timestamp: str) -> str:
+    return hmac.new(SECRET_KEY, timestamp.encode('utf-8') + body, hashlib.sha256).hexdigest()
+
+def legacy_pipeline(package: Dict) -> int:
+    """The submit path before CanonicalEncoder: three serializations of every document"""
+    submission = dict(package)
+    submission["documents"] = [
+        {**document, "format": "JSON",
+         "checksum": hashlib.sha256(json.dumps(document["content"]).encode('utf-8')).hexdigest()}
+        for document in package["documents"]
+    ]
+    timestamp = datetime.utcnow().isoformat()
+    # Signed over one serialization ...
+    _sign(json.dumps(submission, sort_keys=True).encode('utf-8'), timestamp)
+    # ... and sent as another (what requests does with json=)
+    body = json.dumps(submission).encode('utf-8')
+    return len(body)
+
+def canonical_pipeline(encoder: CanonicalEncoder, package: Dict) -> int:
+    """Encode each document once, then sign and send the same bytes"""
+    submission = dict(package)
+    submission["documents"] = [{**document, "format": "JSON"} for document in package["documents"]]
+    body = encoder.encode_submission(submission)
+    _sign(body, datetime.utcnow().isoformat())
+    return len(body)
+
+class PayloadBenchmark:
+    """Times each pipeline and measures its peak allocation"""
+
+    def __init__(self, package_mb: float = 10.0, documents: int = 12, repeats: int = 7, seed: int = 42):
+        self.package_mb = package_mb
+        self.documents = documents
+        self.repeats = repeats
+        self.package = build_package(package_mb, documents, seed)
+
+    def _measure(self, pipeline: Callable[[], int]) -> Dict:
+        timings_ms = []
+        for _ in range(self.repeats):
+            start = time.perf_counter()
+            body_size = pipeline()
+            timings_ms.append((time.perf_counter() - start) * 1000)
+
+        tracemalloc.start()
+        pipeline()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        return {
+            "median_ms": round(statistics.median(timings_ms), 1),
+            "min_ms": round(min(timings_ms), 1),
+            "max_ms": round(max(timings_ms), 1),
+            "peak_alloc_mb": round(peak / 2**20, 1),
+            "body_mb": round(body_size / 2**20, 2)
+        }
+
+    def run(self) -> Dict:
+        started_at = datetime.now()
+        results = {"legacy": self._measure(lambda: legacy_pipeline(self.package))}
+
+        backends = ["json"] + (["orjson"] if orjson is not None else [])
+        for backend in backends:
+            encoder = CanonicalEncoder(backend)
+            logger.info(f"Measuring canonical pipeline with {backend}")
+            results[f"canonical_{backend}"] = self._measure(lambda: canonical_pipeline(encoder, self.package))
+
+        legacy_ms = results["legacy"]["median_ms"]
+        for name, result in results.items():
+            result["speedup_vs_legacy"] = round(legacy_ms / result["median_ms"], 2) if result["median_ms"] else None
+
+        if orjson is None:
+            logger.info("orjson not installed; fast backend skipped (pip install orjson)")
+
+        return {
+            "environment": {
+                "python": platform.python_version(),
+                "orjson": getattr(orjson, "__version__", None),
+                "package_mb": self.package_mb,
+                "documents": self.documents,
+                "repeats": self.repeats
+            },
+            "results": results,
+            "started_at": started_at.isoformat(),
+            "duration_seconds": round((datetime.now() - started_at).total_seconds(), 1)
+        }
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Benchmark customs submission payload encoding")
+    parser.add_argument("--package-mb", type=float, default=10.0, help="approximate size of the document package")
+    parser.add_argument("--documents", type=int, default=12, help="documents in the package")
+    parser.add_argument("--repeats", type=int, default=7, help="timed runs per pipeline")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=None, help="write JSON results to this file")
+    args = parser.parse_args(argv)
+
+    benchmark = PayloadBenchmark(args.package_mb, args.documents, args.repeats, args.seed)
+    results = benchmark.run()
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+        logger.info(f"Benchmark results written to {args.output}")
+    print(output)
+
+if __name__ == "__main__":
+    main()
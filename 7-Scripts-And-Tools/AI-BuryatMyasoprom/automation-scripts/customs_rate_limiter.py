@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""
+Customs Rate Limiter for BuryatMyasoprom
+Per-endpoint token buckets that keep customs API calls under the gateway's limits
+"""
+
+import asyncio
+import random
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+import logging
+
+from customs_resilience import get_header, retry_after_seconds
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Header spellings used by gateways for the remaining quota and its reset time
+REMAINING_HEADERS = ("X-RateLimit-Remaining", "RateLimit-Remaining")
+RESET_HEADERS = ("X-RateLimit-Reset", "RateLimit-Reset")
+
+# Reset values above this are epoch timestamps rather than seconds from now
+EPOCH_THRESHOLD = 1_000_000_000
+
+class TokenBucket:
+    """Token bucket kept as a theoretical arrival time (GCRA)
+
+    State is the current rate and tat, the time at which the bucket would
+    be full again. try_take() either takes a token or says how long until
+    the next one, so no lock is held while waiting and the same bucket
+    serves threads and coroutines. Waiters check again after sleeping
+    instead of holding a slot in advance, so a rate cut or pause applies to
+    callers already queued.
+    """
+
+    def __init__(self, name: str, rate: float, burst: int = 1, min_rate: Optional[float] = None):
+        self.name = name
+        self.max_rate = float(rate)
+        self.burst = max(1, int(burst))
+        self.min_rate = min_rate if min_rate is not None else self.max_rate * 0.05
+        self._lock = threading.Lock()
+        self._state = {"tat": 0.0, "rate": self.max_rate, "cooldown_until": 0.0}
+        self._stats = {"acquired": 0, "delayed": 0, "waited_seconds": 0.0, "blocks": 0}
+
+    def _transaction(self, update):
+        """Apply update(state) atomically and return its result"""
+        with self._lock:
+            return update(self._state)
+
+    def _tolerance(self, rate: float) -> float:
+        # How far ahead of now tat may run before callers have to wait
+        return (self.burst - 1) / rate
+
+    def try_take(self) -> float:
+        """Take a token and return 0, or return the seconds until one is due"""
+        def update(state):
+            now = time.time()
+            rate = state["rate"]
+            wait = state["tat"] - self._tolerance(rate) - now
+            if wait > 0:
+                return wait
+            state["tat"] = max(state["tat"], now) + 1 / rate
+            return 0.0
+
+        return self._transaction(update)
+
+    def _next_wait(self, wait: float) -> float:
+        # Spread waiters over one token interval so they do not all wake together
+        return wait + random.uniform(0, 1 / self.max_rate)
+
+    def _record_acquired(self, waited: float):
+        with self._lock:
+            self._stats["acquired"] += 1
+            if waited > 0:
+                self._stats["delayed"] += 1
+                self._stats["waited_seconds"] += waited
+
+    def acquire(self):
+        """Block the calling thread until a token is available"""
+        started = time.monotonic()
+        while True:
+            wait = self.try_take()
+            if wait == 0:
+                break
+            time.sleep(self._next_wait(wait))
+        self._record_acquired(time.monotonic() - started)
+
+    async def acquire_async(self):
+        started = time.monotonic()
+        while True:
+            wait = await self._try_take_async()
+            if wait == 0:
+                break
+            await asyncio.sleep(self._next_wait(wait))
+        self._record_acquired(time.monotonic() - started)
+
+    async def _try_take_async(self) -> float:
+        return self.try_take()
+
+    def block_until(self, until: float):
+        """Hold every caller until the wall-clock time until, then resume at one token per slot"""
+        def update(state):
+            state["tat"] = max(state["tat"], until + self._tolerance(state["rate"]))
+
+        self._transaction(update)
+        with self._lock:
+            self._stats["blocks"] += 1
+
+    def back_off(self, factor: float, pause: float) -> float:
+        """Pause all callers and cut the rate once per pause
+
+        A burst of 429s from one overload counts as a single signal: the
+        rate is only cut again after the previous pause has run out.
+        """
+        def update(state):
+            now = time.time()
+            if now >= state["cooldown_until"]:
+                state["rate"] = max(self.min_rate, state["rate"] * factor)
+                state["cooldown_until"] = now + pause
+            state["tat"] = max(state["tat"], now + pause + self._tolerance(state["rate"]))
+            return state["rate"]
+
+        rate = self._transaction(update)
+        with self._lock:
+            self._stats["blocks"] += 1
+        return rate
+
+    def scale_rate(self, factor: float = 1.0, target: Optional[float] = None,
+                   increment: float = 0.0) -> float:
+        """Multiply, replace or bump the current rate, clamped to [min_rate, max_rate]"""
+        def update(state):
+            rate = target if target is not None else state["rate"] * factor + increment
+            state["rate"] = min(self.max_rate, max(self.min_rate, rate))
+            return state["rate"]
+
+        return self._transaction(update)
+
+    @property
+    def rate(self) -> float:
+        return self._transaction(lambda state: state["rate"])
+
+    def get_stats(self) -> Dict:
+        state = self._transaction(dict)
+        with self._lock:
+            stats = dict(self._stats)
+        rate = state["rate"]
+        # Tokens left: how far tat is from running ahead by the full burst
+        available = self.burst - max(0.0, state["tat"] - time.time()) * rate
+        return {
+            "rate": round(rate, 3),
+            "max_rate": self.max_rate,
+            "burst": self.burst,
+            "available_tokens": round(max(0.0, available), 2),
+            **{key: round(value, 3) if isinstance(value, float) else value
+               for key, value in stats.items()}
+        }
+
+class SQLiteTokenBucket(TokenBucket):
+    """TokenBucket whose state lives in a shared SQLite file
+
+    Every reserve runs in a BEGIN IMMEDIATE transaction, so all processes on
+    the host that point at the same db_path draw from one bucket per
+    endpoint, and a rate cut after a 429 in one process slows all of them.
+    """
+
+    def __init__(self, name: str, rate: float, burst: int = 1, min_rate: Optional[float] = None,
+                 db_path: str = "data/customs_rate_limits.db"):
+        super().__init__(name, rate, burst, min_rate)
+        self.db_path = db_path
+        self._init_database()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        # Bucket state is advisory; losing the last update on power failure is harmless
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _init_database(self):
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        conn = self._connect()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+                name TEXT PRIMARY KEY,
+                tat REAL NOT NULL,
+                rate REAL NOT NULL,
+                cooldown_until REAL NOT NULL DEFAULT 0
+            ) WITHOUT ROWID
+        ''')
+        conn.execute('INSERT OR IGNORE INTO rate_limit_buckets (name, tat, rate) VALUES (?, 0, ?)',
+                     (self.name, self.max_rate))
+        conn.close()
+
+    def _transaction(self, update):
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('SELECT tat, rate, cooldown_until FROM rate_limit_buckets WHERE name = ?',
+                               (self.name,)).fetchone()
+            # Another process may have been configured with a higher rate
+            state = {"tat": row[0], "rate": min(row[1], self.max_rate), "cooldown_until": row[2]}
+            result = update(state)
+            conn.execute('UPDATE rate_limit_buckets SET tat = ?, rate = ?, cooldown_until = ? WHERE name = ?',
+                         (state["tat"], state["rate"], state["cooldown_until"], self.name))
+            conn.execute('COMMIT')
+            return result
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+
+    async def _try_take_async(self) -> float:
+        # The transaction may wait on another process's lock; keep it off the event loop
+        return await asyncio.to_thread(self.try_take)
+
+class CustomsRateLimiter:
+    """Token bucket per customs endpoint, adapting to the gateway's feedback
+
+    Endpoints are keyed the same way as retry budgets ("POST /submissions",
+    "GET /submissions/{id}", "GET /regulations"); endpoints without a
+    configured limit are not throttled. observe() adapts a bucket after
+    every response: a 429 pauses the endpoint for Retry-After and cuts its
+    rate, rate-limit headers set the rate the remaining quota allows,
+    and plain successes raise the rate back toward the configured limit.
+    """
+
+    def __init__(self, config: Dict):
+        self.config = config
+        self.enabled = config.get("enabled", True)
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, endpoint: str) -> Optional[TokenBucket]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            if endpoint in self._buckets:
+                return self._buckets[endpoint]
+
+            limit = self.config.get("endpoints", {}).get(endpoint)
+            bucket = None
+            if limit:
+                min_rate = limit["rate"] * self.config.get("min_rate_fraction", 0.05)
+                if self.config.get("backend", "memory") == "sqlite":
+                    bucket = SQLiteTokenBucket(endpoint, limit["rate"], limit.get("burst", 1), min_rate,
+                                               db_path=self.config.get("db_path", "data/customs_rate_limits.db"))
+                else:
+                    bucket = TokenBucket(endpoint, limit["rate"], limit.get("burst", 1), min_rate)
+            self._buckets[endpoint] = bucket
+            return bucket
+
+    def acquire(self, endpoint: str):
+        bucket = self._bucket(endpoint)
+        if bucket is not None:
+            bucket.acquire()
+
+    async def acquire_async(self, endpoint: str):
+        bucket = self._bucket(endpoint)
+        if bucket is not None:
+            await bucket.acquire_async()
+
+    def observe(self, endpoint: str, status_code: int, headers: Optional[Dict] = None):
+        """Adapt the endpoint's bucket to one gateway response"""
+        bucket = self._bucket(endpoint)
+        if bucket is None:
+            return
+
+        if status_code == 429:
+            retry_after = retry_after_seconds(headers)
+            pause = retry_after if retry_after is not None else 1 / bucket.rate
+            rate = bucket.back_off(self.config.get("decrease_factor", 0.5), pause)
+            logger.warning(f"Rate limited on {endpoint}; slowing to {rate:.2f} req/s"
+                           + (f", paused {retry_after:.1f}s" if retry_after is not None else ""))
+            return
+
+        remaining = self._header_number(headers, REMAINING_HEADERS)
+        reset = self._header_number(headers, RESET_HEADERS)
+        if remaining is not None and reset is not None:
+            if reset > EPOCH_THRESHOLD:
+                reset -= time.time()
+            reset = max(reset, 0.0)
+            if remaining < 1:
+                bucket.block_until(time.time() + reset)
+            elif reset > 0:
+                # Spread the remaining quota evenly over the rest of the window
+                bucket.scale_rate(target=remaining / reset)
+            return
+
+        if 200 <= status_code < 500:
+            bucket.scale_rate(increment=bucket.max_rate * self.config.get("increase_fraction", 0.005))
+
+    def _header_number(self, headers: Optional[Dict], names) -> Optional[float]:
+        for name in names:
+            value = get_header(headers, name)
+            if value is not None:
+                try:
+                    return float(value)
+                except ValueError:
+                    return None
+        return None
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            buckets = {endpoint: bucket for endpoint, bucket in self._buckets.items() if bucket is not None}
+        return {endpoint: bucket.get_stats() for endpoint, bucket in buckets.items()}
+
+# Example usage
+if __name__ == "__main__":
+    import json
+
+    limiter = CustomsRateLimiter({
+        "backend": "sqlite",
+        "db_path": "data/customs_rate_limits.db",
+        "endpoints": {"POST /submissions": {"rate": 5, "burst": 2}}
+    })
+
+    start = time.time()
+    for _ in range(10):
+        limiter.acquire("POST /submissions")
+    print(f"10 submissions admitted in {time.time() - start:.2f}s")
+
+    # The gateway answered 429 with Retry-After: 2 -> rate halves, callers pause
+    limiter.observe("POST /submissions", 429, {"Retry-After": "2"})
+    print(f"Rate Limiter Stats: {json.dumps(limiter.get_stats(), indent=2)}")
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Customs Resilience for BuryatMyasoprom
+Retry backoff, retry budgets and circuit breaking for the China Customs gateway
+"""
+
+import random
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+import logging
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Statuses worth retrying: server errors (5xx) and rate limiting (429)
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# Statuses whose Retry-After header tells us when to come back
+RETRY_AFTER_STATUS_CODES = (429, 503)
+
+def get_header(headers: Optional[Dict], name: str) -> Optional[str]:
+    """Case-insensitive header lookup for requests, aiohttp and plain dict headers"""
+    if not headers:
+        return None
+    name = name.lower()
+    for header_name, value in headers.items():
+        if header_name.lower() == name:
+            return value
+    return None
+
+def retry_after_seconds(headers: Optional[Dict]) -> Optional[float]:
+    """Seconds requested by a Retry-After header, given as a delta or an HTTP date"""
+    value = get_header(headers, "Retry-After")
+    if value is None:
+        return None
+
+    try:
+        delay = float(value)
+    except ValueError:
+        try:
+            retry_at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if retry_at.tzinfo is None:
+            retry_at = retry_at.replace(tzinfo=timezone.utc)
+        delay = (retry_at - datetime.now(timezone.utc)).total_seconds()
+
+    return max(delay, 0.0)
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the gateway while the circuit breaker is open"""
+
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"Circuit {name} is open; retry in {retry_in:.1f}s")
+        self.name = name
+        self.retry_in = retry_in
+
+class RetryPolicy:
+    """Exponential backoff with full jitter, deferring to Retry-After when given"""
+
+    def __init__(self, max_retries: int = 3, base_delay: float = 5.0,
+                 max_delay: float = 60.0, multiplier: float = 2.0,
+                 rng: Optional[random.Random] = None):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self._rng = rng or random.Random()
+
+    def backoff_delay(self, attempt: int) -> float:
+        """Full jitter: uniform in [0, min(max_delay, base * multiplier^attempt)]"""
+        ceiling = min(self.max_delay, self.base_delay * (self.multiplier ** attempt))
+        return self._rng.uniform(0, ceiling)
+
+    def retry_after_delay(self, headers: Optional[Dict]) -> Optional[float]:
+        """Seconds requested by a Retry-After header (delta or HTTP date), capped at max_delay"""
+        delay = retry_after_seconds(headers)
+        if delay is None:
+            return None
+        return min(delay, self.max_delay)
+
+    def delay_for(self, attempt: int, status_code: Optional[int] = None,
+                  headers: Optional[Dict] = None) -> float:
+        if status_code in RETRY_AFTER_STATUS_CODES:
+            retry_after = self.retry_after_delay(headers)
+            if retry_after is not None:
+                return retry_after
+        return self.backoff_delay(attempt)
+
+class RetryBudget:
+    """Caps retries at a fraction of recent requests to one endpoint
+
+    Within a sliding window, retries are allowed while
+    retries < min_retries + ratio * requests, so a struggling gateway sees
+    at most about (1 + ratio) times normal traffic instead of
+    (1 + max_retries) times.
+    """
+
+    def __init__(self, ratio: float = 0.2, min_retries: int = 3, window_seconds: float = 10.0):
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.window_seconds = window_seconds
+        self._requests = deque()
+        self._retries = deque()
+        self._lock = threading.Lock()
+        self.exhausted_count = 0
+
+    def _prune(self, now: float):
+        cutoff = now - self.window_seconds
+        while self._requests and self._requests[0] < cutoff:
+            self._requests.popleft()
+        while self._retries and self._retries[0] < cutoff:
+            self._retries.popleft()
+
+    def record_request(self):
+        now = time.monotonic()
+        with self._lock:
+            self._prune(now)
+            self._requests.append(now)
+
+    def try_acquire_retry(self) -> bool:
+        """Spend one retry from the budget; False when it is exhausted"""
+        now = time.monotonic()
+        with self._lock:
+            self._prune(now)
+            if len(self._retries) >= self.min_retries + self.ratio * len(self._requests):
+                self.exhausted_count += 1
+                return False
+            self._retries.append(now)
+            return True
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            self._prune(time.monotonic())
+            return {
+                "requests_in_window": len(self._requests),
+                "retries_in_window": len(self._retries),
+                "exhausted_count": self.exhausted_count
+            }
+
+class CircuitBreaker:
+    """CLOSED -> OPEN after consecutive failures, HALF_OPEN probe after reset_timeout
+
+    While OPEN every call fails fast with CircuitOpenError. In HALF_OPEN a
+    limited number of probe calls go through; a success closes the circuit
+    and a failure opens it again for another reset_timeout. A caller that
+    ends a call without recording an outcome (cancelled, or failed before
+    the gateway answered) must call release() to hand its probe slot back;
+    as a backstop, probe slots held longer than reset_timeout are reclaimed.
+    """
+
+    CLOSED = "CLOSED"
+    OPEN = "OPEN"
+    HALF_OPEN = "HALF_OPEN"
+
+    def __init__(self, name: str, failure_threshold: int = 5,
+                 reset_timeout: float = 30.0, half_open_max_calls: int = 1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self._state = self.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+        self._probe_started_at = 0.0
+        self._lock = threading.Lock()
+        self._stats = {"failures": 0, "successes": 0, "rejected": 0, "opened": 0, "probes_reclaimed": 0}
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._refresh_state(time.monotonic())
+            return self._state
+
+    def _refresh_state(self, now: float):
+        if self._state == self.OPEN and now - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._half_open_calls = 0
+        elif (self._state == self.HALF_OPEN and self._half_open_calls
+              and now - self._probe_started_at >= self.reset_timeout):
+            # A probe that never reported back must not wedge the circuit
+            logger.warning(f"Circuit {self.name} reclaimed {self._half_open_calls} unanswered probe slot(s)")
+            self._half_open_calls = 0
+            self._stats["probes_reclaimed"] += 1
+
+    def before_call(self):
+        """Admit a call or raise CircuitOpenError"""
+        now = time.monotonic()
+        with self._lock:
+            self._refresh_state(now)
+            if self._state == self.CLOSED:
+                return
+            if self._state == self.HALF_OPEN:
+                if self._half_open_calls < self.half_open_max_calls:
+                    self._half_open_calls += 1
+                    self._probe_started_at = now
+                    return
+                retry_in = max(0.0, self.reset_timeout - (now - self._probe_started_at))
+            else:
+                retry_in = max(0.0, self.reset_timeout - (now - self._opened_at))
+            self._stats["rejected"] += 1
+        raise CircuitOpenError(self.name, retry_in)
+
+    def release(self):
+        """Hand back the slot of an admitted call that ended without an outcome"""
+        with self._lock:
+            if self._state == self.HALF_OPEN and self._half_open_calls > 0:
+                self._half_open_calls -= 1
+
+    def record_success(self):
+        with self._lock:
+            self._stats["successes"] += 1
+            self._consecutive_failures = 0
+            if self._state != self.CLOSED:
+                logger.info(f"Circuit {self.name} closed")
+            self._state = self.CLOSED
+
+    def record_failure(self):
+        with self._lock:
+            self._stats["failures"] += 1
+            self._consecutive_failures += 1
+            if self._state == self.HALF_OPEN or (
+                self._state == self.CLOSED and self._consecutive_failures >= self.failure_threshold
+            ):
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._stats["opened"] += 1
+                logger.warning(f"Circuit {self.name} opened after {self._consecutive_failures} consecutive failures")
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            self._refresh_state(time.monotonic())
+            return {"state": self._state, "consecutive_failures": self._consecutive_failures, **self._stats}
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+Customs Status Poller for BuryatMyasoprom
+Tracks many in-flight customs submissions from a single asyncio service
+"""
+
+import asyncio
+import heapq
+import inspect
+import json
+import random
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+import logging
+
+from china_customs_client import ChinaCustomsClient
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+FINAL_STATUSES = ("APPROVED", "REJECTED", "CANCELLED")
+
+# (first interval, max interval) in seconds per status. Intervals start short
+# after each status change and grow by INTERVAL_GROWTH while nothing changes.
+POLL_INTERVALS = {
+    "SUBMITTED": (15, 60),
+    "UNDER_REVIEW": (120, 900),
+    "ADDITIONAL_INFO_REQUIRED": (60, 300),
+}
+
+INTERVAL_GROWTH = 1.5
+
+# Spread checks of submissions filed together so they do not poll in lockstep
+INTERVAL_JITTER = 0.1
+
+# Backoff after failed status checks (transport errors, open circuit)
+ERROR_BACKOFF = (30, 600)
+
+@dataclass
+class _TrackedSubmission:
+    submission_id: str
+    status: str
+    added_at: float
+    checks: int = 0
+    unchanged_checks: int = 0
+    consecutive_errors: int = 0
+    generation: int = 0
+    next_check: float = 0.0
+    last_result: Dict = field(default_factory=dict)
+
+class SubmissionStatusPoller:
+    """One poll loop for any number of submissions
+
+    Submissions wait in a heap keyed by next check time. Due checks run
+    concurrently (at most max_concurrency at once) over the client's shared
+    aiohttp session. Status changes and final outcomes are delivered to
+    registered callbacks and to every changes() iterator.
+    """
+
+    def __init__(self, client: ChinaCustomsClient, max_concurrency: int = 20,
+                 intervals: Optional[Dict[str, Tuple[float, float]]] = None,
+                 max_checks: Optional[int] = None):
+        self.client = client
+        self.max_concurrency = max_concurrency
+        self.intervals = {**POLL_INTERVALS, **(intervals or {})}
+        default_interval = client.config["monitoring"]["status_check_interval"]
+        self.default_interval = (default_interval, default_interval)
+        self.max_checks = max_checks or client.config["monitoring"]["max_status_checks"]
+
+        self._tracked = {}
+        self._heap = []
+        self._sequence = 0
+        self._callbacks = []
+        self._subscribers = []
+        self._in_flight = set()
+        self._semaphore = None
+        self._wakeup = None
+        self._task = None
+        self._rng = random.Random()
+        self._stats = {"checks": 0, "errors": 0, "status_changes": 0, "completed": 0, "timed_out": 0}
+
+    # Registration
+
+    def track(self, submission_id: str, status: str = "SUBMITTED", first_check_in: Optional[float] = None):
+        """Start tracking a submission; its first check follows the status's fast interval"""
+        tracked = self._tracked.get(submission_id)
+        if tracked is None:
+            tracked = _TrackedSubmission(submission_id, status, time.monotonic())
+            self._tracked[submission_id] = tracked
+        else:
+            tracked.status = status
+            tracked.unchanged_checks = 0
+
+        delay = first_check_in if first_check_in is not None else self._interval(tracked)
+        self._schedule(tracked, delay)
+        logger.info(f"Tracking submission {submission_id} ({status}), first check in {delay:.0f}s")
+
+    def untrack(self, submission_id: str):
+        """Stop tracking; any queued check for it is skipped"""
+        self._tracked.pop(submission_id, None)
+
+    def add_callback(self, callback: Callable[[Dict], None]):
+        """Register a function or coroutine function called with every status change"""
+        self._callbacks.append(callback)
+
+    async def changes(self) -> AsyncIterator[Dict]:
+        """Async iterator over status changes from the moment it is started"""
+        queue = asyncio.Queue()
+        self._subscribers.append(queue)
+        try:
+            while True:
+                change = await queue.get()
+                if change is None:
+                    return
+                yield change
+        finally:
+            self._subscribers.remove(queue)
+
+    # Scheduling
+
+    def _interval(self, tracked: _TrackedSubmission) -> float:
+        if tracked.consecutive_errors:
+            first, maximum = ERROR_BACKOFF
+            interval = min(maximum, first * (2 ** (tracked.consecutive_errors - 1)))
+        else:
+            first, maximum = self.intervals.get(tracked.status, self.default_interval)
+            interval = min(maximum, first * (INTERVAL_GROWTH ** tracked.unchanged_checks))
+        return interval * self._rng.uniform(1 - INTERVAL_JITTER, 1 + INTERVAL_JITTER)
+
+    def _schedule(self, tracked: _TrackedSubmission, delay: float):
+        # Rescheduling bumps the generation so the older heap entry is ignored
+        tracked.generation += 1
+        tracked.next_check = time.monotonic() + delay
+        self._sequence += 1
+        heapq.heappush(self._heap, (tracked.next_check, self._sequence, tracked.submission_id, tracked.generation))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _pop_due(self, now: float) -> List[_TrackedSubmission]:
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            _, _, submission_id, generation = heapq.heappop(self._heap)
+            tracked = self._tracked.get(submission_id)
+            if tracked is not None and tracked.generation == generation:
+                due.append(tracked)
+        return due
+
+    # Poll loop
+
+    async def run(self):
+        """Poll until stop() is called"""
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._wakeup = asyncio.Event()
+
+        while True:
+            now = time.monotonic()
+            for tracked in self._pop_due(now):
+                task = asyncio.create_task(self._check(tracked))
+                self._in_flight.add(task)
+                task.add_done_callback(self._in_flight.discard)
+
+            timeout = self._heap[0][0] - time.monotonic() if self._heap else None
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=max(timeout, 0) if timeout is not None else None)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _check(self, tracked: _TrackedSubmission):
+        async with self._semaphore:
+            if self._tracked.get(tracked.submission_id) is not tracked:
+                return
+            result = await self.client.check_submission_status_async(tracked.submission_id)
+
+        if self._tracked.get(tracked.submission_id) is not tracked:
+            # Untracked while the check was in flight
+            return
+
+        self._stats["checks"] += 1
+        tracked.checks += 1
+
+        if not result["success"]:
+            self._stats["errors"] += 1
+            tracked.consecutive_errors += 1
+            logger.warning(f"Status check for {tracked.submission_id} failed: {result.get('error')}")
+        else:
+            tracked.consecutive_errors = 0
+            tracked.last_result = result
+            previous_status = tracked.status
+            tracked.status = result["status"]
+
+            if tracked.status != previous_status:
+                tracked.unchanged_checks = 0
+                self._stats["status_changes"] += 1
+                final = tracked.status in FINAL_STATUSES
+                if final:
+                    # Untrack first so consumers of the final change see it gone
+                    self._stats["completed"] += 1
+                    self.untrack(tracked.submission_id)
+                await self._deliver(tracked, previous_status, final)
+                if final:
+                    return
+            else:
+                tracked.unchanged_checks += 1
+
+        if tracked.checks >= self.max_checks:
+            self._stats["timed_out"] += 1
+            logger.warning(f"Submission {tracked.submission_id} still {tracked.status} after {tracked.checks} checks")
+            self.untrack(tracked.submission_id)
+            await self._deliver(tracked, tracked.status, final=True, timed_out=True)
+            return
+
+        self._schedule(tracked, self._interval(tracked))
+
+    async def _deliver(self, tracked: _TrackedSubmission, previous_status: str,
+                       final: bool, timed_out: bool = False):
+        change = {
+            "submission_id": tracked.submission_id,
+            "previous_status": previous_status,
+            "status": tracked.status,
+            "final": final,
+            "timed_out": timed_out,
+            "checks_performed": tracked.checks,
+            "tracked_seconds": round(time.monotonic() - tracked.added_at, 1),
+            "details": tracked.last_result,
+            "checked_at": datetime.now().isoformat()
+        }
+
+        for queue in self._subscribers:
+            queue.put_nowait(change)
+
+        for callback in self._callbacks:
+            try:
+                outcome = callback(change)
+                if inspect.isawaitable(outcome):
+                    await outcome
+            except Exception as e:
+                # One failing consumer must not stop delivery to the others
+                logger.error(f"Status change callback failed for {tracked.submission_id}: {str(e)}")
+
+    # Lifecycle
+
+    def start(self) -> asyncio.Task:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self):
+        """Stop polling, wait for checks in flight and end all changes() iterators"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._in_flight:
+            await asyncio.gather(*self._in_flight, return_exceptions=True)
+        for queue in self._subscribers:
+            queue.put_nowait(None)
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.stop()
+
+    def get_stats(self) -> Dict:
+        by_status = {}
+        for tracked in self._tracked.values():
+            by_status[tracked.status] = by_status.get(tracked.status, 0) + 1
+        next_due = min((tracked.next_check for tracked in self._tracked.values()), default=None)
+        return {
+            **self._stats,
+            "tracked": len(self._tracked),
+            "in_flight": len(self._in_flight),
+            "tracked_by_status": by_status,
+            "next_check_in_seconds": round(max(0.0, next_due - time.monotonic()), 1) if next_due is not None else None
+        }
+
+# Example usage
+if __name__ == "__main__":
+    async def main():
+        async with ChinaCustomsClient() as client:
+            async with SubmissionStatusPoller(client) as poller:
+                poller.add_callback(lambda change: print(f"Status change: {json.dumps(change, indent=2)}"))
+
+                for submission_id in ["SUB-2024-001", "SUB-2024-002", "SUB-2024-003"]:
+                    poller.track(submission_id)
+
+                # Consume changes until every tracked submission reached a final state
+                async for change in poller.changes():
+                    if change["final"] and not poller.get_stats()["tracked"]:
+                        break
+
+                print(f"Poller Stats: {json.dumps(poller.get_stats(), indent=2)}")
+
+    asyncio.run(main())
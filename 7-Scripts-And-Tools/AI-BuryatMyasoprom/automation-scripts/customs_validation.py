@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Customs Document Validation for BuryatMyasoprom
+Rule tables for export documents compiled once into reusable validators
+"""
+
+import re
+from datetime import datetime
+from operator import itemgetter
+from typing import Callable, Dict, List, Optional
+import logging
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Basic HS code validation (4 digits, optional period, up to 2 more digits)
+HS_CODE_PATTERN = r'^\d{4}\.?\d{0,2}$'
+
+# Checks run in list order, so errors are reported in the order given here
+DOCUMENT_RULES = {
+    "health_certificate": {
+        "required": ["exporter_name", "product_description", "production_date",
+                     "veterinary_inspection", "china_importer"],
+        "checks": [
+            {"type": "date", "field": "production_date",
+             "future_error": "Production date cannot be in the future",
+             "format_error": "Invalid production date format",
+             "max_age_days": 30, "max_age_warning": "Health certificate may be expiring soon"}
+        ]
+    },
+    "customs_declaration": {
+        "required": ["hs_code", "product_value", "weight_kg", "country_of_origin"],
+        "checks": [
+            {"type": "positive", "field": "product_value", "error": "Product value must be greater than 0"},
+            {"type": "positive", "field": "weight_kg", "error": "Product weight must be greater than 0"},
+            {"type": "pattern", "field": "hs_code", "pattern": HS_CODE_PATTERN, "error": "Invalid HS code format"}
+        ]
+    },
+    "certificate_of_origin": {
+        "required": ["manufacturer", "origin_criteria", "export_license"]
+    },
+    "veterinary_certificate": {
+        "required": ["veterinary_authority", "inspection_date", "animal_health"]
+    }
+}
+
+# check(content, errors, warnings, now)
+Check = Callable[[Dict, List[str], List[str], datetime], None]
+
+def _date_check(rule: Dict) -> Check:
+    field = rule["field"]
+    future_error = rule.get("future_error")
+    format_error = rule.get("format_error", f"Invalid {field} format")
+    max_age_days = rule.get("max_age_days")
+    max_age_warning = rule.get("max_age_warning")
+
+    def check(content: Dict, errors: List[str], warnings: List[str], now: datetime):
+        value = content.get(field)
+        if not value:
+            return
+        try:
+            parsed = value if isinstance(value, datetime) else datetime.fromisoformat(value)
+        except (TypeError, ValueError):
+            errors.append(format_error)
+            return
+        if parsed.tzinfo is not None:
+            parsed = parsed.astimezone().replace(tzinfo=None)
+        if future_error and parsed > now:
+            errors.append(future_error)
+        if max_age_days is not None and (now - parsed).days > max_age_days:
+            warnings.append(max_age_warning)
+
+    return check
+
+def _positive_check(rule: Dict) -> Check:
+    field = rule["field"]
+    error = rule["error"]
+
+    def check(content: Dict, errors: List[str], warnings: List[str], now: datetime):
+        value = content.get(field, 0)
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0:
+            errors.append(error)
+
+    return check
+
+def _pattern_check(rule: Dict) -> Check:
+    field = rule["field"]
+    error = rule["error"]
+    match = re.compile(rule["pattern"]).match
+
+    def check(content: Dict, errors: List[str], warnings: List[str], now: datetime):
+        value = content.get(field, "")
+        if not isinstance(value, str) or match(value) is None:
+            errors.append(error)
+
+    return check
+
+CHECK_BUILDERS = {
+    "date": _date_check,
+    "positive": _positive_check,
+    "pattern": _pattern_check,
+}
+
+class DocumentValidator:
+    """Compiled rules for one document type"""
+
+    def __init__(self, document_type: str, rules: Dict):
+        self.document_type = document_type
+        self.required_fields = tuple(rules.get("required", ()))
+        self.required_errors = tuple((field, f"Missing required field: {field}") for field in self.required_fields)
+        # Fetches every required value in one C call; KeyError means one is missing
+        self._required_values = itemgetter(*self.required_fields) if len(self.required_fields) > 1 else \
+            (lambda content: tuple(content[field] for field in self.required_fields))
+        self.checks = tuple(CHECK_BUILDERS[rule["type"]](rule) for rule in rules.get("checks", ()))
+
+    def validate_many(self, contents: List[Dict], now: datetime) -> List[Dict]:
+        """Validate every content of this type in one loop with all rules bound to locals"""
+        required_values = self._required_values if self.required_fields else None
+        required_errors = self.required_errors
+        checks = self.checks
+        document_type = self.document_type
+        results = []
+        append = results.append
+
+        for content in contents:
+            errors = None
+            if required_values is not None:
+                # Complete documents, the common case, skip the per-field loop
+                try:
+                    if all(required_values(content)):
+                        errors = []
+                except KeyError:
+                    pass
+                if errors is None:
+                    errors = [error for field, error in required_errors if not content.get(field)]
+            else:
+                errors = []
+            warnings = []
+            for check in checks:
+                check(content, errors, warnings, now)
+            append({
+                "document_type": document_type,
+                "valid": not errors,
+                "errors": errors,
+                "warnings": warnings
+            })
+        return results
+
+    def validate(self, content: Dict, now: Optional[datetime] = None) -> Dict:
+        return self.validate_many([content], now or datetime.now())[0]
+
+class DocumentValidationEngine:
+    """Validates document lists against DOCUMENT_RULES compiled once at construction
+
+    validate() takes the clock once, groups documents by type and hands each
+    group to its validator in one batch, so thousands of documents go
+    through with no per-document rule lookup, regex compilation or imports.
+    Results keep the input order. Unknown document types have no rules and
+    are always valid.
+    """
+
+    def __init__(self, rules: Optional[Dict] = None):
+        self.rules = rules or DOCUMENT_RULES
+        self._validators = {document_type: DocumentValidator(document_type, document_rules)
+                            for document_type, document_rules in self.rules.items()}
+
+    def validator_for(self, document_type: Optional[str]) -> DocumentValidator:
+        validator = self._validators.get(document_type)
+        if validator is None:
+            validator = DocumentValidator(document_type, {})
+            self._validators[document_type] = validator
+        return validator
+
+    def required_fields(self, document_type: str) -> List[str]:
+        return list(self.validator_for(document_type).required_fields)
+
+    def validate(self, documents: List[Dict], now: Optional[datetime] = None) -> Dict:
+        """Validate documents; same result structure as ChinaCustomsClient.validate_documents"""
+        now = now or datetime.now()
+
+        # Group by type so each validator runs once over all of its documents
+        groups = {}
+        for index, doc in enumerate(documents):
+            group = groups.get(doc.get("type"))
+            if group is None:
+                group = groups[doc.get("type")] = ([], [])
+            group[0].append(index)
+            group[1].append(doc.get("content", {}))
+
+        validation_results = [None] * len(documents)
+        for document_type, (indexes, contents) in groups.items():
+            for index, result in zip(indexes, self.validator_for(document_type).validate_many(contents, now)):
+                validation_results[index] = result
+
+        valid_documents = 0
+        total_errors = 0
+        total_warnings = 0
+        for result in validation_results:
+            valid_documents += result["valid"]
+            total_errors += len(result["errors"])
+            total_warnings += len(result["warnings"])
+
+        return {
+            "valid": valid_documents == len(validation_results),
+            "documents": validation_results,
+            "summary": {
+                "total_documents": len(documents),
+                "valid_documents": valid_documents,
+                "total_errors": total_errors,
+                "total_warnings": total_warnings
+            }
+        }
+
+# Example usage
+if __name__ == "__main__":
+    import json
+
+    engine = DocumentValidationEngine()
+    documents = [
+        {"type": "health_certificate", "content": {"exporter_name": "BuryatMyasoprom", "production_date": "2024-01-10"}},
+        {"type": "customs_declaration", "content": {"hs_code": "0201.10", "product_value": 27500,
+                                                    "weight_kg": 5000, "country_of_origin": "RUSSIA"}},
+    ]
+    print(f"Validation: {json.dumps(engine.validate(documents), indent=2)}")
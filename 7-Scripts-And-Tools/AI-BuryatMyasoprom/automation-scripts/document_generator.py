@@ -10,9 +10,11 @@ from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 import logging
 from dataclasses import dataclass
+from concurrent.futures import FIRST_COMPLETED, BrokenExecutor, ProcessPoolExecutor, ThreadPoolExecutor, wait
 import jinja2
 import pdfkit
 import os
+import uuid
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -25,11 +27,93 @@ class DocumentTemplate:
     template_file: str
     required_fields: List[str]
 
+@dataclass
+class DocumentJob:
+    """One document of a package, prepared before any rendering starts"""
+    doc_type: str
+    template_id: Optional[str]
+    data: Dict
+    document_id: str
+
+# Pool kinds for generate_packages: threads suit wkhtmltopdf, which runs in its
+# own process anyway; processes also spread Jinja rendering across cores
+EXECUTORS = ("thread", "process")
+
+# Generator of the current pool worker process, created by _init_worker
+_worker_generator = None
+
+def _init_worker(templates_path: str, dev_mode: bool, bytecode_cache_dir: Optional[str]):
+    global _worker_generator
+    # Cheap with a warm bytecode cache: templates load without recompiling
+    _worker_generator = DocumentGenerator(templates_path, dev_mode, bytecode_cache_dir)
+
+def _generate_in_worker(template_id: str, data: Dict, output_format: str, document_id: str) -> Dict:
+    return _worker_generator.generate_document(template_id, data, output_format, document_id)
+
 class DocumentGenerator:
-    def __init__(self, templates_path: str = "templates/"):
+    def __init__(self, templates_path: str = "templates/", dev_mode: bool = False,
+                 bytecode_cache_dir: Optional[str] = "data/template_bytecode_cache", preload: bool = True):
         self.templates_path = templates_path
+        self.dev_mode = dev_mode
+        self.bytecode_cache_dir = bytecode_cache_dir
         self.templates = self._load_templates()
-        self.jinja_env = jinja2.Environment(loader=jinja2.FileSystemLoader(templates_path))
+        self.jinja_env = self._create_jinja_env(bytecode_cache_dir)
+        # template_file -> compiled template, or None when the file does not exist
+        self._compiled_templates = {}
+        if preload:
+            self.preload_templates()
+    
+    def _create_jinja_env(self, bytecode_cache_dir: Optional[str]) -> jinja2.Environment:
+        """Jinja environment with a bytecode cache shared by every worker process
+        
+        FileSystemBytecodeCache keys entries by template name and source
+        checksum, and writes them atomically, so processes pointing at the
+        same directory reuse each other's compiled templates and an edited
+        template is recompiled rather than served stale. Templates are only
+        re-checked on disk in dev mode.
+        """
+        bytecode_cache = None
+        if bytecode_cache_dir:
+            os.makedirs(bytecode_cache_dir, exist_ok=True)
+            bytecode_cache = jinja2.FileSystemBytecodeCache(bytecode_cache_dir)
+        
+        return jinja2.Environment(
+            loader=jinja2.FileSystemLoader(self.templates_path),
+            bytecode_cache=bytecode_cache,
+            auto_reload=self.dev_mode,
+            cache_size=max(400, len(self.templates))
+        )
+    
+    def preload_templates(self) -> Dict:
+        """Load and compile every configured template once, at startup"""
+        loaded = []
+        missing = []
+        for template in self.templates.values():
+            try:
+                self._compiled_templates[template.template_file] = self.jinja_env.get_template(template.template_file)
+                loaded.append(template.template_file)
+            except jinja2.TemplateNotFound:
+                # Rendered with the basic fallback template
+                self._compiled_templates[template.template_file] = None
+                missing.append(template.template_file)
+        
+        if missing:
+            logger.warning(f"Templates not found, basic layout will be used: {missing}")
+        return {"loaded": loaded, "missing": missing}
+    
+    def _get_compiled_template(self, template: DocumentTemplate) -> Optional[jinja2.Template]:
+        """Compiled template, or None to use the basic fallback"""
+        if not self.dev_mode and template.template_file in self._compiled_templates:
+            return self._compiled_templates[template.template_file]
+        
+        # Dev mode goes through the environment so edited templates are picked up
+        try:
+            compiled = self.jinja_env.get_template(template.template_file)
+        except jinja2.TemplateNotFound:
+            compiled = None
+        if not self.dev_mode:
+            self._compiled_templates[template.template_file] = compiled
+        return compiled
         
     def _load_templates(self) -> Dict[str, DocumentTemplate]:
         """Load document templates configuration"""
@@ -78,7 +162,8 @@ class DocumentGenerator:
         }
         return templates
 
-    def generate_document(self, template_id: str, data: Dict, output_format: str = "pdf") -> Dict:
+    def generate_document(self, template_id: str, data: Dict, output_format: str = "pdf",
+                          document_id: Optional[str] = None) -> Dict:
         """Generate a single document"""
         if template_id not in self.templates:
             raise ValueError(f"Template {template_id} not found")
@@ -99,7 +184,7 @@ class DocumentGenerator:
             rendered_content = self._render_template(template, data)
             
             # Generate output
-            document_id = f"DOC_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{template.type}"
+            document_id = document_id or self._new_document_id(template.type)
             
             if output_format == "pdf":
                 output_path = self._generate_pdf(rendered_content, document_id)
@@ -123,39 +208,161 @@ class DocumentGenerator:
                 "document_id": None
             }
 
-    def generate_document_package(self, order_data: Dict, output_format: str = "pdf") -> Dict:
-        """Generate complete document package for an order"""
-        required_docs = order_data.get("required_documents", [])
-        generated_docs = []
-        errors = []
+    def generate_document_package(self, order_data: Dict, output_format: str = "pdf",
+                                  parallel: bool = False, max_workers: int = 4) -> Dict:
+        """Generate complete document package for an order
+        
+        With parallel=True the documents are rendered and converted on a
+        pool of max_workers threads; the result is the same as sequential
+        generation, in the order of required_documents.
+        """
+        if parallel:
+            return self.generate_packages([order_data], output_format, max_workers, max_per_order=max_workers)[0]
+        
+        package_id, jobs = self._package_jobs(order_data)
+        outcomes = [
+            self.generate_document(job.template_id, job.data, output_format, job.document_id)
+            if job.template_id else None
+            for job in jobs
+        ]
+        return self._assemble_package(order_data, package_id, jobs, outcomes)
+    
+    def generate_packages(self, orders: List[Dict], output_format: str = "pdf", max_workers: int = 4,
+                          max_per_order: int = 2, executor: str = "thread") -> List[Dict]:
+        """Generate document packages for many orders on one bounded pool
         
-        for doc_type in required_docs:
+        At most max_workers documents are generated at once across all
+        orders, and at most max_per_order of them belong to the same order.
+        Orders are started in list order, so early orders finish first.
+        Document data and IDs are fixed before anything runs, and the results
+        come back in the order of orders and of each order's
+        required_documents whatever order the workers finish in. A failing
+        document fails only its own entry. A crashed process worker breaks
+        the pool: the documents in flight on it fail, and the remaining ones
+        run on a new pool.
+        """
+        if executor not in EXECUTORS:
+            raise ValueError(f"Unknown executor {executor}; expected one of {EXECUTORS}")
+        if max_workers < 1 or max_per_order < 1:
+            raise ValueError("max_workers and max_per_order must be at least 1")
+        
+        packages = [self._package_jobs(order_data) for order_data in orders]
+        outcomes = [[None] * len(jobs) for _, jobs in packages]
+        # Documents still to start, per order; jobs without a template never run
+        queues = [[index for index, job in enumerate(jobs) if job.template_id][::-1] for _, jobs in packages]
+        in_flight = [0] * len(packages)
+        first_open = 0
+        
+        if executor == "process":
+            new_pool = lambda: ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                                   initargs=(self.templates_path, self.dev_mode, self.bytecode_cache_dir))
+            submit_document = lambda pool, job: pool.submit(_generate_in_worker, job.template_id, job.data,
+                                                            output_format, job.document_id)
+        else:
+            new_pool = lambda: ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="document-generator")
+            submit_document = lambda pool, job: pool.submit(self.generate_document, job.template_id, job.data,
+                                                            output_format, job.document_id)
+        
+        pool = new_pool()
+        try:
+            futures = {}
+            while True:
+                # Fill free workers from the earliest orders that are under their limit
+                while first_open < len(queues) and not queues[first_open]:
+                    first_open += 1
+                order_index = first_open
+                while len(futures) < max_workers and order_index < len(queues):
+                    if queues[order_index] and in_flight[order_index] < max_per_order:
+                        doc_index = queues[order_index][-1]
+                        try:
+                            future = submit_document(pool, packages[order_index][1][doc_index])
+                        except BrokenExecutor:
+                            # Futures already submitted to the broken pool fail on their own below;
+                            # this document has not started, so it goes to a fresh pool
+                            logger.warning("Document worker pool broke; starting a new pool for the remaining documents")
+                            pool.shutdown(wait=False)
+                            pool = new_pool()
+                            continue
+                        queues[order_index].pop()
+                        futures[future] = (order_index, doc_index)
+                        in_flight[order_index] += 1
+                    else:
+                        order_index += 1
+                
+                if not futures:
+                    break
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    order_index, doc_index = futures.pop(future)
+                    in_flight[order_index] -= 1
+                    try:
+                        outcomes[order_index][doc_index] = future.result()
+                    except Exception as e:
+                        job = packages[order_index][1][doc_index]
+                        logger.error(f"Worker failed generating {job.document_id}: {str(e)}")
+                        outcomes[order_index][doc_index] = {
+                            "success": False,
+                            "error": f"Worker error: {str(e)}",
+                            "document_id": None
+                        }
+        finally:
+            pool.shutdown()
+        
+        return [
+            self._assemble_package(order_data, package_id, jobs, order_outcomes)
+            for order_data, (package_id, jobs), order_outcomes in zip(orders, packages, outcomes)
+        ]
+    
+    def _new_document_id(self, doc_type: str, token: Optional[str] = None) -> str:
+        # The random token keeps IDs (and output file names) unique when many
+        # documents of one type are generated within the same second
+        return f"DOC_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{doc_type}_{token or uuid.uuid4().hex[:8]}"
+    
+    def _package_jobs(self, order_data: Dict):
+        """Package ID and one job per required document, in required_documents order"""
+        token = uuid.uuid4().hex[:8]
+        package_id = f"PKG_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{token}"
+        jobs = []
+        
+        for index, doc_type in enumerate(order_data.get("required_documents", [])):
             # Find appropriate template
             template_id = self._find_template_for_type(doc_type, order_data.get("language", "chinese"))
             
-            if not template_id:
-                errors.append(f"No template found for document type: {doc_type}")
-                continue
-            
             # Prepare data for this document type
-            doc_data = self._prepare_document_data(doc_type, order_data)
-            
-            # Generate document
-            result = self.generate_document(template_id, doc_data, output_format)
+            doc_data = self._prepare_document_data(doc_type, order_data) if template_id else {}
+            jobs.append(DocumentJob(doc_type, template_id, doc_data,
+                                    self._new_document_id(doc_type, f"{token}_{index + 1:02d}")))
+        return package_id, jobs
+    
+    def _assemble_package(self, order_data: Dict, package_id: str, jobs: List[DocumentJob],
+                          outcomes: List[Optional[Dict]]) -> Dict:
+        """Package result with one entry per required document, in order"""
+        generated_docs = []
+        errors = []
+        results = []
+        
+        for job, outcome in zip(jobs, outcomes):
+            if not job.template_id:
+                error = f"No template found for document type: {job.doc_type}"
+                errors.append(error)
+                results.append({"document_type": job.doc_type, "success": False, "error": error, "document_id": None})
+                continue
             
-            if result["success"]:
-                generated_docs.append(result)
+            if outcome["success"]:
+                generated_docs.append(outcome)
             else:
-                errors.append(f"Failed to generate {doc_type}: {result['error']}")
+                errors.append(f"Failed to generate {job.doc_type}: {outcome['error']}")
+            results.append({"document_type": job.doc_type, **outcome})
         
         return {
             "order_id": order_data.get("order_id"),
-            "total_documents": len(required_docs),
+            "total_documents": len(jobs),
             "generated_documents": len(generated_docs),
             "failed_documents": len(errors),
             "documents": generated_docs,
             "errors": errors,
-            "package_id": f"PKG_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
+            "results": results,
+            "package_id": package_id,
             "generated_at": datetime.now().isoformat()
         }
 
@@ -169,17 +376,17 @@ class DocumentGenerator:
 
     def _render_template(self, template: DocumentTemplate, data: Dict) -> str:
         """Render template with data"""
-        try:
-            template_obj = self.jinja_env.get_template(template.template_file)
-            rendered = template_obj.render(
-                data=data,
-                generated_date=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                **data
-            )
-            return rendered
-        except jinja2.TemplateNotFound:
+        template_obj = self._get_compiled_template(template)
+        if template_obj is None:
             # Fallback to basic template generation
             return self._generate_basic_template(template, data)
+        
+        rendered = template_obj.render(
+            data=data,
+            generated_date=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            **data
+        )
+        return rendered
 
     def _generate_basic_template(self, template: DocumentTemplate, data: Dict) -> str:
         """Generate basic template if template file not found"""
@@ -466,6 +673,13 @@ if __name__ == "__main__":
     package_result = generator.generate_document_package(sample_order)
     print(f"Document Package: {json.dumps(package_result, indent=2)}")
     
+    # Evening dispatch: many orders on one bounded pool, results in order
+    print("\nGenerating Document Packages in parallel...")
+    dispatch_orders = [dict(sample_order, order_id=f"BO-2024-{number:03d}") for number in range(1, 6)]
+    package_results = generator.generate_packages(dispatch_orders, max_workers=4, max_per_order=2)
+    for package in package_results:
+        print(f"  {package['order_id']}: {package['generated_documents']}/{package['total_documents']} documents")
+    
     # Show available templates
     print("\nAvailable Templates:")
     templates = generator.get_available_templates()
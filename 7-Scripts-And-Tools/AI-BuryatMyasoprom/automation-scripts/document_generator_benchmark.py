@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Document Generator Benchmark for BuryatMyasoprom
+Cold-start and per-document render latency of DocumentGenerator with and without the template bytecode cache
+"""
+
+import argparse
+import json
+import multiprocessing
+import platform
+import shutil
+import statistics
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+import logging
+
+import jinja2
+
+from document_generator import DocumentGenerator
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+BENCH_ORDER = {
+    "order_id": "BO-BENCH-001",
+    "customer": {"name": "China Meat Import Co.", "address": "Beijing, China", "import_license": "CN-IMPORT-2024-001"},
+    "products": [
+        {"description": "Frozen Beef Carcass Grade A", "meat_type": "BEEF", "quantity_kg": 5000, "unit_price": 5.50,
+         "production_date": "2024-01-15", "expiry_date": "2025-01-15", "lab_tests": ["Salmonella", "E.coli"]}
+    ],
+    "shipment": {"port_of_entry": "Manzhouli", "transport_method": "REFRIGERATED_TRUCK",
+                 "expected_departure": "2024-02-20", "insurance_value": 1500, "freight_cost": 2000},
+    "required_documents": ["health_certificate", "customs_declaration", "certificate_of_origin", "veterinary_certificate"],
+    "language": "chinese"
+}
+
+# Generator options per configuration; "legacy" matches DocumentGenerator before preloading and caching
+CONFIGURATIONS = {
+    "legacy": {"dev_mode": True, "cache": False, "preload": False},
+    "preloaded_no_cache": {"dev_mode": False, "cache": False, "preload": True},
+    "preloaded_cold_cache": {"dev_mode": False, "cache": True, "preload": True, "clear_cache": True},
+    "preloaded_warm_cache": {"dev_mode": False, "cache": True, "preload": True},
+}
+
+LAYOUT_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="UTF-8">
+    <title>{% block title %}{% endblock %}</title>
+    <style>
+        body { font-family: "Noto Sans SC", Arial, sans-serif; margin: 40px; }
+        .field-label { font-weight: bold; }
+    </style>
+</head>
+<body>
+    <div class="header">
+        <h1>{% block heading %}{% endblock %}</h1>
+        <p>Generated: {{ generated_date }}</p>
+    </div>
+    {% block content %}{% endblock %}
+    <div class="signature">
+        <p>Authorized Signature: _________________________</p>
+    </div>
+</body>
+</html>
+"""
+
+MACROS_TEMPLATE = """{% macro field(label, value, default="NOT PROVIDED") -%}
+<div class="field">
+    <span class="field-label">{{ label | replace('_', ' ') | title }}:</span>
+    <span>{% if value is none %}{{ default }}{% elif value is number %}{{ "{:,.2f}".format(value) }}{% else %}{{ value | e }}{% endif %}</span>
+</div>
+{%- endmacro %}
+"""
+
+def build_templates(templates_dir: str, sections: int = 40) -> List[str]:
+    """Write a layout, shared macros and one document template per DocumentGenerator template
+
+    Each document template has sections blocks of fields, conditionals and
+    loops, so compiling it costs about what a real bilingual customs form does.
+    """
+    path = Path(templates_dir)
+    path.mkdir(parents=True, exist_ok=True)
+    (path / "_layout.html").write_text(LAYOUT_TEMPLATE, encoding='utf-8')
+    (path / "_macros.html").write_text(MACROS_TEMPLATE, encoding='utf-8')
+
+    written = []
+    for template in DocumentGenerator(templates_dir, bytecode_cache_dir=None, preload=False).templates.values():
+        body = ['{% extends "_layout.html" %}', '{% import "_macros.html" as m %}',
+                f'{{% block title %}}{template.name}{{% endblock %}}',
+                f'{{% block heading %}}{template.name} / 出口证书{{% endblock %}}',
+                '{% block content %}']
+        for section in range(sections):
+            body.append(f'<div class="section" id="section-{section}">')
+            body.append(f'<h2>Section {section + 1} / 第{section + 1}部分</h2>')
+            for field in template.required_fields:
+                body.append(f'{{{{ m.field("{field}", data.get("{field}")) }}}}')
+            body.append('{% if data.products %}<table>{% for product in data.products %}'
+                        '<tr class="{{ loop.cycle(\'odd\', \'even\') }}"><td>{{ product.description }}</td>'
+                        '<td>{{ product.quantity_kg }}</td></tr>{% endfor %}</table>{% endif %}')
+            body.append('{% if port_of_entry %}<p>Port of entry: {{ port_of_entry | upper }}</p>{% endif %}')
+            body.append('</div>')
+        body.append('{% endblock %}')
+        (path / template.template_file).write_text("\n".join(body), encoding='utf-8')
+        written.append(template.template_file)
+    return written
+
+def _generator(templates_dir: str, cache_dir: str, options: Dict) -> DocumentGenerator:
+    return DocumentGenerator(templates_dir, dev_mode=options["dev_mode"],
+                             bytecode_cache_dir=cache_dir if options["cache"] else None,
+                             preload=options["preload"])
+
+def _package_data(generator: DocumentGenerator) -> List:
+    """(template, data) for every document in BENCH_ORDER"""
+    documents = []
+    for doc_type in BENCH_ORDER["required_documents"]:
+        template_id = generator._find_template_for_type(doc_type, BENCH_ORDER["language"])
+        data = generator._prepare_document_data(doc_type, BENCH_ORDER)
+        data["products"] = BENCH_ORDER["products"]
+        documents.append((generator.templates[template_id], data))
+    return documents
+
+def _cold_start(templates_dir: str, cache_dir: str, options: Dict) -> Dict:
+    """Runs in a fresh worker process: construct the generator and render one package"""
+    start = time.perf_counter()
+    generator = _generator(templates_dir, cache_dir, options)
+    init_ms = (time.perf_counter() - start) * 1000
+
+    documents = _package_data(generator)
+    render_start = time.perf_counter()
+    for template, data in documents:
+        generator._render_template(template, data)
+    first_package_ms = (time.perf_counter() - render_start) * 1000
+
+    return {"init_ms": init_ms, "first_package_ms": first_package_ms, "total_ms": init_ms + first_package_ms}
+
+class TemplateBenchmark:
+    """Cold start in new processes and steady-state render latency per configuration"""
+
+    def __init__(self, sections: int = 40, cold_starts: int = 5, renders: int = 400, work_dir: Optional[str] = None):
+        self.sections = sections
+        self.cold_starts = cold_starts
+        self.renders = renders
+        self.work_dir = Path(work_dir or tempfile.mkdtemp(prefix="template_benchmark_"))
+        self.templates_dir = str(self.work_dir / "templates")
+        self.cache_dir = str(self.work_dir / "bytecode_cache")
+
+    def _measure_cold_starts(self, options: Dict) -> Dict:
+        # spawn, not fork: a forked worker would inherit the parent's compiled templates
+        context = multiprocessing.get_context("spawn")
+        runs = []
+        for _ in range(self.cold_starts):
+            if options.get("clear_cache"):
+                shutil.rmtree(self.cache_dir, ignore_errors=True)
+            with context.Pool(1) as pool:
+                runs.append(pool.apply(_cold_start, (self.templates_dir, self.cache_dir, options)))
+
+        return {key: round(statistics.median(run[key] for run in runs), 2)
+                for key in ("init_ms", "first_package_ms", "total_ms")}
+
+    def _measure_renders(self, options: Dict) -> Dict:
+        generator = _generator(self.templates_dir, self.cache_dir, options)
+        documents = _package_data(generator)
+        for template, data in documents:
+            generator._render_template(template, data)
+
+        timings_ms = []
+        for index in range(self.renders):
+            template, data = documents[index % len(documents)]
+            start = time.perf_counter()
+            generator._render_template(template, data)
+            timings_ms.append((time.perf_counter() - start) * 1000)
+
+        timings_ms.sort()
+        return {
+            "median_ms": round(statistics.median(timings_ms), 3),
+            "p90_ms": round(timings_ms[int(len(timings_ms) * 0.9) - 1], 3),
+            "min_ms": round(timings_ms[0], 3)
+        }
+
+    def run(self) -> Dict:
+        started_at = datetime.now()
+        templates = build_templates(self.templates_dir, self.sections)
+        template_bytes = sum((Path(self.templates_dir) / name).stat().st_size for name in templates)
+
+        results = {}
+        try:
+            for name, options in CONFIGURATIONS.items():
+                logger.info(f"Measuring {name}: {self.cold_starts} cold starts, {self.renders} renders")
+                results[name] = {
+                    "cold_start": self._measure_cold_starts(options),
+                    "render": self._measure_renders(options)
+                }
+        finally:
+            shutil.rmtree(self.work_dir, ignore_errors=True)
+
+        legacy = results["legacy"]
+        for result in results.values():
+            result["cold_start_speedup_vs_legacy"] = round(
+                legacy["cold_start"]["total_ms"] / result["cold_start"]["total_ms"], 2)
+            result["render_speedup_vs_legacy"] = round(
+                legacy["render"]["median_ms"] / result["render"]["median_ms"], 2)
+
+        return {
+            "environment": {
+                "python": platform.python_version(),
+                "jinja2": jinja2.__version__,
+                "templates": len(templates),
+                "template_kb": round(template_bytes / 1024, 1),
+                "sections": self.sections,
+                "cold_starts": self.cold_starts,
+                "renders": self.renders
+            },
+            "results": results,
+            "started_at": started_at.isoformat(),
+            "duration_seconds": round((datetime.now() - started_at).total_seconds(), 1)
+        }
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Benchmark DocumentGenerator template loading and rendering")
+    parser.add_argument("--sections", type=int, default=40, help="field sections per generated template")
+    parser.add_argument("--cold-starts", type=int, default=5, help="fresh worker processes per configuration")
+    parser.add_argument("--renders", type=int, default=400, help="timed renders per configuration")
+    parser.add_argument("--work-dir", default=None, help="directory for generated templates and cache (removed afterwards)")
+    parser.add_argument("--output", default=None, help="write JSON results to this file")
+    args = parser.parse_args(argv)
+
+    benchmark = TemplateBenchmark(args.sections, args.cold_starts, args.renders, args.work_dir)
+    results = benchmark.run()
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+        logger.info(f"Benchmark results written to {args.output}")
+    print(output)
+
+if __name__ == "__main__":
+    main()
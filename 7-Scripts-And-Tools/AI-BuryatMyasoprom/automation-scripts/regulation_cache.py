@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+"""
+Regulation Cache for BuryatMyasoprom
+On-disk HTTP cache with conditional revalidation for China Customs regulation data
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from email.utils import formatdate
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+import logging
+
+from customs_resilience import get_header
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Cache status reported with every result
+HIT = "HIT"                    # fresh copy, no request made
+MISS = "MISS"                  # nothing cached, full download
+REVALIDATED = "REVALIDATED"    # 304 Not Modified, cached body reused
+UPDATED = "UPDATED"            # stale copy replaced by a new 200 response
+STALE = "STALE"                # stale copy served while revalidating in the background
+STALE_IF_ERROR = "STALE_IF_ERROR"  # stale copy served because the gateway failed
+
+class CachedResponse:
+    """Cached body with the requests.Response attributes the client reads"""
+
+    def __init__(self, status_code: int, headers: Dict, content: bytes):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    @property
+    def text(self) -> str:
+        return self.content.decode('utf-8', errors='replace')
+
+    def json(self):
+        return json.loads(self.content)
+
+def parse_cache_control(value: Optional[str]) -> Dict:
+    """Cache-Control directives as {name: seconds or True}"""
+    directives = {}
+    for part in (value or "").split(","):
+        name, _, argument = part.strip().partition("=")
+        if not name:
+            continue
+        name = name.lower()
+        try:
+            directives[name] = int(argument.strip('"')) if argument else True
+        except ValueError:
+            directives[name] = True
+    return directives
+
+def _seconds(directives: Dict, name: str, default: int) -> int:
+    value = directives.get(name)
+    # A bare directive parses as True, which is also an int
+    return value if type(value) is int else default
+
+class RegulationCache:
+    """Conditional-request cache for GET endpoints, persisted as one JSON file per URL
+
+    Freshness comes from Cache-Control max-age (default_max_age when the
+    gateway sends none). Stale entries are revalidated with If-None-Match /
+    If-Modified-Since, so an unchanged resource costs a 304 without a body.
+    Entries within their stale-while-revalidate window are served at once
+    while one background request refreshes them, and a failed refresh falls
+    back to the stale copy for up to max_stale_on_error seconds.
+
+    Concurrent callers for the same URL share one request: threads wait on
+    a per-URL lock and coroutines await the same task. The files are shared
+    by every worker process on the host, so a worker starting up with a
+    recent cache does at most a conditional request.
+
+    Whenever a new URL is stored, files untouched for max_entry_age seconds
+    are deleted and the least recently stored ones beyond max_entries go
+    too, so distinct query strings cannot fill the disk.
+    """
+
+    def __init__(self, cache_dir: str = "data/regulation_cache", default_max_age: int = 300,
+                 stale_while_revalidate: int = 0, max_stale_on_error: int = 86400,
+                 max_entries: int = 256, max_entry_age: int = 7 * 86400):
+        self.cache_dir = Path(cache_dir)
+        self.default_max_age = default_max_age
+        self.stale_while_revalidate = stale_while_revalidate
+        self.max_stale_on_error = max_stale_on_error
+        self.max_entries = max_entries
+        self.max_entry_age = max_entry_age
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+        self._entries = {}
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        self._inflight = {}
+        self._stats_lock = threading.Lock()
+        self._stats = {status: 0 for status in (HIT, MISS, REVALIDATED, UPDATED, STALE, STALE_IF_ERROR)}
+        self._stats["coalesced"] = 0
+        self._stats["evicted"] = 0
+
+    # Entries
+
+    def _key(self, url: str, params: Optional[Dict]) -> str:
+        query = "&".join(f"{name}={value}" for name, value in sorted((params or {}).items()))
+        return f"{url}?{query}" if query else url
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]}.json"
+
+    def _load(self, key: str) -> Optional[Dict]:
+        """Entry from memory, or from disk when another process stored a newer one"""
+        path = self._path(key)
+        entry = self._entries.get(key)
+        try:
+            modified = path.stat().st_mtime
+        except FileNotFoundError:
+            return entry
+        if entry is not None and entry["file_mtime"] >= modified:
+            return entry
+
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable cache file {path}: {str(e)}")
+            return self._entries.get(key)
+        entry["file_mtime"] = modified
+        self._entries[key] = entry
+        return entry
+
+    def _store(self, key: str, response, stored_at: float, previous: Optional[Dict] = None) -> Optional[Dict]:
+        """Build and persist an entry from a 200 (or, with previous, a 304) response"""
+        cache_control = parse_cache_control(get_header(response.headers, "Cache-Control"))
+        if "no-store" in cache_control:
+            self._forget(key)
+            return None
+
+        if previous is not None:
+            # 304: keep the body and validators unless the gateway sent new ones
+            entry = dict(previous)
+        else:
+            entry = {"key": key, "content": response.content.decode('utf-8'), "etag": None,
+                     "last_modified": None, "content_type": get_header(response.headers, "Content-Type")}
+        entry["etag"] = get_header(response.headers, "ETag") or entry["etag"]
+        entry["last_modified"] = get_header(response.headers, "Last-Modified") or entry["last_modified"]
+        entry["stored_at"] = stored_at
+        entry["max_age"] = 0 if "no-cache" in cache_control else \
+            _seconds(cache_control, "max-age", self.default_max_age)
+        entry["stale_while_revalidate"] = _seconds(cache_control, "stale-while-revalidate", self.stale_while_revalidate)
+        entry["must_revalidate"] = "must-revalidate" in cache_control
+
+        path = self._path(key)
+        is_new = not path.exists()
+        temporary = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(temporary, 'w', encoding='utf-8') as f:
+            json.dump({name: value for name, value in entry.items() if name != "file_mtime"}, f)
+        os.replace(temporary, path)
+        entry["file_mtime"] = path.stat().st_mtime
+        self._entries[key] = entry
+        if is_new:
+            self._evict(keep=path)
+        return entry
+
+    def _evict(self, keep: Path):
+        """Delete files past max_entry_age, then the oldest beyond max_entries"""
+        files = []
+        for path in self.cache_dir.glob("*.json"):
+            try:
+                files.append((path.stat().st_mtime, path))
+            except FileNotFoundError:
+                continue
+        files.sort()
+
+        cutoff = time.time() - self.max_entry_age
+        excess = len(files) - self.max_entries
+        removed = set()
+        for modified, path in files:
+            if path == keep or (modified >= cutoff and excess <= 0):
+                continue
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            removed.add(path)
+            excess -= 1
+
+        if removed:
+            for key in [key for key in self._entries if self._path(key) in removed]:
+                del self._entries[key]
+            with self._locks_guard:
+                for key in [key for key, lock in self._locks.items()
+                            if self._path(key) in removed and not lock.locked()]:
+                    del self._locks[key]
+            with self._stats_lock:
+                self._stats["evicted"] += len(removed)
+
+    def _forget(self, key: str):
+        self._entries.pop(key, None)
+        try:
+            self._path(key).unlink()
+        except FileNotFoundError:
+            pass
+
+    def _age(self, entry: Dict) -> float:
+        return time.time() - entry["stored_at"]
+
+    def _is_fresh(self, entry: Dict) -> bool:
+        return self._age(entry) < entry["max_age"]
+
+    def _can_serve_stale(self, entry: Dict) -> bool:
+        return not entry["must_revalidate"] and self._age(entry) < entry["max_age"] + entry["stale_while_revalidate"]
+
+    def _conditional_headers(self, entry: Optional[Dict]) -> Dict:
+        headers = {}
+        if entry is not None:
+            if entry["etag"]:
+                headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"]:
+                headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def _response(self, entry: Dict, status: str, count: bool = True) -> Tuple[CachedResponse, str]:
+        if count:
+            self._count(status)
+        headers = {"Content-Type": entry["content_type"] or "application/json",
+                   "Age": str(int(self._age(entry)))}
+        if entry["etag"]:
+            headers["ETag"] = entry["etag"]
+        return CachedResponse(200, headers, entry["content"].encode('utf-8')), status
+
+    def _count(self, status: str):
+        with self._stats_lock:
+            self._stats[status] += 1
+
+    def _apply(self, key: str, entry: Optional[Dict], response, requested_at: float):
+        """Turn a gateway response into (response, cache status)"""
+        if response.status_code == 304 and entry is not None:
+            return self._response(self._store(key, response, requested_at, previous=entry) or entry, REVALIDATED)
+        if response.status_code == 200:
+            self._store(key, response, requested_at)
+            self._count(UPDATED if entry is not None else MISS)
+            return response, UPDATED if entry is not None else MISS
+        if entry is not None and self._age(entry) < entry["max_age"] + self.max_stale_on_error:
+            logger.warning(f"Serving stale {key} after gateway status {response.status_code}")
+            return self._response(entry, STALE_IF_ERROR)
+        return response, MISS
+
+    def _stale_on_error(self, key: str, entry: Optional[Dict], error: Exception):
+        if entry is not None and self._age(entry) < entry["max_age"] + self.max_stale_on_error:
+            logger.warning(f"Serving stale {key} after request error: {str(error)}")
+            return self._response(entry, STALE_IF_ERROR)
+        raise error
+
+    # Sync path
+
+    def _key_lock(self, key: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def fetch(self, url: str, params: Optional[Dict], send: Callable[[Dict], object]) -> Tuple[object, str]:
+        """GET through the cache; send(headers) performs the request
+
+        Returns (response, cache status). The response is the gateway's own
+        for MISS and UPDATED and a CachedResponse otherwise.
+        """
+        key = self._key(url, params)
+        entry = self._load(key)
+        if entry is not None and self._is_fresh(entry):
+            return self._response(entry, HIT)
+
+        if entry is not None and self._can_serve_stale(entry):
+            lock = self._key_lock(key)
+            # Only one background refresh per URL; others keep serving stale
+            if lock.acquire(blocking=False):
+                threading.Thread(target=self._refresh, args=(key, send, lock), daemon=True).start()
+            return self._response(entry, STALE)
+
+        with self._key_lock(key):
+            # Another thread may have refreshed the entry while we waited
+            refreshed = self._load(key)
+            if refreshed is not None and refreshed is not entry and self._is_fresh(refreshed):
+                self._count("coalesced")
+                return self._response(refreshed, HIT, count=False)
+            return self._request(key, refreshed, send)
+
+    def _request(self, key: str, entry: Optional[Dict], send: Callable[[Dict], object]):
+        requested_at = time.time()
+        try:
+            response = send(self._conditional_headers(entry))
+        except Exception as e:
+            return self._stale_on_error(key, entry, e)
+        return self._apply(key, entry, response, requested_at)
+
+    def _refresh(self, key: str, send: Callable[[Dict], object], lock: threading.Lock):
+        try:
+            self._request(key, self._load(key), send)
+        except Exception as e:
+            logger.warning(f"Background revalidation of {key} failed: {str(e)}")
+        finally:
+            lock.release()
+
+    # Async path
+
+    async def fetch_async(self, url: str, params: Optional[Dict],
+                          send: Callable[[Dict], Awaitable[object]]) -> Tuple[object, str]:
+        """Async counterpart of fetch; concurrent callers await one shared request"""
+        key = self._key(url, params)
+        entry = self._load(key)
+        if entry is not None and self._is_fresh(entry):
+            return self._response(entry, HIT)
+
+        task = self._inflight.get(key)
+        if entry is not None and self._can_serve_stale(entry):
+            if task is None:
+                self._start_async_request(key, entry, send)
+            return self._response(entry, STALE)
+
+        if task is not None:
+            self._count("coalesced")
+            response, status = await asyncio.shield(task)
+            # The caller that started the request already counted it
+            return response, status
+        return await asyncio.shield(self._start_async_request(key, entry, send))
+
+    def _start_async_request(self, key: str, entry: Optional[Dict],
+                             send: Callable[[Dict], Awaitable[object]]) -> asyncio.Task:
+        async def request():
+            requested_at = time.time()
+            try:
+                response = await send(self._conditional_headers(entry))
+            except Exception as e:
+                return self._stale_on_error(key, entry, e)
+            return self._apply(key, entry, response, requested_at)
+
+        task = asyncio.ensure_future(request())
+        self._inflight[key] = task
+        task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return task
+
+    def clear(self):
+        """Drop every cached entry from memory and disk"""
+        self._entries.clear()
+        for path in self.cache_dir.glob("*.json"):
+            path.unlink()
+
+    def get_stats(self) -> Dict:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        # Calls answered without any gateway request of their own
+        requests_saved = stats[HIT] + stats[STALE] + stats["coalesced"]
+        return {**stats, "requests_saved": requests_saved, "cached_entries": len(self._entries)}
+
+# Example usage
+if __name__ == "__main__":
+    cache = RegulationCache("data/regulation_cache", default_max_age=60, stale_while_revalidate=300)
+
+    def send(headers: Dict):
+        # Stand-in for the gateway: answers 304 whenever the client has the current ETag
+        if headers.get("If-None-Match") == '"v1"':
+            return CachedResponse(304, {"ETag": '"v1"', "Cache-Control": "max-age=60"}, b"")
+        body = json.dumps({"updates": [{"regulation_id": "GACC-2024-015"}]}).encode('utf-8')
+        return CachedResponse(200, {"ETag": '"v1"', "Cache-Control": "max-age=60",
+                                    "Last-Modified": formatdate(usegmt=True)}, body)
+
+    for _ in range(3):
+        response, status = cache.fetch("https://customs.china.gov/api/v1/regulations", {}, send)
+        print(f"{status}: {response.json()}")
+
+    print(f"Cache Stats: {json.dumps(cache.get_stats(), indent=2)}")
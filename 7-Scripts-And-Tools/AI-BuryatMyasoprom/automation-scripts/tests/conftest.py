@@ -0,0 +1,101 @@
+"""
+Shared fixtures for the automation-scripts tests
+Scripted aiohttp stand-in for the customs gateway and a client pointed at it
+"""
+
+import asyncio
+import json
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+from aiohttp import web
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from china_customs_client import ChinaCustomsClient
+
+class ScriptedGateway:
+    """Answers GET /api/v1/submissions/{id} from a queue of scripted responses
+
+    Each scripted entry is (status, headers, delay_seconds); once the queue
+    is empty every request gets 200 with an APPROVED status.
+    """
+
+    def __init__(self):
+        self.script = []
+        self.hits = 0
+        self._loop = None
+        self._runner = None
+        self._thread = None
+        self.base_url = None
+
+    def respond(self, *entries):
+        self.script.extend(entries)
+
+    async def _get_submission(self, request: web.Request) -> web.Response:
+        self.hits += 1
+        status, headers, delay = self.script.pop(0) if self.script else (200, {}, 0)
+        if delay:
+            await asyncio.sleep(delay)
+        body = {"status": "APPROVED"} if status == 200 else {"error_code": f"HTTP_{status}"}
+        return web.Response(status=status, headers=headers, text=json.dumps(body),
+                            content_type="application/json")
+
+    def start(self) -> str:
+        started = threading.Event()
+
+        async def serve():
+            app = web.Application()
+            app.router.add_get("/api/v1/submissions/{id}", self._get_submission)
+            self._runner = web.AppRunner(app)
+            await self._runner.setup()
+            site = web.TCPSite(self._runner, "127.0.0.1", 0)
+            await site.start()
+            port = site._server.sockets[0].getsockname()[1]
+            self.base_url = f"http://127.0.0.1:{port}/api/v1"
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            self._loop.run_until_complete(serve())
+            started.set()
+            self._loop.run_forever()
+            self._loop.run_until_complete(self._runner.cleanup())
+            self._loop.close()
+
+        self._thread = threading.Thread(target=run, name="scripted-gateway", daemon=True)
+        self._thread.start()
+        started.wait()
+        return self.base_url
+
+    def stop(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+@pytest.fixture
+def gateway():
+    stub = ScriptedGateway()
+    stub.start()
+    yield stub
+    stub.stop()
+
+@pytest.fixture
+def make_client(gateway, tmp_path):
+    """Build a ChinaCustomsClient against the stub; keyword overrides go into the config sections"""
+
+    def build(api=None, resilience=None):
+        config = {
+            "api": {"base_url": gateway.base_url, "timeout": 5, "retry_attempts": 3, "retry_delay": 0.01},
+            "resilience": {"max_retry_delay": 0.05, "circuit_failure_threshold": 5, "circuit_reset_timeout": 30},
+            "rate_limits": {"enabled": False},
+            "regulation_cache": {"enabled": False},
+            "authentication": {"signature_required": False}
+        }
+        config["api"].update(api or {})
+        config["resilience"].update(resilience or {})
+        config_path = tmp_path / "customs_config.json"
+        config_path.write_text(json.dumps(config), encoding="utf-8")
+        return ChinaCustomsClient(str(config_path))
+
+    return build
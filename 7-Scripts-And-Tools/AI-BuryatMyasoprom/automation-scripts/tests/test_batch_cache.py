@@ -0,0 +1,53 @@
+"""
+Tests for the BatchTracker read-through cache
+"""
+
+import json
+from datetime import datetime
+
+import pytest
+
+import batch_tracker
+from batch_tracker import SCAN_RECENT_EVENTS, BatchTracker
+
+@pytest.fixture
+def tracker(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # create_batch writes QR codes relative to the cwd
+    return BatchTracker(str(tmp_path / "batches.db"), cache_size=64)
+
+@pytest.fixture
+def batch_id(tracker):
+    return tracker.create_batch({
+        "product_type": "BEEF", "production_date": "2024-01-15", "quantity_kg": 100,
+        "origin_farm": "Buryat Farm 001", "quality_grade": "A"
+    }, generate_qr=False)["batch_id"]
+
+@pytest.mark.parametrize("events", [1, 250])
+def test_mutating_a_result_does_not_change_the_cache(tracker, batch_id, events):
+    for _ in range(events):
+        tracker.record_batch_event(batch_id, {
+            "event_type": "QUALITY_CHECK", "location": "Ulan-Ude", "quality_metrics": {"ph": 5.8, "tests": ["E.coli"]}
+        })
+
+    for result in (tracker.get_batch_info(batch_id), tracker.get_batch_info(batch_id)):
+        result["events"][0]["quality_metrics"]["ph"] = 99
+        result["events"][0]["quality_metrics"]["tests"].append("tampered")
+
+    assert tracker.get_batch_info(batch_id)["events"][0]["quality_metrics"] == {"ph": 5.8, "tests": ["E.coli"]}
+
+def test_repeat_scans_of_a_long_history_skip_the_database(tracker, batch_id, monkeypatch):
+    reading = {"event_type": "TEMPERATURE_CHECK", "location": "Ulan-Ude", "temperature": -18}
+    tracker._record_events_bulk([(batch_id, reading, datetime.now()) for _ in range(300)])
+    qr_data = json.dumps({"batch_id": batch_id})
+    first = tracker.scan_batch_qr(qr_data)
+
+    def no_database(*args, **kwargs):
+        raise AssertionError("repeat scan opened a database connection")
+
+    monkeypatch.setattr(batch_tracker.sqlite3, "connect", no_database)
+    scans = [tracker.scan_batch_qr(qr_data) for _ in range(100)]
+
+    assert all(scan == first for scan in scans)
+    assert first["event_count"] == SCAN_RECENT_EVENTS
+    assert first["total_event_count"] == 301
+    assert first["events_truncated"] is True
@@ -0,0 +1,66 @@
+"""
+Tests for BatchExporter incremental exports
+"""
+
+import csv
+import gzip
+from datetime import datetime
+
+import pytest
+
+from batch_exporter import BatchExporter
+from batch_tracker import BatchTracker
+
+@pytest.fixture
+def tracker(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # create_batch writes QR codes relative to the cwd
+    return BatchTracker(str(tmp_path / "batches.db"))
+
+@pytest.fixture
+def batch_id(tracker):
+    return tracker.create_batch({
+        "product_type": "BEEF", "production_date": "2024-01-15", "quantity_kg": 100,
+        "origin_farm": "Buryat Farm 001", "quality_grade": "A"
+    }, generate_qr=False)["batch_id"]
+
+def _exported_locations(result):
+    locations = []
+    for part in result["files"]:
+        if "/batches/" not in part["path"]:
+            continue
+        with gzip.open(part["path"], "rt", newline="", encoding="utf-8") as f:
+            locations.extend(row["current_location"] for row in csv.DictReader(f))
+    return locations
+
+def test_incremental_export_picks_up_location_only_change(tracker, batch_id, tmp_path):
+    exporter = BatchExporter(tracker.db_path, str(tmp_path / "exports"))
+    first = exporter.export(incremental=True)
+    assert first["batch_rows"] == 1
+
+    tracker.record_batch_event(batch_id, {"event_type": "TEMPERATURE_CHECK", "location": "Kyakhta", "temperature": -18})
+    second = exporter.export(incremental=True)
+
+    assert second["event_rows"] == 1
+    assert second["batch_rows"] == 1
+    assert _exported_locations(second) == ["Kyakhta"]
+
+def test_incremental_export_with_no_changes_exports_nothing(tracker, batch_id, tmp_path):
+    exporter = BatchExporter(tracker.db_path, str(tmp_path / "exports"))
+    exporter.export(incremental=True)
+
+    result = exporter.export(incremental=True)
+
+    assert result["event_rows"] == 0
+    assert result["batch_rows"] == 0
+
+def test_buffered_event_recorded_before_the_last_export_is_exported(tracker, batch_id, tmp_path):
+    exporter = BatchExporter(tracker.db_path, str(tmp_path / "exports"))
+    recorded_at = datetime.now()  # queued before the export, committed after it
+    exporter.export(incremental=True)
+
+    event = {"event_type": "SHIPMENT", "location": "Zabaykalsk", "temperature": -18}
+    assert tracker._record_events_bulk([(batch_id, event, recorded_at)])[0]["success"] is True
+    result = exporter.export(incremental=True)
+
+    assert result["batch_rows"] == 1
+    assert _exported_locations(result) == ["Zabaykalsk"]
@@ -0,0 +1,79 @@
+"""
+Tests for BufferedEventWriter failure handling
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from batch_tracker import BatchTracker, BufferedEventWriter
+
+EVENT = {"event_type": "TEMPERATURE_CHECK", "location": "Ulan-Ude", "temperature": -18}
+
+@pytest.fixture
+def tracker(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # create_batch writes QR codes relative to the cwd
+    return BatchTracker(str(tmp_path / "batches.db"))
+
+@pytest.fixture
+def batch_id(tracker):
+    return tracker.create_batch({
+        "product_type": "BEEF", "production_date": "2024-01-15", "quantity_kg": 100,
+        "origin_farm": "Buryat Farm 001", "quality_grade": "A"
+    })["batch_id"]
+
+def _break_bulk_writes(monkeypatch, tracker):
+    def broken(entries):
+        raise MemoryError("out of memory")
+    monkeypatch.setattr(tracker, "_record_events_bulk", broken)
+
+@pytest.mark.parametrize("executor", [None, "thread"])
+def test_write_error_fails_futures_and_keeps_writer_alive(tracker, batch_id, monkeypatch, executor):
+    commit_executor = ThreadPoolExecutor(1) if executor else None
+    writer = BufferedEventWriter(tracker, flush_interval_ms=10, commit_executor=commit_executor)
+    _break_bulk_writes(monkeypatch, tracker)
+
+    event = writer.submit(batch_id, EVENT)
+    flush = writer.flush()
+    with pytest.raises(MemoryError):
+        event.result(timeout=5)
+    with pytest.raises(MemoryError):
+        flush.result(timeout=5)
+
+    monkeypatch.undo()
+    assert writer.submit(batch_id, EVENT).result(timeout=5)["success"] is True
+
+    stats = writer.get_stats()
+    assert stats["queue_depth"] == 0
+    assert stats["events_failed"] == 1
+    assert stats["events_written"] == 1
+    writer.close()
+    if commit_executor:
+        commit_executor.shutdown()
+
+def test_cancelled_future_does_not_stop_the_writer(tracker, batch_id):
+    writer = BufferedEventWriter(tracker, flush_interval_ms=50)
+
+    writer.submit(batch_id, EVENT).cancel()
+    result = writer.submit(batch_id, EVENT).result(timeout=5)
+
+    assert result["success"] is True
+    assert writer.get_stats()["events_written"] == 2
+    writer.close()
+
+def test_malformed_event_fails_alone(tracker, batch_id):
+    writer = BufferedEventWriter(tracker, flush_interval_ms=50)
+
+    first = writer.submit(batch_id, EVENT)
+    malformed = writer.submit(batch_id, {"event_type": "TEMPERATURE_CHECK", "temperature": -18})
+    second = writer.submit(batch_id, EVENT)
+    writer.flush().result(timeout=5)
+
+    assert first.result()["success"] is True
+    assert second.result()["success"] is True
+    assert malformed.result()["success"] is False
+    assert "location" in malformed.result()["error"]
+    stats = writer.get_stats()
+    assert stats["events_written"] == 2
+    assert stats["events_failed"] == 1
+    writer.close()
@@ -0,0 +1,177 @@
+"""
+Tests for ChinaCustomsClient retries, Retry-After handling and the gateway circuit breaker
+"""
+
+import asyncio
+import random
+import time
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import china_customs_client
+from customs_resilience import CircuitBreaker, CircuitOpenError, RetryPolicy, retry_after_seconds
+
+def _record_sleeps(monkeypatch):
+    """Replace the client's blocking sleep with a recorder"""
+    delays = []
+    monkeypatch.setattr(china_customs_client.time, "sleep", delays.append)
+    return delays
+
+def _open_then_half_open(client):
+    breaker = client.circuit_breaker
+    breaker.reset_timeout = 0.05
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+# RetryPolicy and Retry-After
+
+def test_backoff_is_full_jitter_under_capped_ceiling():
+    policy = RetryPolicy(base_delay=1.0, max_delay=8.0, multiplier=2.0, rng=random.Random(7))
+
+    for attempt, ceiling in ((0, 1.0), (1, 2.0), (2, 4.0), (3, 8.0), (6, 8.0)):
+        delays = [policy.backoff_delay(attempt) for _ in range(200)]
+        assert all(0.0 <= delay <= ceiling for delay in delays)
+        # Spread across the whole range rather than clustered at the ceiling
+        assert min(delays) < ceiling * 0.1
+        assert max(delays) > ceiling * 0.9
+
+def test_retry_after_accepts_delta_and_http_date():
+    assert retry_after_seconds({"Retry-After": "7"}) == 7.0
+    assert retry_after_seconds({"retry-after": "2.5"}) == 2.5
+    assert retry_after_seconds({"Retry-After": "-3"}) == 0.0
+    assert retry_after_seconds({"Retry-After": "soon"}) is None
+    assert retry_after_seconds({}) is None
+
+    retry_at = datetime.now(timezone.utc) + timedelta(seconds=30)
+    delay = retry_after_seconds({"Retry-After": format_datetime(retry_at, usegmt=True)})
+    assert 28.0 <= delay <= 30.0
+
+def test_delay_for_prefers_retry_after_and_caps_it():
+    policy = RetryPolicy(base_delay=1.0, max_delay=10.0, rng=random.Random(1))
+
+    assert policy.delay_for(0, 429, {"Retry-After": "4"}) == 4.0
+    assert policy.delay_for(0, 503, {"Retry-After": "600"}) == 10.0
+    # Retry-After on other statuses is ignored in favour of backoff
+    assert policy.delay_for(0, 500, {"Retry-After": "4"}) <= 1.0
+
+# Client retries against the stub gateway
+
+def test_retries_server_errors_then_succeeds(gateway, make_client, monkeypatch):
+    delays = _record_sleeps(monkeypatch)
+    gateway.respond((503, {}, 0), (502, {}, 0))
+    client = make_client()
+
+    result = client.check_submission_status("SUB-1")
+
+    assert result["success"] is True
+    assert result["status"] == "APPROVED"
+    assert gateway.hits == 3
+    assert len(delays) == 2
+    assert client.metrics.get_stats()["endpoints"]["GET /submissions/{id}"]["retries"] == 2
+
+def test_retry_after_header_sets_the_delay(gateway, make_client, monkeypatch):
+    delays = _record_sleeps(monkeypatch)
+    gateway.respond((429, {"Retry-After": "3"}, 0))
+    client = make_client(resilience={"max_retry_delay": 60})
+
+    result = client.check_submission_status("SUB-1")
+
+    assert result["success"] is True
+    assert delays == [3.0]
+
+def test_gives_up_after_max_retries(gateway, make_client, monkeypatch):
+    _record_sleeps(monkeypatch)
+    gateway.respond(*[(503, {}, 0)] * 10)
+    client = make_client(api={"retry_attempts": 2})
+
+    result = client.check_submission_status("SUB-1")
+
+    assert result["success"] is False
+    assert "503" in result["error"]
+    assert gateway.hits == 3
+
+def test_async_retries_server_errors_then_succeeds(gateway, make_client):
+    gateway.respond((503, {}, 0))
+    client = make_client()
+
+    async def check():
+        async with client:
+            return await client.check_submission_status_async("SUB-1")
+
+    result = asyncio.run(check())
+
+    assert result["success"] is True
+    assert gateway.hits == 2
+
+# Circuit breaker
+
+def test_breaker_opens_and_fails_fast(gateway, make_client):
+    gateway.respond(*[(500, {}, 0)] * 10)
+    client = make_client(api={"retry_attempts": 0}, resilience={"circuit_failure_threshold": 2})
+
+    client.check_submission_status("SUB-1")
+    client.check_submission_status("SUB-1")
+    result = client.check_submission_status("SUB-1")
+
+    assert result["success"] is False
+    assert "is open" in result["error"]
+    assert gateway.hits == 2
+    assert client.circuit_breaker.get_stats()["rejected"] == 1
+
+def test_half_open_probe_success_closes_the_circuit(gateway, make_client):
+    client = make_client()
+    _open_then_half_open(client)
+
+    result = client.check_submission_status("SUB-1")
+
+    assert result["success"] is True
+    assert client.circuit_breaker.state == CircuitBreaker.CLOSED
+
+def test_cancelled_half_open_probe_releases_its_slot(gateway, make_client):
+    gateway.respond((200, {}, 1.0))
+    client = make_client()
+    _open_then_half_open(client)
+
+    async def cancel_then_retry():
+        async with client:
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(client.check_submission_status_async("SUB-1"), timeout=0.1)
+            return await client.check_submission_status_async("SUB-1")
+
+    result = asyncio.run(cancel_then_retry())
+
+    assert result["success"] is True
+    assert client.circuit_breaker.state == CircuitBreaker.CLOSED
+
+def test_rate_limiter_failure_releases_half_open_slot(gateway, make_client, monkeypatch):
+    client = make_client()
+    _open_then_half_open(client)
+
+    def broken_acquire(endpoint):
+        raise RuntimeError("rate limit store unavailable")
+
+    monkeypatch.setattr(client.rate_limiter, "acquire", broken_acquire)
+    assert client.check_submission_status("SUB-1")["success"] is False
+    monkeypatch.undo()
+
+    result = client.check_submission_status("SUB-1")
+
+    assert result["success"] is True
+    assert gateway.hits == 1
+
+def test_unanswered_probe_slot_is_reclaimed_after_reset_timeout():
+    breaker = CircuitBreaker("gateway", failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+
+    breaker.before_call()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    time.sleep(0.06)
+    breaker.before_call()
+    assert breaker.get_stats()["probes_reclaimed"] == 1